@@ -3,4 +3,8 @@ from django.apps import AppConfig
 
 class LinebotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'linebot'
\ No newline at end of file
+    name = 'linebot_core'
+
+    def ready(self):
+        # Register queue metrics with the project-wide collector
+        from . import event_queue  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""
+Async LINE Messaging API client with pooled keep-alive connections.
+
+One ``aiohttp.ClientSession`` is created per event loop and shared by every
+coroutine on that loop, so requests reuse open TLS connections instead of
+paying a handshake per message.
+"""
+
+import asyncio
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from linebot import AsyncLineBotApi
+from linebot.aiohttp_async_http_client import AiohttpAsyncHttpClient
+
+_clients = weakref.WeakKeyDictionary()
+
+# ORM work from the async path runs here instead of Django's single
+# thread-sensitive executor, so handlers for different users run in parallel.
+_orm_executor = ThreadPoolExecutor(
+    max_workers=settings.LINE_ASYNC_ORM_THREADS,
+    thread_name_prefix='line-orm'
+)
+
+
+def get_async_line_bot_api():
+    """Return the AsyncLineBotApi bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+
+    if client is None:
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=settings.LINE_ASYNC_POOL_SIZE,
+                keepalive_timeout=settings.LINE_ASYNC_KEEPALIVE
+            )
+        )
+        api = AsyncLineBotApi(
+            settings.LINE_CHANNEL_ACCESS_TOKEN,
+            AiohttpAsyncHttpClient(
+                session,
+                timeout=aiohttp.ClientTimeout(total=settings.LINE_ASYNC_TIMEOUT)
+            )
+        )
+        client = _clients[loop] = (api, session)
+
+    return client[0]
+
+
+async def close_async_line_bot_api():
+    """Close the pooled session of the running event loop, if any."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client[1].close()
+
+
+def _run_orm(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_orm(func, *args, **kwargs):
+    """Run blocking ORM code from async code on the shared ORM thread pool."""
+    return await sync_to_async(
+        _run_orm, thread_sensitive=False, executor=_orm_executor
+    )(func, *args, **kwargs)
@@ -0,0 +1,350 @@
+"""
+Durable queue for LINE webhook events.
+
+The webhook view only verifies the signature and stores the raw events, so
+LINE gets its 200 response in milliseconds. A ``WorkerPool`` started by the
+``run_webhook_workers`` management command drains the queue afterwards.
+Events are sharded across worker threads by LINE user ID, which keeps every
+user's events in the order they were received. ``claim_events`` never claims
+an event while an earlier one from the same user is unfinished elsewhere, and
+a failed event defers the user's later events in its batch, so the order also
+holds across retries and across several ``run_webhook_workers`` processes.
+
+``AsyncWorkerPool`` does the same on a single event loop with the async LINE
+client, keeping hundreds of conversations in flight from one process.
+"""
+
+import asyncio
+
+import json
+import logging
+import queue
+import threading
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F, Min
+from django.utils import timezone
+
+from meowtask import metrics
+from users import user_cache
+from .async_client import run_orm
+from .idempotency import drop_duplicates, event_id_of, remember
+from .line_bot_handler import process_event, process_event_async, verify_signature
+from .models import WebhookEvent
+
+logger = logging.getLogger(__name__)
+
+counters = metrics.Counters('enqueued', 'processed', 'retried', 'failed', 'deferred')
+
+# Events that a user's later events must wait for
+UNFINISHED = (WebhookEvent.EventStatus.PENDING, WebhookEvent.EventStatus.PROCESSING)
+
+
+def enqueue_webhook(request_body, signature):
+    """
+    Verify the signature and store every new event in the webhook body.
+
+    Redelivered events that were already received are dropped here, before
+    any handler work. Returns False if the signature is invalid or the body
+    is malformed.
+    """
+    if not verify_signature(request_body, signature):
+        logger.error("Invalid signature")
+        return False
+
+    try:
+        events = json.loads(request_body).get('events', [])
+    except (ValueError, AttributeError):
+        logger.error("Malformed webhook body")
+        return False
+
+    events = drop_duplicates(events)
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(
+            webhook_event_id=event_id_of(event),
+            source_id=(event.get('source') or {}).get('userId', ''),
+            payload=event
+        )
+        for event in events
+    ], ignore_conflicts=True)
+    remember(events)
+    counters.incr('enqueued', len(events))
+    return True
+
+
+def claim_events(limit):
+    """
+    Lock and claim up to ``limit`` pending events, oldest first.
+
+    An event is left in the queue while an earlier event from the same user
+    is unfinished outside this claim: still being processed by another
+    worker or process, or waiting for its retry. Each user's events thus run
+    in order however many ``run_webhook_workers`` processes share the queue.
+    """
+    with transaction.atomic():
+        candidates = list(
+            WebhookEvent.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=WebhookEvent.EventStatus.PENDING)
+            .order_by('id')
+            .values_list('id', 'source_id')[:limit]
+        )
+        if not candidates:
+            return []
+
+        # The oldest unfinished event of each user that this claim does not hold
+        blockers = dict(
+            WebhookEvent.objects
+            .filter(
+                source_id__in={source_id for _, source_id in candidates if source_id},
+                status__in=UNFINISHED
+            )
+            .exclude(id__in=[event_id for event_id, _ in candidates])
+            .values('source_id')
+            .annotate(first=Min('id'))
+            .values_list('source_id', 'first')
+            .order_by()
+        )
+        event_ids = [
+            event_id for event_id, source_id in candidates
+            if source_id not in blockers or event_id < blockers[source_id]
+        ]
+        if not event_ids:
+            return []
+
+        WebhookEvent.objects.filter(id__in=event_ids).update(
+            status=WebhookEvent.EventStatus.PROCESSING,
+            claimed_at=timezone.now(),
+            attempts=F('attempts') + 1
+        )
+
+    return list(WebhookEvent.objects.filter(id__in=event_ids).order_by('id'))
+
+
+def run_event(event, identities=None):
+    """
+    Process one claimed event, marking it done on success or scheduling a retry.
+
+    ``identities`` is the user identity map shared by the event's batch.
+    """
+    try:
+        with user_cache.identity_map(identities):
+            process_event(event.payload)
+    except Exception as e:
+        logger.exception(f"Error processing webhook event {event.id}")
+        _mark_failed(event, e)
+        return False
+
+    _mark_done(event)
+    return True
+
+
+async def arun_event(event, identities=None):
+    """Async counterpart of ``run_event``."""
+    try:
+        # The map reaches the ORM thread pool with the copied context
+        with user_cache.identity_map(identities):
+            await process_event_async(event.payload)
+    except Exception as e:
+        logger.exception(f"Error processing webhook event {event.id}")
+        await run_orm(_mark_failed, event, e)
+        return False
+
+    await run_orm(_mark_done, event)
+    return True
+
+
+def defer_event(event):
+    """Return a claimed event to the queue unprocessed, without using up an attempt."""
+    WebhookEvent.objects.filter(id=event.id).update(
+        status=WebhookEvent.EventStatus.PENDING,
+        attempts=F('attempts') - 1
+    )
+    counters.incr('deferred')
+
+
+def _mark_done(event):
+    # Kept until purged so redeliveries of this event can be recognised
+    WebhookEvent.objects.filter(id=event.id).update(status=WebhookEvent.EventStatus.DONE)
+    counters.incr('processed')
+
+
+def _mark_failed(event, error):
+    if event.attempts >= settings.LINE_WEBHOOK_MAX_ATTEMPTS:
+        new_status = WebhookEvent.EventStatus.FAILED
+        counters.incr('failed')
+    else:
+        new_status = WebhookEvent.EventStatus.PENDING
+        counters.incr('retried')
+
+    WebhookEvent.objects.filter(id=event.id).update(
+        status=new_status,
+        last_error=str(error)
+    )
+
+
+def has_pending_events():
+    return WebhookEvent.objects.filter(status=WebhookEvent.EventStatus.PENDING).exists()
+
+
+def release_stale_claims():
+    """Return events claimed by a worker that died mid-batch to the queue."""
+    cutoff = timezone.now() - timedelta(seconds=settings.LINE_WEBHOOK_CLAIM_TIMEOUT)
+    return WebhookEvent.objects.filter(
+        status=WebhookEvent.EventStatus.PROCESSING,
+        claimed_at__lt=cutoff
+    ).update(status=WebhookEvent.EventStatus.PENDING)
+
+
+def queue_stats():
+    """Return queue depth, lag and processing counters."""
+    pending = WebhookEvent.objects.filter(status=WebhookEvent.EventStatus.PENDING)
+    oldest = pending.aggregate(oldest=Min('received_at'))['oldest']
+    lag = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+
+    return {
+        'depth': pending.count(),
+        'processing': WebhookEvent.objects.filter(
+            status=WebhookEvent.EventStatus.PROCESSING
+        ).count(),
+        'failed': WebhookEvent.objects.filter(
+            status=WebhookEvent.EventStatus.FAILED
+        ).count(),
+        'lag_seconds': round(lag, 3),
+        **counters.snapshot(),
+    }
+
+
+metrics.register('webhook_queue', queue_stats)
+
+
+class WorkerPool:
+    """
+    A pool of worker threads draining claimed webhook events.
+
+    Each LINE user is pinned to one worker by a stable hash of their user ID,
+    so events from the same user are always processed one at a time and in
+    order. The per-worker queues are bounded, which makes ``dispatch`` block
+    instead of claiming more events than the workers can handle.
+
+    Each dispatched batch shares one user identity map, so a user with
+    several events in it is loaded once. Users are pinned to one worker, so
+    no two threads ever use the same user instance.
+
+    Once one of a user's events fails, the user's later events in the batch
+    are deferred back to the queue instead of run, so they cannot overtake
+    the retry.
+    """
+
+    def __init__(self, workers=None, backlog=None):
+        self.workers = workers or settings.LINE_WEBHOOK_WORKERS
+        backlog = backlog or settings.LINE_WEBHOOK_BATCH_SIZE
+        self._queues = [queue.Queue(maxsize=backlog) for _ in range(self.workers)]
+        self._threads = []
+
+    def start(self):
+        for index, work_queue in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._work,
+                args=(work_queue,),
+                name=f"webhook-worker-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def dispatch(self, events):
+        identities = user_cache.IdentityMap()
+        halted = set()
+        for event in events:
+            self._queues[self.shard(event.source_id)].put((event, identities, halted))
+
+    def shard(self, source_id):
+        return zlib.crc32(source_id.encode('utf-8')) % self.workers
+
+    def wait(self):
+        """Block until every dispatched event has been processed."""
+        for work_queue in self._queues:
+            work_queue.join()
+
+    def stop(self):
+        """Finish every dispatched event, then stop the workers."""
+        for work_queue in self._queues:
+            work_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self, work_queue):
+        try:
+            while True:
+                item = work_queue.get()
+                if item is None:
+                    return
+                event, identities, halted = item
+                try:
+                    close_old_connections()
+                    if event.source_id and event.source_id in halted:
+                        defer_event(event)
+                    elif not run_event(event, identities) and event.source_id:
+                        halted.add(event.source_id)
+                finally:
+                    work_queue.task_done()
+        finally:
+            connections.close_all()
+
+
+class AsyncWorkerPool:
+    """
+    Process claimed events as coroutines on the running event loop.
+
+    Each user's events are chained, so one only starts when the previous
+    one finished, while a semaphore caps how many run at once overall.
+    Like ``WorkerPool``, each batch shares one user identity map, and a
+    failed event defers the user's later events in the batch.
+    """
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or settings.LINE_ASYNC_CONCURRENCY
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._tails = {}
+        self._in_flight = set()
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    def dispatch(self, events):
+        identities = user_cache.IdentityMap()
+        halted = set()
+        for event in events:
+            previous = self._tails.get(event.source_id)
+            task = asyncio.ensure_future(self._run(event, previous, identities, halted))
+            self._tails[event.source_id] = task
+            self._in_flight.add(task)
+            task.add_done_callback(self._finished(event.source_id))
+
+    async def wait(self):
+        """Wait until every dispatched event has been processed."""
+        while self._in_flight:
+            await asyncio.wait(list(self._in_flight))
+
+    async def _run(self, event, previous, identities, halted):
+        if previous is not None:
+            await asyncio.wait([previous])
+        if event.source_id and event.source_id in halted:
+            await run_orm(defer_event, event)
+            return
+        async with self._semaphore:
+            if not await arun_event(event, identities) and event.source_id:
+                halted.add(event.source_id)
+
+    def _finished(self, source_id):
+        def callback(task):
+            self._in_flight.discard(task)
+            if self._tails.get(source_id) is task:
+                del self._tails[source_id]
+        return callback
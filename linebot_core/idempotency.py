@@ -0,0 +1,129 @@
+"""
+Redelivery de-duplication for LINE webhook events.
+
+Every LINE event carries a unique ``webhookEventId``. It is stored on the
+``WebhookEvent`` row under a unique constraint, and processed rows are kept
+as DONE for ``LINE_WEBHOOK_DEDUP_TTL`` seconds, so the queue table itself is
+the durable record of which events were already received.
+
+Duplicates are dropped before they reach the queue:
+
+1. A bounded in-memory LRU of recently seen IDs catches most of them
+   without touching the database.
+2. Only events LINE flags as redeliveries (``deliveryContext.isRedelivery``)
+   are looked up in the table, so first deliveries, the common case, cost
+   no extra query.
+3. The unique constraint catches anything that races past both checks.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from meowtask import metrics
+from .models import WebhookEvent
+
+counters = metrics.Counters('accepted', 'suppressed_memory', 'suppressed_db', 'purged')
+
+
+class SeenEvents:
+    """Bounded LRU set of recently seen webhook event IDs."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._ids = OrderedDict()
+
+    def __contains__(self, event_id):
+        with self._lock:
+            if event_id in self._ids:
+                self._ids.move_to_end(event_id)
+                return True
+            return False
+
+    def add(self, event_id):
+        with self._lock:
+            self._ids[event_id] = None
+            self._ids.move_to_end(event_id)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+    def __len__(self):
+        return len(self._ids)
+
+
+seen_events = SeenEvents(settings.LINE_WEBHOOK_DEDUP_CACHE_SIZE)
+
+
+def event_id_of(event):
+    return event.get('webhookEventId') or None
+
+
+def drop_duplicates(events):
+    """
+    Return the events of a webhook body that have not been received before,
+    in their original order.
+    """
+    candidates = []
+    redelivered = []
+    batch_ids = set()
+
+    for event in events:
+        event_id = event_id_of(event)
+        if event_id is not None:
+            if event_id in batch_ids or event_id in seen_events:
+                counters.incr('suppressed_memory')
+                continue
+            batch_ids.add(event_id)
+            if (event.get('deliveryContext') or {}).get('isRedelivery'):
+                redelivered.append(event_id)
+        candidates.append(event)
+
+    known = set()
+    if redelivered:
+        known = set(
+            WebhookEvent.objects
+            .filter(webhook_event_id__in=redelivered)
+            .values_list('webhook_event_id', flat=True)
+        )
+        for event_id in known:
+            seen_events.add(event_id)
+        counters.incr('suppressed_db', len(known))
+
+    # Known duplicates are dropped in place, so per-user order is kept
+    fresh = [event for event in candidates if event_id_of(event) not in known]
+    counters.incr('accepted', len(fresh))
+    return fresh
+
+
+def remember(events):
+    """Record stored events in the in-memory front."""
+    for event in events:
+        event_id = event_id_of(event)
+        if event_id is not None:
+            seen_events.add(event_id)
+
+
+def purge_processed_events():
+    """Delete DONE events older than ``LINE_WEBHOOK_DEDUP_TTL``."""
+    cutoff = timezone.now() - timedelta(seconds=settings.LINE_WEBHOOK_DEDUP_TTL)
+    purged, _ = WebhookEvent.objects.filter(
+        status=WebhookEvent.EventStatus.DONE,
+        received_at__lt=cutoff
+    ).delete()
+    counters.incr('purged', purged)
+    return purged
+
+
+def dedup_stats():
+    return {**counters.snapshot(), 'memory_size': len(seen_events)}
+
+
+metrics.register('webhook_dedup', dedup_stats)
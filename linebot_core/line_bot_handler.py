@@ -1,37 +1,86 @@
 import json
 import logging
-from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError, LineBotApiError
+from linebot import LineBotApi
+from linebot.exceptions import LineBotApiError
 from linebot.models import (
     MessageEvent, TextMessage, TextSendMessage, 
-    TemplateSendMessage, ButtonsTemplate, PostbackAction,
-    PostbackEvent, FlexSendMessage
+    TemplateSendMessage, ButtonsTemplate, CarouselTemplate, CarouselColumn,
+    PostbackAction, PostbackEvent, FlexSendMessage
 )
+from linebot.webhook import SignatureValidator
 from django.conf import settings
+from users import exp_buffer, user_cache
 from users.models import User
-from tasks.models import Task
-from django.utils import timezone
+from tasks import feed_cache
+from tasks.models import TakeResult, Task, TimelineEntry
+
+from .async_client import get_async_line_bot_api, run_orm
+from .messaging import MessageBatch, deferred_sending
+from .notifications import notify_task_completed, notify_task_taken
+from .profile_cache import ProfileCache, build_backend
 
 logger = logging.getLogger(__name__)
 
+POSTED_STATUS_EMOJI = {
+    Task.TaskStatus.OPEN: "🆕",
+    Task.TaskStatus.TAKEN: "🔄",
+    Task.TaskStatus.DONE: "✅",
+    Task.TaskStatus.EXPIRED: "⌛",
+}
+
 line_bot_api = LineBotApi(settings.LINE_CHANNEL_ACCESS_TOKEN)
-handler = WebhookHandler(settings.LINE_CHANNEL_SECRET)
+signature_validator = SignatureValidator(settings.LINE_CHANNEL_SECRET)
+profile_cache = ProfileCache(
+    fetch=lambda user_id: line_bot_api.get_profile(user_id),
+    backend=build_backend(),
+    ttl=settings.LINE_PROFILE_CACHE_TTL,
+    refresh_after=settings.LINE_PROFILE_CACHE_REFRESH_AFTER
+)
 
 
-def handle_webhook(request_body, signature):
-    """Handle LINE webhook events."""
-    try:
-        handler.handle(request_body, signature)
-        return True
-    except InvalidSignatureError:
-        logger.error("Invalid signature")
-        return False
-    except Exception as e:
-        logger.error(f"Error handling webhook: {str(e)}")
-        return False
+def verify_signature(request_body, signature):
+    """Check the X-Line-Signature header against the request body."""
+    return signature_validator.validate(request_body, signature)
+
+
+def reply(command, reply_token, *messages, user_id=None):
+    """Send a command's messages in one reply, pushing only what does not fit."""
+    MessageBatch(command, reply_token, user_id=user_id).add(*messages).send(line_bot_api)
+
+
+def process_event(event_json):
+    """Dispatch a single raw webhook event to the matching handler."""
+    event_type = event_json.get('type')
+    
+    if event_type == 'message' and event_json.get('message', {}).get('type') == 'text':
+        handle_text_message(MessageEvent.new_from_json_dict(event_json))
+    elif event_type == 'postback':
+        handle_postback(PostbackEvent.new_from_json_dict(event_json))
+    else:
+        logger.info(f"Ignoring unsupported event type: {event_type}")
+
+
+async def process_event_async(event_json):
+    """
+    Async counterpart of ``process_event``.
+    
+    The profile is fetched with the pooled async client, the handler runs on
+    the ORM thread pool with its replies deferred, and the collected replies
+    are then sent with the async client.
+    """
+    api = get_async_line_bot_api()
+    user_id = (event_json.get('source') or {}).get('userId')
+    
+    if user_id and event_json.get('type') == 'message':
+        await profile_cache.awarm(user_id, api.get_profile)
+    
+    with deferred_sending() as outbox:
+        await run_orm(process_event, event_json)
+    
+    for batch in outbox:
+        await batch.asend(api)
 
 
-@handler.add(MessageEvent, message=TextMessage)
 def handle_text_message(event):
     """Handle text messages from users."""
     user_id = event.source.user_id
@@ -39,20 +88,29 @@ def handle_text_message(event):
     
     # Get or create user
     try:
-        profile = line_bot_api.get_profile(user_id)
-        user, created = User.objects.get_or_create(
-            line_id=user_id,
-            defaults={
-                'display_name': profile.display_name,
-                'picture_url': profile.picture_url
-            }
-        )
+        profile = profile_cache.get(user_id)
+        try:
+            user, created = user_cache.get_by_line_id(user_id), False
+        except User.DoesNotExist:
+            user, created = User.objects.get_or_create(
+                line_id=user_id,
+                defaults={
+                    'display_name': profile.display_name,
+                    'picture_url': profile.picture_url
+                }
+            )
+            user_cache.remember(user)
         
-        # Update profile if not created
+        # Update profile if not created, writing only the fields that changed
         if not created:
-            user.display_name = profile.display_name
-            user.picture_url = profile.picture_url
-            user.save()
+            changed_fields = [
+                field for field in ('display_name', 'picture_url')
+                if getattr(user, field) != getattr(profile, field)
+            ]
+            if changed_fields:
+                for field in changed_fields:
+                    setattr(user, field, getattr(profile, field))
+                user.save(update_fields=changed_fields)
     except LineBotApiError as e:
         logger.error(f"LINE API error: {str(e)}")
         return
@@ -70,20 +128,20 @@ def handle_text_message(event):
         handle_post_command(event.reply_token, user, text[5:].strip())
     else:
         # Default response
-        line_bot_api.reply_message(
+        reply(
+            'unknown',
             event.reply_token,
             TextSendMessage(text="I didn't understand that. Type 'help' to see available commands.")
         )
 
 
-@handler.add(PostbackEvent)
 def handle_postback(event):
     """Handle postback events from interactive messages."""
     user_id = event.source.user_id
     data = event.postback.data
     
     try:
-        user = User.objects.get(line_id=user_id)
+        user = user_cache.get_by_line_id(user_id)
     except User.DoesNotExist:
         logger.error(f"User not found: {user_id}")
         return
@@ -117,7 +175,8 @@ def show_help(reply_token):
         "• post: [title] - Start posting a new task\n\n"
         "Let's help each other! 😺"
     )
-    line_bot_api.reply_message(
+    reply(
+        'help',
         reply_token,
         TextSendMessage(text=help_text)
     )
@@ -125,6 +184,7 @@ def show_help(reply_token):
 
 def show_profile(reply_token, user):
     """Show user profile with level and experience."""
+    user = exp_buffer.overlaid(user)
     next_level_exp = user.level * 100
     exp_percentage = int((user.exp / next_level_exp) * 100) if next_level_exp > 0 else 0
     
@@ -136,7 +196,8 @@ def show_profile(reply_token, user):
         f"Keep helping others to level up! 🌟"
     )
     
-    line_bot_api.reply_message(
+    reply(
+        'profile',
         reply_token,
         TextSendMessage(text=profile_text)
     )
@@ -144,69 +205,76 @@ def show_profile(reply_token, user):
 
 def show_available_tasks(reply_token):
     """Show list of available tasks."""
-    tasks = Task.objects.filter(
-        status=Task.TaskStatus.OPEN,
-        time__gte=timezone.now()
-    ).order_by('time')[:5]  # Limit to 5 tasks
+    tasks = feed_cache.get_or_build('bot', 'available', lambda: list(
+        Task.objects.open_feed().values('id', 'title', 'description', 'reward')[:5]  # Limit to 5 tasks
+    ))
     
     if not tasks:
-        line_bot_api.reply_message(
+        reply(
+            'tasks',
             reply_token,
             TextSendMessage(text="No tasks available right now. Check back later or post your own task!")
         )
         return
     
-    # Create a buttons template for each task
-    messages = []
+    # Render every task as a column of one carousel, so the list is a single message
+    columns = []
     
     for task in tasks:
-        template = ButtonsTemplate(
-            title=task.title[:40],  # LINE limits title to 40 chars
-            text=f"{task.description[:60]}... ({task.reward} EXP)",  # LINE limits text
+        reward_text = f"... ({task['reward']} EXP)"
+        columns.append(CarouselColumn(
+            title=task['title'][:40],  # LINE limits title to 40 chars
+            text=task['description'][:60 - len(reward_text)] + reward_text,  # and text to 60
             actions=[
                 PostbackAction(
                     label="View Details",
-                    data=json.dumps({"action": "detail", "task_id": task.id})
+                    data=json.dumps({"action": "detail", "task_id": task['id']})
                 ),
                 PostbackAction(
                     label="Take This Task",
-                    data=json.dumps({"action": "take", "task_id": task.id})
+                    data=json.dumps({"action": "take", "task_id": task['id']})
                 )
             ]
-        )
-        
-        messages.append(TemplateSendMessage(
-            alt_text=f"Task: {task.title}",
-            template=template
         ))
     
-    # Send the first message as a reply, then push the rest
-    line_bot_api.reply_message(reply_token, messages[0])
-    
-    user_id = line_bot_api.get_profile(reply_token).user_id
-    for message in messages[1:]:
-        line_bot_api.push_message(user_id, message)
+    reply(
+        'tasks',
+        reply_token,
+        TemplateSendMessage(
+            alt_text=f"{len(columns)} available tasks",
+            template=CarouselTemplate(columns=columns)
+        )
+    )
 
 
 def show_user_tasks(reply_token, user):
-    """Show tasks posted or taken by the user."""
-    posted_tasks = Task.objects.filter(poster=user).order_by('-created_at')[:3]
-    taken_tasks = Task.objects.filter(taker=user).order_by('-updated_at')[:3]
+    """Show the tasks the user most recently posted or took, most recently changed first."""
+    # Two short range scans of timeline_user_role_idx, one per role
+    posted_tasks = [
+        entry.task for entry in
+        TimelineEntry.objects.for_user(user, role=TimelineEntry.Role.POSTER).select_related('task')[:3]
+    ]
+    taken_tasks = [
+        entry.task for entry in
+        TimelineEntry.objects.for_user(user, role=TimelineEntry.Role.TAKER).select_related('task')[:3]
+    ]
     
     if not posted_tasks and not taken_tasks:
-        line_bot_api.reply_message(
+        reply(
+            'my_tasks',
             reply_token,
             TextSendMessage(text="You haven't posted or taken any tasks yet.")
         )
         return
     
     messages = []
+    complete_columns = []
     
     # Add posted tasks
     if posted_tasks:
         posted_text = "📤 Your Posted Tasks:\n\n"
         for task in posted_tasks:
-            status_emoji = "🆕" if task.status == Task.TaskStatus.OPEN else "🔄" if task.status == Task.TaskStatus.TAKEN else "✅"
+            status_emoji = POSTED_STATUS_EMOJI[task.status]
             posted_text += f"{status_emoji} {task.title}\n"
         
         messages.append(TextSendMessage(text=posted_text))
@@ -220,35 +288,34 @@ def show_user_tasks(reply_token, user):
             
             # Add complete button for taken tasks that aren't done
             if task.status == Task.TaskStatus.TAKEN:
-                template = ButtonsTemplate(
+                complete_columns.append(CarouselColumn(
                     title=task.title[:40],
-                    text=f"Taken task: {task.description[:60]}...",
+                    text=f"Taken task: {task.description[:45]}...",
                     actions=[
                         PostbackAction(
                             label="Mark as Complete",
                             data=json.dumps({"action": "complete", "task_id": task.id})
                         )
                     ]
-                )
-                messages.append(TemplateSendMessage(
-                    alt_text=f"Task: {task.title}",
-                    template=template
                 ))
         
         messages.append(TextSendMessage(text=taken_text))
     
-    # Send the first message as a reply, then push the rest
-    line_bot_api.reply_message(reply_token, messages[0])
+    if complete_columns:
+        messages.append(TemplateSendMessage(
+            alt_text="Tasks to complete",
+            template=CarouselTemplate(columns=complete_columns)
+        ))
     
-    user_id = user.line_id
-    for message in messages[1:]:
-        line_bot_api.push_message(user_id, message)
+    # At most three messages, so this is a single reply call
+    reply('my_tasks', reply_token, *messages, user_id=user.line_id)
 
 
 def handle_post_command(reply_token, user, title):
     """Handle the start of task posting process."""
     if not title:
-        line_bot_api.reply_message(
+        reply(
+            'post',
             reply_token,
             TextSendMessage(text="Please provide a title for your task. Example: post: Buy groceries")
         )
@@ -256,7 +323,8 @@ def handle_post_command(reply_token, user, title):
     
     # In a real application, this would start a conversation flow to gather all task details
     # For this demonstration, we'll just acknowledge and provide next steps
-    line_bot_api.reply_message(
+    reply(
+        'post',
         reply_token,
         TextSendMessage(
             text=f"Starting to create task: '{title}'\n\n"
@@ -273,27 +341,29 @@ def handle_post_command(reply_token, user, title):
 def handle_take_task(reply_token, user, task_id):
     """Handle a user taking a task."""
     try:
-        task = Task.objects.get(id=task_id)
+        task = Task.objects.with_users().get(id=task_id)
     except Task.DoesNotExist:
-        line_bot_api.reply_message(
+        reply(
+            'take',
             reply_token,
             TextSendMessage(text="Task not found.")
         )
         return
     
-    # Check if user is the poster
-    if user == task.poster:
-        line_bot_api.reply_message(
+    # Try to take the task; concurrent takers are resolved by the model
+    result = task.take(user)
+    
+    if result is TakeResult.OWN_TASK:
+        reply(
+            'take',
             reply_token,
             TextSendMessage(text="You cannot take your own task.")
         )
         return
     
-    # Try to take the task
-    success = task.take(user)
-    
-    if success:
-        line_bot_api.reply_message(
+    if result:
+        reply(
+            'take',
             reply_token,
             TextSendMessage(
                 text=f"You've taken the task: {task.title}\n\n"
@@ -302,17 +372,10 @@ def handle_take_task(reply_token, user, task_id):
         )
         
         # Notify the poster
-        try:
-            line_bot_api.push_message(
-                task.poster.line_id,
-                TextSendMessage(
-                    text=f"Good news! {user.display_name} has taken your task: {task.title}"
-                )
-            )
-        except LineBotApiError:
-            logger.error(f"Failed to notify poster {task.poster.line_id}")
+        notify_task_taken(task, user)
     else:
-        line_bot_api.reply_message(
+        reply(
+            'take',
             reply_token,
             TextSendMessage(text="Sorry, this task is no longer available.")
         )
@@ -321,58 +384,50 @@ def handle_take_task(reply_token, user, task_id):
 def handle_complete_task(reply_token, user, task_id):
     """Handle a user marking a task as complete."""
     try:
-        task = Task.objects.get(id=task_id)
+        task = Task.objects.with_users().get(id=task_id)
     except Task.DoesNotExist:
-        line_bot_api.reply_message(
+        reply(
+            'complete',
             reply_token,
             TextSendMessage(text="Task not found.")
         )
         return
     
     # Check if user is the taker
-    if user != task.taker:
-        line_bot_api.reply_message(
+    if user.pk != task.taker_id:
+        reply(
+            'complete',
             reply_token,
             TextSendMessage(text="You can only complete tasks you've taken.")
         )
         return
     
     # Try to complete the task
-    success = task.complete()
+    credit = task.complete()
     
-    if success:
-        # Check if user leveled up
-        did_level_up = (user.exp + task.reward) >= (user.level * 100)
-        
-        if did_level_up:
+    if credit:
+        if credit.leveled_up:
             message = (
                 f"🎉 Task completed: {task.title}\n\n"
-                f"You earned {task.reward} EXP and LEVELED UP to level {user.level}! 🌟"
+                f"You earned {credit.exp_gained} EXP and LEVELED UP to level {credit.level_after}! 🌟"
             )
         else:
             message = (
                 f"✅ Task completed: {task.title}\n\n"
-                f"You earned {task.reward} EXP!"
+                f"You earned {credit.exp_gained} EXP!"
             )
         
-        line_bot_api.reply_message(
+        reply(
+            'complete',
             reply_token,
             TextSendMessage(text=message)
         )
         
         # Notify the poster
-        try:
-            line_bot_api.push_message(
-                task.poster.line_id,
-                TextSendMessage(
-                    text=f"🎉 {user.display_name} has completed your task: {task.title}\n\n"
-                         f"Would you like to send a thank you message?"
-                )
-            )
-        except LineBotApiError:
-            logger.error(f"Failed to notify poster {task.poster.line_id}")
+        notify_task_completed(task, user)
     else:
-        line_bot_api.reply_message(
+        reply(
+            'complete',
             reply_token,
             TextSendMessage(text="Sorry, there was an issue completing this task.")
         )
@@ -381,9 +436,10 @@ def handle_complete_task(reply_token, user, task_id):
 def show_task_detail(reply_token, task_id):
     """Show detailed information about a task."""
     try:
-        task = Task.objects.get(id=task_id)
+        task = Task.objects.with_users().get(id=task_id)
     except Task.DoesNotExist:
-        line_bot_api.reply_message(
+        reply(
+            'detail',
             reply_token,
             TextSendMessage(text="Task not found.")
         )
@@ -410,7 +466,8 @@ def show_task_detail(reply_token, task_id):
             ]
         )
         
-        line_bot_api.reply_message(
+        reply(
+            'detail',
             reply_token,
             TemplateSendMessage(
                 alt_text=f"Task: {task.title}",
@@ -418,7 +475,8 @@ def show_task_detail(reply_token, task_id):
             )
         )
     else:
-        line_bot_api.reply_message(
+        reply(
+            'detail',
             reply_token,
             TextSendMessage(text=detail_text)
         )
\ No newline at end of file
@@ -0,0 +1,88 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from linebot_core.notifications import (
+    NotificationDispatcher, notification_stats, purge_finished_notifications
+)
+
+
+# How often idle dispatchers delete notifications past their retention
+PURGE_INTERVAL = 60  # seconds
+
+
+class Command(BaseCommand):
+    help = "Deliver queued LINE push notifications with retries and rate limiting."
+
+    last_purge = 0.0
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.LINE_NOTIFICATION_WORKERS,
+            help="Number of dispatcher threads."
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help="Seconds to wait when nothing is due."
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Deliver everything currently due and exit."
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help="Print notification queue stats, then exit."
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for name, value in notification_stats().items():
+                self.stdout.write(f"{name}: {value}")
+            return
+
+        dispatcher = NotificationDispatcher()
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=self.work,
+                args=(dispatcher, stop, options),
+                name=f"notification-dispatcher-{index}",
+                daemon=True
+            )
+            for index in range(options['workers'])
+        ]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Started {len(threads)} notification dispatchers")
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1.0)
+        except KeyboardInterrupt:
+            self.stdout.write("Shutting down, finishing claimed notifications...")
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    def work(self, dispatcher, stop, options):
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                if dispatcher.run_once():
+                    continue
+                if options['once']:
+                    return
+                self.purge_if_due()
+                stop.wait(options['poll_interval'])
+        finally:
+            connections.close_all()
+
+    def purge_if_due(self):
+        now = time.monotonic()
+        if now - self.last_purge >= PURGE_INTERVAL:
+            self.last_purge = now
+            purge_finished_notifications()
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from linebot_core.async_client import close_async_line_bot_api, run_orm
+from linebot_core.event_queue import (
+    AsyncWorkerPool, WorkerPool, claim_events, has_pending_events,
+    queue_stats, release_stale_claims
+)
+from linebot_core.idempotency import purge_processed_events
+
+
+# How often idle workers delete processed events past the de-duplication TTL
+PURGE_INTERVAL = 60  # seconds
+
+
+class Command(BaseCommand):
+    help = "Process queued LINE webhook events with a pool of worker threads."
+
+    last_purge = 0.0
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.LINE_WEBHOOK_WORKERS,
+            help="Number of worker threads."
+        )
+        parser.add_argument(
+            '--async', action='store_true', dest='use_async',
+            help="Process events as coroutines with the async LINE client."
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=settings.LINE_ASYNC_CONCURRENCY,
+            help="Maximum number of events in flight with --async."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.LINE_WEBHOOK_BATCH_SIZE,
+            help="Maximum number of events claimed per poll."
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help="Seconds to wait when the queue is empty."
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Drain the queue and exit instead of polling forever."
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help="Print queue depth and lag, then exit."
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for name, value in queue_stats().items():
+                self.stdout.write(f"{name}: {value}")
+            return
+
+        released = release_stale_claims()
+        if released:
+            self.stdout.write(f"Released {released} stale events back to the queue")
+
+        try:
+            if options['use_async']:
+                asyncio.run(self.run_async(options))
+            else:
+                self.run_threads(options)
+        except KeyboardInterrupt:
+            self.stdout.write("Shut down")
+
+    def run_threads(self, options):
+        pool = WorkerPool(workers=options['workers'], backlog=options['batch_size'])
+        pool.start()
+        self.stdout.write(f"Started {pool.workers} webhook workers")
+
+        try:
+            while True:
+                events = claim_events(options['batch_size'])
+                if events:
+                    pool.dispatch(events)
+                elif options['once']:
+                    # Failed events may have been put back for a retry
+                    pool.wait()
+                    if not has_pending_events():
+                        break
+                else:
+                    self.purge_if_due()
+                    time.sleep(options['poll_interval'])
+        finally:
+            pool.stop()
+
+    async def run_async(self, options):
+        pool = AsyncWorkerPool(concurrency=options['concurrency'])
+        self.stdout.write(f"Started async webhook worker ({pool.concurrency} in flight)")
+
+        try:
+            while True:
+                if pool.in_flight >= pool.concurrency:
+                    await asyncio.sleep(0.01)
+                    continue
+
+                events = await run_orm(claim_events, options['batch_size'])
+                if events:
+                    pool.dispatch(events)
+                elif options['once']:
+                    await pool.wait()
+                    if not await run_orm(has_pending_events):
+                        break
+                else:
+                    await run_orm(self.purge_if_due)
+                    await asyncio.sleep(options['poll_interval'])
+        finally:
+            await pool.wait()
+            await close_async_line_bot_api()
+
+    def purge_if_due(self):
+        now = time.monotonic()
+        if now - self.last_purge >= PURGE_INTERVAL:
+            self.last_purge = now
+            purge_processed_events()
@@ -0,0 +1,108 @@
+"""
+Outbound message batching for the LINE bot.
+
+A single ``reply_message`` call can carry up to five messages and does not
+count against the push quota, so commands collect their messages in a
+``MessageBatch`` and send them together. Push is only used for messages
+that do not fit in the reply.
+"""
+
+import contextvars
+import logging
+from contextlib import contextmanager
+
+from meowtask import metrics
+
+logger = logging.getLogger(__name__)
+
+# LINE accepts at most five message objects per reply or push request
+MAX_MESSAGES_PER_REQUEST = 5
+
+# Keys are '<command>.reply', '<command>.push' and '<command>.messages'
+counters = metrics.Counters()
+
+# When set, batches are collected here instead of being sent (see ``deferred_sending``)
+_outbox = contextvars.ContextVar('line_outbox', default=None)
+
+
+@contextmanager
+def deferred_sending():
+    """
+    Collect every batch sent inside the block instead of calling the API.
+
+    The async worker runs the sync handlers under this context and then sends
+    the collected batches with the async client.
+    """
+    outbox = []
+    token = _outbox.set(outbox)
+    try:
+        yield outbox
+    finally:
+        _outbox.reset(token)
+
+
+class MessageBatch:
+    """Messages produced by one bot command, sent with as few API calls as possible."""
+
+    def __init__(self, command, reply_token, user_id=None):
+        self.command = command
+        self.reply_token = reply_token
+        self.user_id = user_id
+        self.messages = []
+
+    def add(self, *messages):
+        self.messages.extend(messages)
+        return self
+
+    def chunks(self):
+        return [
+            self.messages[i:i + MAX_MESSAGES_PER_REQUEST]
+            for i in range(0, len(self.messages), MAX_MESSAGES_PER_REQUEST)
+        ]
+
+    def send(self, api):
+        """Reply with the first five messages and push the rest, if any."""
+        outbox = _outbox.get()
+        if outbox is not None:
+            outbox.append(self)
+            return
+
+        for call, target, chunk in self._calls():
+            if call == 'reply':
+                api.reply_message(target, chunk)
+            else:
+                api.push_message(target, chunk)
+
+    async def asend(self, api):
+        """Same as ``send``, using an ``AsyncLineBotApi``."""
+        for call, target, chunk in self._calls():
+            if call == 'reply':
+                await api.reply_message(target, chunk)
+            else:
+                await api.push_message(target, chunk)
+
+    def _calls(self):
+        chunks = self.chunks()
+        if not chunks:
+            return
+
+        yield 'reply', self.reply_token, _unwrap(chunks[0])
+        counters.incr(f'{self.command}.reply')
+        counters.incr(f'{self.command}.messages', len(chunks[0]))
+
+        for chunk in chunks[1:]:
+            if not self.user_id:
+                logger.warning(
+                    f"Dropping {len(chunk)} '{self.command}' messages: no user to push to"
+                )
+                continue
+            yield 'push', self.user_id, _unwrap(chunk)
+            counters.incr(f'{self.command}.push')
+            counters.incr(f'{self.command}.messages', len(chunk))
+
+
+def _unwrap(chunk):
+    return chunk[0] if len(chunk) == 1 else chunk
+
+
+metrics.register('line_outbound_calls', counters.snapshot)
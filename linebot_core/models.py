@@ -1,4 +1,74 @@
 from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 
-# This app doesn't need its own models as it primarily interfaces with LINE API
-# and uses models from the users and tasks apps.
\ No newline at end of file
+
+class WebhookEvent(models.Model):
+    """A raw LINE webhook event stored durably until a worker processes it."""
+    
+    class EventStatus(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        PROCESSING = 'processing', _('Processing')
+        DONE = 'done', _('Done')
+        FAILED = 'failed', _('Failed')
+    
+    # LINE's unique ID for the event, kept after processing to drop redeliveries
+    webhook_event_id = models.CharField(max_length=64, unique=True, blank=True, null=True)
+    
+    # LINE user ID of the event source, used to keep each user's events in order
+    source_id = models.CharField(max_length=100, blank=True)
+    payload = models.JSONField()
+    
+    status = models.CharField(
+        max_length=10,
+        choices=EventStatus.choices,
+        default=EventStatus.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'id'], name='webhook_event_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.payload.get('type', 'unknown')} event from {self.source_id or 'unknown'}"
+
+
+class Notification(models.Model):
+    """A push notification waiting to be delivered by the notification dispatcher."""
+    
+    class NotificationStatus(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        SENT = 'sent', _('Sent')
+        FAILED = 'failed', _('Failed')
+    
+    # LINE user ID of the recipient
+    recipient = models.CharField(max_length=100)
+    text = models.TextField()
+    
+    status = models.CharField(
+        max_length=10,
+        choices=NotificationStatus.choices,
+        default=NotificationStatus.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='notification_due_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Notification to {self.recipient}"
@@ -0,0 +1,251 @@
+"""
+Outbound push notification dispatcher.
+
+Notifications are written to the ``Notification`` table by ``notify`` and
+delivered by the ``run_notification_dispatcher`` management command, so the
+bot handlers and the REST views never wait on the LINE API and a failed push
+is retried instead of being lost.
+
+- A recipient's notifications are held until the oldest has waited
+  ``LINE_NOTIFICATION_COALESCE_WINDOW`` seconds, then all of them are merged
+  into one message.
+- Pushes are rate limited to ``LINE_PUSH_RATE_LIMIT`` requests per second
+  across all dispatcher threads of a process.
+- Failed pushes are retried with exponential backoff; requests LINE rejects
+  as invalid (4xx other than 429) are not retried.
+- Sent and failed notifications are kept for
+  ``LINE_NOTIFICATION_RETENTION`` seconds after their last attempt, then
+  deleted by ``purge_finished_notifications``.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min
+from django.utils import timezone
+from linebot.exceptions import LineBotApiError
+from linebot.models import TextSendMessage
+
+from meowtask import metrics
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# LINE rejects text messages longer than this
+MAX_TEXT_LENGTH = 5000
+
+counters = metrics.Counters(
+    'queued', 'pushes', 'delivered', 'coalesced', 'retried', 'failed', 'throttled', 'purged'
+)
+
+
+def notify(recipient, text):
+    """Queue a push notification for a LINE user."""
+    if not recipient:
+        return None
+    counters.incr('queued')
+    return Notification.objects.create(recipient=recipient, text=text)
+
+
+def notify_task_taken(task, taker):
+    notify(
+        task.poster.line_id,
+        f"Good news! {taker.display_name} has taken your task: {task.title}"
+    )
+
+
+def notify_task_completed(task, taker):
+    notify(
+        task.poster.line_id,
+        f"🎉 {taker.display_name} has completed your task: {task.title}\n\n"
+        f"Would you like to send a thank you message?"
+    )
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` acquisitions per second."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            counters.incr('throttled')
+            time.sleep(wait)
+
+
+def backoff_delay(attempts):
+    """Seconds to wait before retry number ``attempts``, with jitter."""
+    delay = min(
+        settings.LINE_NOTIFICATION_BACKOFF_BASE * 2 ** (attempts - 1),
+        settings.LINE_NOTIFICATION_BACKOFF_MAX
+    )
+    return delay * random.uniform(0.5, 1.0)
+
+
+def is_retryable(error):
+    if isinstance(error, LineBotApiError):
+        return error.status_code == 429 or error.status_code >= 500
+    return True
+
+
+def coalesce(notifications):
+    """Group notifications by recipient, preserving creation order."""
+    groups = OrderedDict()
+    for notification in notifications:
+        groups.setdefault(notification.recipient, []).append(notification)
+    return groups
+
+
+def merge_text(notifications):
+    text = "\n\n".join(notification.text for notification in notifications)
+    if len(text) > MAX_TEXT_LENGTH:
+        text = text[:MAX_TEXT_LENGTH - 1] + "…"
+    return text
+
+
+class NotificationDispatcher:
+    """Claims due notifications and pushes them, one message per recipient."""
+
+    def __init__(self, api=None, rate_limiter=None, batch_size=None):
+        self._api = api
+        self.rate_limiter = rate_limiter or RateLimiter(settings.LINE_PUSH_RATE_LIMIT)
+        self.batch_size = batch_size or settings.LINE_NOTIFICATION_BATCH_SIZE
+
+    @property
+    def api(self):
+        if self._api is None:
+            from .line_bot_handler import line_bot_api
+            self._api = line_bot_api
+        return self._api
+
+    def claim(self):
+        """
+        Lock and claim due notifications, a whole recipient at a time.
+
+        A recipient is claimed once their oldest due notification has waited
+        out the coalescing window, together with every other notification
+        due for them, so everything queued within the window goes out as one
+        push. ``batch_size`` bounds the recipients claimed per call.
+        """
+        now = timezone.now()
+        cutoff = now - timedelta(seconds=settings.LINE_NOTIFICATION_COALESCE_WINDOW)
+        due = Notification.objects.filter(
+            status=Notification.NotificationStatus.PENDING,
+            next_attempt_at__lte=now
+        )
+
+        with transaction.atomic():
+            recipients = list(
+                due.filter(created_at__lte=cutoff)
+                .values('recipient')
+                .annotate(oldest=Min('id'))
+                .order_by('oldest')
+                .values_list('recipient', flat=True)[:self.batch_size]
+            )
+            if not recipients:
+                return []
+
+            rows = list(
+                due.filter(recipient__in=recipients)
+                .select_for_update(skip_locked=True)
+                .order_by('id')
+                .values_list('id', 'recipient', 'created_at')
+            )
+            # Rows locked by another dispatcher were skipped; a recipient is
+            # only claimed along with a notification that waited out the window
+            ready = {recipient for _, recipient, created_at in rows if created_at <= cutoff}
+            ids = [notification_id for notification_id, recipient, _ in rows if recipient in ready]
+            if not ids:
+                return []
+
+            # Push the claim into the future so other dispatchers skip these rows
+            Notification.objects.filter(id__in=ids).update(
+                attempts=F('attempts') + 1,
+                next_attempt_at=now + timedelta(seconds=settings.LINE_NOTIFICATION_CLAIM_TIMEOUT)
+            )
+
+        return list(Notification.objects.filter(id__in=ids).order_by('id'))
+
+    def run_once(self):
+        """Deliver one batch of due notifications. Returns the number claimed."""
+        notifications = self.claim()
+        for recipient, group in coalesce(notifications).items():
+            self.deliver(recipient, group)
+        return len(notifications)
+
+    def deliver(self, recipient, group):
+        ids = [notification.id for notification in group]
+        self.rate_limiter.acquire()
+
+        try:
+            self.api.push_message(recipient, TextSendMessage(text=merge_text(group)))
+        except Exception as e:
+            attempts = max(notification.attempts for notification in group)
+            if is_retryable(e) and attempts < settings.LINE_NOTIFICATION_MAX_ATTEMPTS:
+                logger.warning(f"Push to {recipient} failed, retrying: {e}")
+                Notification.objects.filter(id__in=ids).update(
+                    next_attempt_at=timezone.now() + timedelta(seconds=backoff_delay(attempts)),
+                    last_error=str(e)
+                )
+                counters.incr('retried', len(ids))
+            else:
+                logger.error(f"Failed to notify {recipient}: {e}")
+                Notification.objects.filter(id__in=ids).update(
+                    status=Notification.NotificationStatus.FAILED,
+                    last_error=str(e)
+                )
+                counters.incr('failed', len(ids))
+            return False
+
+        Notification.objects.filter(id__in=ids).update(
+            status=Notification.NotificationStatus.SENT,
+            sent_at=timezone.now()
+        )
+        counters.incr('pushes')
+        counters.incr('delivered', len(ids))
+        counters.incr('coalesced', len(ids) - 1)
+        return True
+
+
+def purge_finished_notifications():
+    """Delete sent and failed notifications last attempted over ``LINE_NOTIFICATION_RETENTION`` ago."""
+    cutoff = timezone.now() - timedelta(seconds=settings.LINE_NOTIFICATION_RETENTION)
+    purged, _ = Notification.objects.filter(
+        status__in=[Notification.NotificationStatus.SENT, Notification.NotificationStatus.FAILED],
+        next_attempt_at__lt=cutoff
+    ).delete()
+    counters.incr('purged', purged)
+    return purged
+
+
+def notification_stats():
+    return {
+        'pending': Notification.objects.filter(
+            status=Notification.NotificationStatus.PENDING
+        ).count(),
+        **counters.snapshot(),
+    }
+
+
+metrics.register('notifications', notification_stats)
@@ -0,0 +1,212 @@
+"""
+TTL cache for LINE user profiles.
+
+Every text message used to call ``get_profile`` on the LINE API. Profiles
+change rarely, so they are cached for ``LINE_PROFILE_CACHE_TTL`` seconds.
+Entries older than ``LINE_PROFILE_CACHE_REFRESH_AFTER`` seconds are still
+served, but a background thread fetches a fresh copy so busy users never
+wait on the LINE API.
+
+Two backends are available, selected by ``LINE_PROFILE_CACHE_BACKEND``:
+``memory`` (a per-process LRU) and ``django`` (the Django cache framework,
+shared between processes).
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+
+from meowtask import metrics
+
+logger = logging.getLogger(__name__)
+
+CachedProfile = namedtuple('CachedProfile', ['user_id', 'display_name', 'picture_url'])
+
+counters = metrics.Counters('hits', 'misses', 'refreshes', 'refresh_errors', 'evictions')
+
+
+class LocalMemoryBackend:
+    """Per-process LRU store of ``(profile, fetched_at)`` entries."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+            return entry
+
+    def set(self, user_id, entry):
+        with self._lock:
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                counters.incr('evictions')
+
+    def delete(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCacheBackend:
+    """
+    Store entries in a Django cache, which handles its own eviction.
+
+    The cache may be shared with other data, so keys carry a version that
+    ``clear`` increments: old entries become unreachable and expire on
+    their own, and nothing else in the cache is touched.
+    """
+
+    key_prefix = 'line_profile:'
+    version_key = 'line_profile:version'
+
+    def __init__(self, alias, ttl):
+        self.cache = caches[alias]
+        self.ttl = ttl
+
+    def get(self, user_id):
+        return self.cache.get(self._key(user_id))
+
+    def set(self, user_id, entry):
+        self.cache.set(self._key(user_id), entry, timeout=self.ttl)
+
+    def delete(self, user_id):
+        self.cache.delete(self._key(user_id))
+
+    def clear(self):
+        try:
+            self.cache.incr(self.version_key)
+        except ValueError:
+            # Evicted or never read: any new value hides the old entries
+            self.cache.add(self.version_key, 1, timeout=None)
+
+    def _key(self, user_id):
+        version = self.cache.get(self.version_key)
+        if version is None:
+            self.cache.add(self.version_key, 1, timeout=None)
+            version = self.cache.get(self.version_key, 1)
+        return f'{self.key_prefix}{version}:{user_id}'
+
+
+class ProfileCache:
+    """Read-through cache in front of ``LineBotApi.get_profile``."""
+
+    def __init__(self, fetch, backend, ttl, refresh_after):
+        self.fetch = fetch
+        self.backend = backend
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='profile-refresh')
+
+    def get(self, user_id):
+        """
+        Return the profile for ``user_id``, calling the LINE API only on a miss.
+
+        Raises ``LineBotApiError`` if the profile is not cached and cannot be fetched.
+        """
+        entry = self.backend.get(user_id)
+        now = time.time()
+
+        if entry is not None:
+            profile, fetched_at = entry
+            age = now - fetched_at
+            if age < self.ttl:
+                counters.incr('hits')
+                if age >= self.refresh_after:
+                    self._schedule_refresh(user_id)
+                return profile
+
+        counters.incr('misses')
+        return self._load(user_id)
+
+    async def awarm(self, user_id, afetch):
+        """
+        Make sure a fresh profile is cached, fetching it with ``afetch`` if not.
+
+        Used by the async worker before running the sync handlers, so they
+        never block on the LINE API.
+        """
+        entry = self.backend.get(user_id)
+        if entry is not None and time.time() - entry[1] < self.refresh_after:
+            return
+
+        counters.incr('misses')
+        self._store(user_id, await afetch(user_id))
+
+    def invalidate(self, user_id):
+        self.backend.delete(user_id)
+
+    def clear(self):
+        self.backend.clear()
+
+    def _load(self, user_id):
+        return self._store(user_id, self.fetch(user_id))
+
+    def _store(self, user_id, profile):
+        cached = CachedProfile(
+            user_id=user_id,
+            display_name=profile.display_name,
+            picture_url=profile.picture_url
+        )
+        self.backend.set(user_id, (cached, time.time()))
+        return cached
+
+    def _schedule_refresh(self, user_id):
+        with self._lock:
+            if user_id in self._refreshing:
+                return
+            self._refreshing.add(user_id)
+        self._executor.submit(self._refresh, user_id)
+
+    def _refresh(self, user_id):
+        try:
+            self._load(user_id)
+            counters.incr('refreshes')
+        except Exception:
+            counters.incr('refresh_errors')
+            logger.warning(f"Background profile refresh failed for {user_id}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(user_id)
+
+
+def build_backend():
+    """Create the backend configured by ``LINE_PROFILE_CACHE_BACKEND``."""
+    backend = settings.LINE_PROFILE_CACHE_BACKEND
+    if backend == 'memory':
+        return LocalMemoryBackend(settings.LINE_PROFILE_CACHE_MAX_SIZE)
+    if backend == 'django':
+        return DjangoCacheBackend(
+            settings.LINE_PROFILE_CACHE_ALIAS,
+            settings.LINE_PROFILE_CACHE_TTL
+        )
+    raise ValueError(f"Unknown LINE_PROFILE_CACHE_BACKEND: {backend}")
+
+
+def cache_stats():
+    stats = counters.snapshot()
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    return stats
+
+
+metrics.register('line_profile_cache', cache_stats)
@@ -1,11 +1,56 @@
-from django.test import TestCase, Client
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, Client
 from django.urls import reverse
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 from users.models import User
+from users.user_cache import counters as user_counters
 from tasks.models import Task
+from .models import Notification, WebhookEvent
+from .notifications import NotificationDispatcher, RateLimiter, notify, purge_finished_notifications
+from linebot.exceptions import LineBotApiError
+from linebot.models.error import Error
+from django.test import override_settings
+from .event_queue import claim_events, enqueue_webhook, queue_stats
+from .idempotency import counters as dedup_counters, purge_processed_events, seen_events
+from .line_bot_handler import (
+    handle_text_message, process_event_async, show_available_tasks, show_user_tasks
+)
+from .views import line_webhook_async
+from .messaging import MessageBatch, counters as outbound_counters
+from .profile_cache import DjangoCacheBackend, LocalMemoryBackend, ProfileCache, counters as profile_counters
+from linebot.models import MessageEvent, TextSendMessage
+from django.utils import timezone
+import asyncio
+import base64
+import hashlib
+import hmac
 import json
 
 
+def sign(body):
+    """Compute the X-Line-Signature for a request body."""
+    digest = hmac.new(
+        settings.LINE_CHANNEL_SECRET.encode('utf-8'),
+        body.encode('utf-8'),
+        hashlib.sha256
+    ).digest()
+    return base64.b64encode(digest).decode('utf-8')
+
+
+def text_event(user_id, text, event_id=None, redelivery=False):
+    return {
+        'type': 'message',
+        'webhookEventId': event_id,
+        'deliveryContext': {'isRedelivery': redelivery},
+        'replyToken': f'reply-{text}',
+        'message': {'id': text, 'type': 'text', 'text': text},
+        'source': {'type': 'user', 'userId': user_id},
+        'timestamp': 0,
+    }
+
+
 class LineWebhookTests(TestCase):
     
     def setUp(self):
@@ -28,7 +73,7 @@ class LineWebhookTests(TestCase):
             poster=self.user
         )
     
-    @patch('linebot.line_bot_handler.handle_webhook')
+    @patch('linebot_core.views.enqueue_webhook')
     def test_webhook_endpoint(self, mock_handle_webhook):
         """Test the LINE webhook endpoint."""
         mock_handle_webhook.return_value = True
@@ -56,4 +101,520 @@ class LineWebhookTests(TestCase):
         mock_handle_webhook.assert_called_once()
         
         # Check response
-        self.assertEqual(response.status_code, 200)
\ No newline at end of file
+        self.assertEqual(response.status_code, 200)
+    
+    def test_webhook_enqueues_events(self):
+        """Test that a signed webhook stores its events without processing them."""
+        body = json.dumps({'events': [text_event('test_line_id', 'help')]})
+        
+        with patch('linebot_core.event_queue.process_event') as mock_process:
+            response = self.client.post(
+                self.webhook_url,
+                data=body,
+                content_type='application/json',
+                HTTP_X_LINE_SIGNATURE=sign(body)
+            )
+        
+        self.assertEqual(response.status_code, 200)
+        mock_process.assert_not_called()
+        
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.source_id, 'test_line_id')
+        self.assertEqual(event.status, WebhookEvent.EventStatus.PENDING)
+        self.assertEqual(queue_stats()['depth'], 1)
+    
+    def test_webhook_rejects_invalid_signature(self):
+        """Test that events with a bad signature are not queued."""
+        body = json.dumps({'events': [text_event('test_line_id', 'help')]})
+        
+        response = self.client.post(
+            self.webhook_url,
+            data=body,
+            content_type='application/json',
+            HTTP_X_LINE_SIGNATURE='invalid'
+        )
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+
+class WebhookWorkerTests(TransactionTestCase):
+    
+    def test_workers_keep_per_user_order(self):
+        """Test that the worker pool drains the queue in order for each user."""
+        for i in range(10):
+            for user_id in ('user_a', 'user_b', 'user_c'):
+                WebhookEvent.objects.create(
+                    source_id=user_id,
+                    payload=text_event(user_id, f'{user_id}-{i}')
+                )
+        
+        seen = []
+        
+        def record(payload):
+            seen.append((payload['source']['userId'], payload['message']['text']))
+        
+        with patch('linebot_core.event_queue.process_event', side_effect=record):
+            call_command('run_webhook_workers', workers=3, once=True, stdout=MagicMock())
+        
+        self.assertFalse(WebhookEvent.objects.exclude(status=WebhookEvent.EventStatus.DONE).exists())
+        for user_id in ('user_a', 'user_b', 'user_c'):
+            texts = [text for source, text in seen if source == user_id]
+            self.assertEqual(texts, [f'{user_id}-{i}' for i in range(10)])
+    
+    def test_retry_keeps_per_user_order(self):
+        """Test that a user's later events wait for an earlier event's retry."""
+        for i in range(3):
+            WebhookEvent.objects.create(source_id='user_a', payload=text_event('user_a', f'a-{i}'))
+        WebhookEvent.objects.create(source_id='user_b', payload=text_event('user_b', 'b-0'))
+        
+        handled = []
+        
+        def flaky(payload):
+            text = payload['message']['text']
+            if text == 'a-0' and not any(seen == 'failed a-0' for seen in handled):
+                handled.append('failed a-0')
+                raise RuntimeError('boom')
+            handled.append(text)
+        
+        with patch('linebot_core.event_queue.process_event', side_effect=flaky):
+            call_command('run_webhook_workers', workers=2, once=True, stdout=MagicMock())
+        
+        self.assertEqual(
+            [text for text in handled if text.startswith(('a-', 'failed'))],
+            ['failed a-0', 'a-0', 'a-1', 'a-2']
+        )
+        self.assertIn('b-0', handled)
+        self.assertEqual(
+            dict(WebhookEvent.objects.values_list('payload__message__text', 'attempts')),
+            {'a-0': 2, 'a-1': 1, 'a-2': 1, 'b-0': 1}
+        )
+    
+    def test_claim_waits_for_earlier_events_elsewhere(self):
+        """Test that events are not claimed while the user's earlier event is processed elsewhere."""
+        WebhookEvent.objects.create(
+            source_id='user_a', payload=text_event('user_a', 'a-0'),
+            status=WebhookEvent.EventStatus.PROCESSING
+        )
+        WebhookEvent.objects.create(source_id='user_a', payload=text_event('user_a', 'a-1'))
+        later = WebhookEvent.objects.create(source_id='user_b', payload=text_event('user_b', 'b-0'))
+        
+        self.assertEqual([event.id for event in claim_events(10)], [later.id])
+        
+        WebhookEvent.objects.filter(
+            source_id='user_a', status=WebhookEvent.EventStatus.PROCESSING
+        ).update(status=WebhookEvent.EventStatus.DONE)
+        self.assertEqual([event.payload['message']['text'] for event in claim_events(10)], ['a-1'])
+    
+    @override_settings(USER_CACHE_TTL=0)
+    def test_batch_loads_each_user_once(self):
+        """Test that the events of one claimed batch share a user identity map."""
+        User.objects.create(line_id='user_a', display_name='User A')
+        for i in range(3):
+            WebhookEvent.objects.create(source_id='user_a', payload=text_event('user_a', f'hello-{i}'))
+        user_counters.reset()
+        
+        profile = MagicMock(display_name='User A', picture_url=None)
+        with patch('linebot_core.line_bot_handler.profile_cache.get', return_value=profile), \
+                patch('linebot_core.line_bot_handler.reply'):
+            call_command('run_webhook_workers', workers=2, once=True, stdout=MagicMock())
+        
+        self.assertFalse(WebhookEvent.objects.exclude(status=WebhookEvent.EventStatus.DONE).exists())
+        self.assertEqual(user_counters.get('misses'), 1)
+        self.assertEqual(user_counters.get('identity_hits'), 2)
+    
+    def test_failed_event_is_retried_then_marked_failed(self):
+        """Test that an event failing every attempt ends up FAILED."""
+        WebhookEvent.objects.create(source_id='user_a', payload=text_event('user_a', 'boom'))
+        
+        with patch('linebot_core.event_queue.process_event', side_effect=RuntimeError('boom')):
+            call_command('run_webhook_workers', workers=1, once=True, stdout=MagicMock())
+        
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.status, WebhookEvent.EventStatus.FAILED)
+        self.assertEqual(event.attempts, settings.LINE_WEBHOOK_MAX_ATTEMPTS)
+
+
+class ProfileCacheTests(TestCase):
+    
+    def setUp(self):
+        self.fetch = MagicMock(side_effect=lambda user_id: MagicMock(
+            display_name=f'Name {user_id}',
+            picture_url=None
+        ))
+        self.cache = ProfileCache(
+            fetch=self.fetch,
+            backend=LocalMemoryBackend(max_size=2),
+            ttl=60,
+            refresh_after=45
+        )
+        profile_counters.reset()
+    
+    def test_hits_within_ttl(self):
+        """Test that repeated lookups are served from the cache."""
+        self.cache.get('u1')
+        profile = self.cache.get('u1')
+        
+        self.assertEqual(profile.display_name, 'Name u1')
+        self.assertEqual(self.fetch.call_count, 1)
+        self.assertEqual(profile_counters.get('hits'), 1)
+        self.assertEqual(profile_counters.get('misses'), 1)
+    
+    def test_expired_entries_are_refetched(self):
+        """Test that entries older than the TTL count as misses."""
+        with patch('linebot_core.profile_cache.time.time', return_value=1000):
+            self.cache.get('u1')
+        with patch('linebot_core.profile_cache.time.time', return_value=1061):
+            self.cache.get('u1')
+        
+        self.assertEqual(self.fetch.call_count, 2)
+        self.assertEqual(profile_counters.get('misses'), 2)
+    
+    def test_lru_eviction(self):
+        """Test that the least recently used profile is evicted first."""
+        self.cache.get('u1')
+        self.cache.get('u2')
+        self.cache.get('u1')
+        self.cache.get('u3')  # evicts u2
+        
+        self.assertIsNotNone(self.cache.backend.get('u1'))
+        self.assertIsNone(self.cache.backend.get('u2'))
+        self.assertEqual(profile_counters.get('evictions'), 1)
+    
+    def test_django_backend_clear_keeps_other_keys(self):
+        """Test that clearing the Django cache backend drops only cached profiles."""
+        shared = caches['default']
+        shared.set('unrelated', 'kept')
+        backend = DjangoCacheBackend('default', ttl=60)
+        backend.set('u1', ('profile', 1000))
+        
+        backend.clear()
+        
+        self.assertIsNone(backend.get('u1'))
+        self.assertEqual(shared.get('unrelated'), 'kept')
+
+
+class TextMessageProfileTests(TestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create(
+            line_id='test_line_id',
+            display_name='Test User'
+        )
+    
+    def send_text(self, text):
+        event = MessageEvent.new_from_json_dict(text_event('test_line_id', text))
+        handle_text_message(event)
+    
+    @patch('linebot_core.line_bot_handler.line_bot_api')
+    @patch('linebot_core.line_bot_handler.profile_cache')
+    def test_unchanged_profile_skips_save(self, mock_cache, mock_api):
+        """Test that the user row is not written when the profile is unchanged."""
+        mock_cache.get.return_value = MagicMock(display_name='Test User', picture_url=None)
+        
+        with patch.object(User, 'save') as mock_save:
+            self.send_text('help')
+        
+        mock_save.assert_not_called()
+        mock_api.reply_message.assert_called_once()
+    
+    @patch('linebot_core.line_bot_handler.line_bot_api')
+    @patch('linebot_core.line_bot_handler.profile_cache')
+    def test_changed_profile_updates_only_changed_fields(self, mock_cache, mock_api):
+        """Test that a changed display name is saved with update_fields."""
+        mock_cache.get.return_value = MagicMock(display_name='New Name', picture_url=None)
+        
+        with patch.object(User, 'save', autospec=True) as mock_save:
+            self.send_text('help')
+        
+        mock_save.assert_called_once_with(self.user, update_fields=['display_name'])
+
+
+class OutboundMessagingTests(TestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create(
+            line_id='test_line_id',
+            display_name='Test User'
+        )
+        self.taker = User.objects.create(
+            line_id='taker_line_id',
+            display_name='Taker User'
+        )
+        for i in range(5):
+            Task.objects.create(
+                title=f'Task {i}',
+                description='A fairly long description that needs to be truncated ' * 2,
+                reward=10,
+                location='Test Location',
+                time=timezone.now() + timezone.timedelta(days=1),
+                poster=self.user
+            )
+        outbound_counters.reset()
+    
+    def test_batch_replies_first_five_and_pushes_rest(self):
+        """Test that only messages beyond the first five are pushed."""
+        api = MagicMock()
+        messages = [TextSendMessage(text=str(i)) for i in range(7)]
+        
+        MessageBatch('test', 'token', user_id='test_line_id').add(*messages).send(api)
+        
+        api.reply_message.assert_called_once_with('token', messages[:5])
+        api.push_message.assert_called_once_with('test_line_id', messages[5:])
+        self.assertEqual(outbound_counters.get('test.reply'), 1)
+        self.assertEqual(outbound_counters.get('test.push'), 1)
+    
+    @patch('linebot_core.line_bot_handler.line_bot_api')
+    def test_available_tasks_is_one_reply(self, mock_api):
+        """Test that the task list is sent as a single carousel reply."""
+        show_available_tasks('token')
+        
+        mock_api.reply_message.assert_called_once()
+        mock_api.push_message.assert_not_called()
+        mock_api.get_profile.assert_not_called()
+        
+        message = mock_api.reply_message.call_args[0][1]
+        self.assertEqual(len(message.template.columns), 5)
+        for column in message.template.columns:
+            self.assertLessEqual(len(column.text), 60)
+    
+    @patch('linebot_core.line_bot_handler.line_bot_api')
+    def test_user_tasks_is_one_reply(self, mock_api):
+        """Test that posted and taken tasks are sent in a single reply."""
+        for task in Task.objects.all()[:3]:
+            task.take(self.taker)
+        
+        show_user_tasks('token', self.taker)
+        
+        mock_api.reply_message.assert_called_once()
+        mock_api.push_message.assert_not_called()
+        self.assertEqual(outbound_counters.get('my_tasks.reply'), 1)
+    
+    @patch('linebot_core.line_bot_handler.line_bot_api')
+    def test_user_tasks_with_many_posted_tasks(self, mock_api):
+        """Test that a taken task is shown however many tasks the user posted since."""
+        Task.objects.get(title='Task 0').take(self.taker)
+        for i in range(25):
+            Task.objects.create(
+                title=f'Posted {i}', description='Posted by the taker', reward=5,
+                location='Test Location', time=timezone.now() + timezone.timedelta(days=1),
+                poster=self.taker
+            )
+        
+        show_user_tasks('token', self.taker)
+        
+        posted, taken, carousel = mock_api.reply_message.call_args[0][1]
+        self.assertEqual(posted.text.count('\n'), 2 + 3)
+        self.assertIn('Task 0', taken.text)
+        self.assertEqual(len(carousel.template.columns), 1)
+
+
+class AsyncWebhookTests(TransactionTestCase):
+    
+    async def test_async_webhook_enqueues_events(self):
+        """Test that the async webhook view stores events like the sync one."""
+        body = json.dumps({'events': [text_event('test_line_id', 'help')]})
+        request = AsyncRequestFactory().post(
+            '/webhook/line/',
+            data=body,
+            content_type='application/json',
+            headers={'X-Line-Signature': sign(body)}
+        )
+        
+        response = await line_webhook_async(request)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await WebhookEvent.objects.acount(), 1)
+    
+    async def test_process_event_async_replies_with_async_client(self):
+        """Test that handler replies are sent through the async client."""
+        api = MagicMock()
+        api.get_profile = AsyncMock(return_value=MagicMock(
+            display_name='Async User', picture_url=None
+        ))
+        api.reply_message = AsyncMock()
+        
+        with patch('linebot_core.line_bot_handler.get_async_line_bot_api', return_value=api), \
+                patch('linebot_core.line_bot_handler.line_bot_api') as sync_api:
+            await process_event_async(text_event('async_line_id', 'help'))
+        
+        api.get_profile.assert_awaited_once_with('async_line_id')
+        api.reply_message.assert_awaited_once()
+        sync_api.reply_message.assert_not_called()
+        sync_api.get_profile.assert_not_called()
+        self.assertTrue(await User.objects.filter(display_name='Async User').aexists())
+    
+    def test_async_workers_keep_per_user_order(self):
+        """Test that the async worker keeps each user's events in order."""
+        for i in range(10):
+            for user_id in ('user_a', 'user_b'):
+                WebhookEvent.objects.create(
+                    source_id=user_id,
+                    payload=text_event(user_id, f'{user_id}-{i}')
+                )
+        
+        seen = []
+        
+        async def record(payload):
+            # Later events finish faster, so ordering has to come from the pool
+            await asyncio.sleep(0.01 if payload['message']['text'].endswith('-0') else 0)
+            seen.append((payload['source']['userId'], payload['message']['text']))
+        
+        with patch('linebot_core.event_queue.process_event_async', side_effect=record):
+            call_command('run_webhook_workers', '--async', '--once', stdout=MagicMock())
+        
+        self.assertFalse(WebhookEvent.objects.exclude(status=WebhookEvent.EventStatus.DONE).exists())
+        for user_id in ('user_a', 'user_b'):
+            texts = [text for source, text in seen if source == user_id]
+            self.assertEqual(texts, [f'{user_id}-{i}' for i in range(10)])
+
+
+class WebhookDeduplicationTests(TestCase):
+    
+    def setUp(self):
+        seen_events.clear()
+        dedup_counters.reset()
+    
+    def deliver(self, *events):
+        body = json.dumps({'events': list(events)})
+        return enqueue_webhook(body, sign(body))
+    
+    def test_duplicate_in_memory_is_dropped_without_query(self):
+        """Test that a redelivery seen by this process costs no DB query."""
+        self.deliver(text_event('user_a', 'help', event_id='evt1'))
+        
+        with self.assertNumQueries(0):
+            self.deliver(text_event('user_a', 'help', event_id='evt1', redelivery=True))
+        
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(dedup_counters.get('suppressed_memory'), 1)
+    
+    def test_first_delivery_adds_no_lookup(self):
+        """Test that a first delivery is stored with a single INSERT."""
+        with self.assertNumQueries(1):
+            self.deliver(text_event('user_a', 'help', event_id='evt1'))
+    
+    def test_redelivery_checked_against_database(self):
+        """Test that redeliveries are dropped after the memory front is lost."""
+        self.deliver(text_event('user_a', 'help', event_id='evt1'))
+        WebhookEvent.objects.update(status=WebhookEvent.EventStatus.DONE)
+        seen_events.clear()
+        
+        self.deliver(text_event('user_a', 'help', event_id='evt1', redelivery=True))
+        
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self.assertEqual(dedup_counters.get('suppressed_db'), 1)
+    
+    def test_redelivery_keeps_its_place_in_the_body(self):
+        """Test that an unknown redelivery is stored ahead of the later events in its body."""
+        self.deliver(
+            text_event('user_a', 'first', event_id='evt1', redelivery=True),
+            text_event('user_a', 'second', event_id='evt2')
+        )
+        
+        texts = [event.payload['message']['text'] for event in WebhookEvent.objects.order_by('id')]
+        self.assertEqual(texts, ['first', 'second'])
+    
+    def test_purge_keeps_recent_events(self):
+        """Test that only processed events past the TTL are purged."""
+        self.deliver(
+            text_event('user_a', 'one', event_id='evt1'),
+            text_event('user_a', 'two', event_id='evt2')
+        )
+        WebhookEvent.objects.update(status=WebhookEvent.EventStatus.DONE)
+        WebhookEvent.objects.filter(webhook_event_id='evt1').update(
+            received_at=timezone.now() - timezone.timedelta(seconds=settings.LINE_WEBHOOK_DEDUP_TTL + 1)
+        )
+        
+        self.assertEqual(purge_processed_events(), 1)
+        self.assertTrue(WebhookEvent.objects.filter(webhook_event_id='evt2').exists())
+
+
+@override_settings(LINE_NOTIFICATION_COALESCE_WINDOW=0)
+class NotificationDispatcherTests(TestCase):
+    
+    def setUp(self):
+        self.api = MagicMock()
+        self.dispatcher = NotificationDispatcher(api=self.api, rate_limiter=RateLimiter(1000))
+    
+    def test_notifications_for_one_recipient_are_coalesced(self):
+        """Test that pending notifications for a recipient go out as one push."""
+        notify('poster_a', 'first')
+        notify('poster_b', 'other')
+        notify('poster_a', 'second')
+        
+        self.assertEqual(self.dispatcher.run_once(), 3)
+        
+        self.assertEqual(self.api.push_message.call_count, 2)
+        recipient, message = self.api.push_message.call_args_list[0][0]
+        self.assertEqual(recipient, 'poster_a')
+        self.assertEqual(message.text, 'first\n\nsecond')
+        self.assertEqual(
+            Notification.objects.filter(status=Notification.NotificationStatus.SENT).count(), 3
+        )
+    
+    def test_recent_notifications_wait_for_window(self):
+        """Test that notifications inside the coalescing window are not sent yet."""
+        notify('poster_a', 'first')
+        
+        with override_settings(LINE_NOTIFICATION_COALESCE_WINDOW=60):
+            self.assertEqual(self.dispatcher.run_once(), 0)
+        
+        self.api.push_message.assert_not_called()
+    
+    @override_settings(LINE_NOTIFICATION_COALESCE_WINDOW=30)
+    def test_window_coalesces_staggered_notifications(self):
+        """Test that a recipient is claimed whole once their oldest notification waited out the window."""
+        first = notify('poster_a', 'first')
+        notify('poster_a', 'second')
+        notify('poster_b', 'recent')
+        Notification.objects.filter(pk=first.pk).update(
+            created_at=timezone.now() - timezone.timedelta(seconds=40)
+        )
+        Notification.objects.exclude(pk=first.pk).update(
+            created_at=timezone.now() - timezone.timedelta(seconds=10)
+        )
+        
+        self.assertEqual(self.dispatcher.run_once(), 2)
+        
+        self.api.push_message.assert_called_once()
+        recipient, message = self.api.push_message.call_args[0]
+        self.assertEqual((recipient, message.text), ('poster_a', 'first\n\nsecond'))
+        self.assertEqual(
+            Notification.objects.get(recipient='poster_b').status,
+            Notification.NotificationStatus.PENDING
+        )
+    
+    def test_server_error_is_retried_with_backoff(self):
+        """Test that a 5xx failure schedules a later retry."""
+        self.api.push_message.side_effect = LineBotApiError(500, {}, error=Error(message='Internal error'))
+        notification = notify('poster_a', 'first')
+        
+        self.dispatcher.run_once()
+        
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.NotificationStatus.PENDING)
+        self.assertGreater(notification.next_attempt_at, timezone.now())
+        self.assertEqual(self.dispatcher.run_once(), 0)
+    
+    def test_client_error_is_not_retried(self):
+        """Test that a rejected push is marked failed immediately."""
+        self.api.push_message.side_effect = LineBotApiError(400, {}, error=Error(message='Invalid reply token'))
+        notification = notify('poster_a', 'first')
+        
+        self.dispatcher.run_once()
+        
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, Notification.NotificationStatus.FAILED)
+    
+    def test_purge_keeps_recent_and_pending_notifications(self):
+        """Test that only sent and failed notifications past the retention are purged."""
+        old = timezone.now() - timezone.timedelta(seconds=settings.LINE_NOTIFICATION_RETENTION + 1)
+        for status in ('sent', 'failed', 'pending'):
+            Notification.objects.create(recipient='user_a', text=status, status=status, next_attempt_at=old)
+        Notification.objects.create(recipient='user_a', text='recent', status='sent')
+        
+        self.assertEqual(purge_finished_notifications(), 2)
+        self.assertEqual(
+            sorted(Notification.objects.values_list('text', flat=True)), ['pending', 'recent']
+        )
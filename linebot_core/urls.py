@@ -1,8 +1,13 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'linebot'
 
 urlpatterns = [
-    path('line/', views.line_webhook, name='webhook'),
+    path(
+        'line/',
+        views.line_webhook_async if settings.LINE_ASYNC else views.line_webhook,
+        name='webhook'
+    ),
 ]
\ No newline at end of file
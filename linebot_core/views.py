@@ -4,21 +4,21 @@ from django.http import HttpResponse, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 
-from .line_bot_handler import handle_webhook
+from .async_client import run_orm
+from .event_queue import enqueue_webhook
 
 logger = logging.getLogger(__name__)
 
 
-@csrf_exempt
-def line_webhook(request):
-    """Handle LINE Messaging API webhook."""
+def _read_webhook(request):
+    """Return ``(request_body, signature, error_response)`` for a webhook request."""
     if request.method != 'POST':
-        return HttpResponseBadRequest('Only POST requests are allowed')
+        return None, None, HttpResponseBadRequest('Only POST requests are allowed')
     
     # Get X-Line-Signature header value
     signature = request.headers.get('X-Line-Signature')
     if not signature:
-        return HttpResponseBadRequest('X-Line-Signature header is missing')
+        return None, None, HttpResponseBadRequest('X-Line-Signature header is missing')
     
     # Get request body
     request_body = request.body.decode('utf-8')
@@ -26,10 +26,35 @@ def line_webhook(request):
     # Log the event for debugging
     logger.debug(f"LINE Webhook: {request_body}")
     
-    # Handle webhook events
-    result = handle_webhook(request_body, signature)
-    
+    return request_body, signature, None
+
+
+def _webhook_response(result):
     if result:
         return HttpResponse('OK')
     else:
-        return HttpResponseBadRequest('Failed to handle webhook')
\ No newline at end of file
+        return HttpResponseBadRequest('Failed to handle webhook')
+
+
+@csrf_exempt
+def line_webhook(request):
+    """Handle LINE Messaging API webhook."""
+    request_body, signature, error = _read_webhook(request)
+    if error:
+        return error
+    
+    # Store the events for the worker pool; processing happens off the request
+    return _webhook_response(enqueue_webhook(request_body, signature))
+
+
+async def line_webhook_async(request):
+    """Handle LINE Messaging API webhook without blocking the ASGI event loop."""
+    request_body, signature, error = _read_webhook(request)
+    if error:
+        return error
+    
+    return _webhook_response(await run_orm(enqueue_webhook, request_body, signature))
+
+
+# csrf_exempt only wraps sync views in Django 4.2
+line_webhook_async.csrf_exempt = True
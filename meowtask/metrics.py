@@ -0,0 +1,46 @@
+"""
+Lightweight in-process metrics for MeowTask.
+
+Subsystems register a callable that returns a dict of current values, and
+``collect()`` gathers them all for the metrics endpoint.
+"""
+
+import threading
+
+
+_sources = {}
+
+
+class Counters:
+    """Thread-safe named integer counters for one subsystem."""
+
+    def __init__(self, *names):
+        self._lock = threading.Lock()
+        self._names = names
+        self._values = dict.fromkeys(names, 0)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def get(self, name):
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values = dict.fromkeys(self._names, 0)
+
+
+def register(name, source):
+    """Register a callable returning a dict of metric values under ``name``."""
+    _sources[name] = source
+
+
+def collect():
+    """Return the current values of every registered metric source."""
+    return {name: source() for name, source in _sources.items()}
@@ -33,6 +33,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Third party apps
     'rest_framework',
@@ -40,7 +41,7 @@ INSTALLED_APPS = [
     # Project apps
     'users',
     'tasks',
-    'linebot',
+    'linebot_core',
 ]
 
 MIDDLEWARE = [
@@ -135,10 +136,87 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Windowed leaderboard settings: buckets kept by compact_exp_rollups
+LEADERBOARD_ROLLUP_WEEKS = int(os.getenv('LEADERBOARD_ROLLUP_WEEKS', '12'))
+LEADERBOARD_ROLLUP_MONTHS = int(os.getenv('LEADERBOARD_ROLLUP_MONTHS', '24'))
+
+# Write-behind EXP settings: credits buffered in PendingExp and merged by run_exp_flusher
+USER_EXP_WRITE_BEHIND = os.getenv('USER_EXP_WRITE_BEHIND', 'False') == 'True'
+USER_EXP_FLUSH_INTERVAL = float(os.getenv('USER_EXP_FLUSH_INTERVAL', '5'))  # seconds
+USER_EXP_FLUSH_BATCH = int(os.getenv('USER_EXP_FLUSH_BATCH', '1000'))
+
+# User lookup cache settings (by LINE ID); use a shared cache when running webhook workers
+USER_CACHE_ALIAS = os.getenv('USER_CACHE_ALIAS', 'default')
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '60'))  # seconds, 0 disables the cache
+
 # LINE Bot settings
 LINE_CHANNEL_SECRET = os.getenv('LINE_CHANNEL_SECRET', '')
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv('LINE_CHANNEL_ACCESS_TOKEN', '')
 
+# LINE webhook queue settings
+LINE_WEBHOOK_WORKERS = int(os.getenv('LINE_WEBHOOK_WORKERS', '4'))
+LINE_WEBHOOK_BATCH_SIZE = int(os.getenv('LINE_WEBHOOK_BATCH_SIZE', '50'))
+LINE_WEBHOOK_MAX_ATTEMPTS = int(os.getenv('LINE_WEBHOOK_MAX_ATTEMPTS', '3'))
+LINE_WEBHOOK_CLAIM_TIMEOUT = int(os.getenv('LINE_WEBHOOK_CLAIM_TIMEOUT', '300'))  # seconds
+LINE_WEBHOOK_DEDUP_CACHE_SIZE = int(os.getenv('LINE_WEBHOOK_DEDUP_CACHE_SIZE', '50000'))
+LINE_WEBHOOK_DEDUP_TTL = int(os.getenv('LINE_WEBHOOK_DEDUP_TTL', '86400'))  # seconds
+
+# LINE profile cache settings
+LINE_PROFILE_CACHE_BACKEND = os.getenv('LINE_PROFILE_CACHE_BACKEND', 'memory')  # 'memory' or 'django'
+LINE_PROFILE_CACHE_ALIAS = os.getenv('LINE_PROFILE_CACHE_ALIAS', 'default')
+LINE_PROFILE_CACHE_TTL = int(os.getenv('LINE_PROFILE_CACHE_TTL', '3600'))  # seconds
+LINE_PROFILE_CACHE_REFRESH_AFTER = int(os.getenv('LINE_PROFILE_CACHE_REFRESH_AFTER', '2700'))  # seconds
+LINE_PROFILE_CACHE_MAX_SIZE = int(os.getenv('LINE_PROFILE_CACHE_MAX_SIZE', '10000'))
+
+# LINE push notification dispatcher settings
+LINE_NOTIFICATION_WORKERS = int(os.getenv('LINE_NOTIFICATION_WORKERS', '2'))
+LINE_NOTIFICATION_BATCH_SIZE = int(os.getenv('LINE_NOTIFICATION_BATCH_SIZE', '100'))  # recipients per claim
+LINE_NOTIFICATION_CLAIM_TIMEOUT = int(os.getenv('LINE_NOTIFICATION_CLAIM_TIMEOUT', '300'))  # seconds
+LINE_NOTIFICATION_COALESCE_WINDOW = int(os.getenv('LINE_NOTIFICATION_COALESCE_WINDOW', '5'))  # seconds
+LINE_NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('LINE_NOTIFICATION_MAX_ATTEMPTS', '5'))
+LINE_NOTIFICATION_BACKOFF_BASE = float(os.getenv('LINE_NOTIFICATION_BACKOFF_BASE', '2'))  # seconds
+LINE_NOTIFICATION_BACKOFF_MAX = float(os.getenv('LINE_NOTIFICATION_BACKOFF_MAX', '300'))  # seconds
+LINE_NOTIFICATION_RETENTION = int(os.getenv('LINE_NOTIFICATION_RETENTION', '604800'))  # seconds sent/failed rows are kept
+LINE_PUSH_RATE_LIMIT = int(os.getenv('LINE_PUSH_RATE_LIMIT', '2000'))  # requests per second
+
+# Async LINE client settings (used under ASGI and by run_webhook_workers --async)
+LINE_ASYNC = os.getenv('LINE_ASYNC', 'False') == 'True'
+LINE_ASYNC_CONCURRENCY = int(os.getenv('LINE_ASYNC_CONCURRENCY', '200'))
+LINE_ASYNC_POOL_SIZE = int(os.getenv('LINE_ASYNC_POOL_SIZE', '100'))
+LINE_ASYNC_KEEPALIVE = int(os.getenv('LINE_ASYNC_KEEPALIVE', '30'))  # seconds
+LINE_ASYNC_TIMEOUT = int(os.getenv('LINE_ASYNC_TIMEOUT', '10'))  # seconds
+LINE_ASYNC_ORM_THREADS = int(os.getenv('LINE_ASYNC_ORM_THREADS', '16'))
+
+# Nearby task search settings
+TASK_NEARBY_RADIUS = int(os.getenv('TASK_NEARBY_RADIUS', '2000'))  # metres
+TASK_NEARBY_MAX_RADIUS = int(os.getenv('TASK_NEARBY_MAX_RADIUS', '50000'))  # metres
+
+# Open-task feed cache settings
+TASK_FEED_CACHE_ALIAS = os.getenv('TASK_FEED_CACHE_ALIAS', 'default')
+TASK_FEED_CACHE_TTL = int(os.getenv('TASK_FEED_CACHE_TTL', '60'))  # seconds, 0 disables the cache
+
+# Batch task creation settings
+TASK_BATCH_MAX_SIZE = int(os.getenv('TASK_BATCH_MAX_SIZE', '1000'))  # tasks per request
+TASK_BATCH_CHUNK_SIZE = int(os.getenv('TASK_BATCH_CHUNK_SIZE', '200'))  # rows per INSERT
+
+# Task expiry sweeper settings
+TASK_EXPIRY_BATCH_SIZE = int(os.getenv('TASK_EXPIRY_BATCH_SIZE', '500'))
+TASK_EXPIRY_INTERVAL = int(os.getenv('TASK_EXPIRY_INTERVAL', '60'))  # seconds
+
+# Live task feed settings (Server-Sent Events, ASGI only)
+TASK_LIVE = os.getenv('TASK_LIVE', 'False') == 'True'
+TASK_LIVE_CHANNEL = os.getenv('TASK_LIVE_CHANNEL', 'task_live')  # PostgreSQL NOTIFY channel
+TASK_LIVE_QUEUE_SIZE = int(os.getenv('TASK_LIVE_QUEUE_SIZE', '100'))  # events buffered per client
+TASK_LIVE_HEARTBEAT = int(os.getenv('TASK_LIVE_HEARTBEAT', '15'))  # seconds
+TASK_LIVE_MAX_AGE = int(os.getenv('TASK_LIVE_MAX_AGE', '300'))  # seconds before a client reconnects
+
+# Delta sync settings
+TASK_CHANGES_BATCH = int(os.getenv('TASK_CHANGES_BATCH', '100'))  # changes per response by default
+TASK_CHANGES_MAX_BATCH = int(os.getenv('TASK_CHANGES_MAX_BATCH', '500'))
+
+# Task search settings
+TASK_SEARCH_MAX_QUERY_LENGTH = int(os.getenv('TASK_SEARCH_MAX_QUERY_LENGTH', '100'))  # characters
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
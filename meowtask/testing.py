@@ -0,0 +1,58 @@
+"""
+Test helpers shared by the MeowTask apps.
+"""
+
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+
+def create_task(poster, title='Task', description='Test', location='Taipei', hours=24, **fields):
+    """Create a task by ``poster``, due ``hours`` from now unless ``time`` is given."""
+    from tasks.models import Task
+
+    fields.setdefault('time', timezone.now() + timedelta(hours=hours))
+    return Task.objects.create(
+        title=title, description=description, location=location, poster=poster, **fields
+    )
+
+
+class QueryBudgetMixin:
+    """
+    Assertions that pin a block of code to a fixed number of queries.
+
+    Use ``assertQueryBudget`` around a request to fail as soon as it runs
+    more queries than budgeted, and ``assertConstantQueries`` to check the
+    count does not grow with the number of rows returned.
+    """
+
+    @contextmanager
+    def assertQueryBudget(self, budget, using='default'):
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(
+                f"{i}. {query['sql']}" for i, query in enumerate(context.captured_queries, 1)
+            )
+            self.fail(f"{executed} queries executed, budget is {budget}:\n{queries}")
+
+    def assertConstantQueries(self, budget, func, grow, using='default'):
+        """
+        Run ``func`` before and after ``grow`` adds rows, within ``budget`` both times.
+        """
+        with self.assertQueryBudget(budget, using) as before:
+            func()
+        grow()
+        with self.assertQueryBudget(budget, using) as after:
+            func()
+
+        self.assertEqual(
+            len(before.captured_queries),
+            len(after.captured_queries),
+            "Query count changed with the number of rows"
+        )
@@ -5,9 +5,12 @@ URL configuration for meowtask project.
 from django.contrib import admin
 from django.urls import path, include
 
+from .views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/', include('users.urls')),
     path('api/tasks/', include('tasks.urls')),
     path('webhook/', include('linebot_core.urls')),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
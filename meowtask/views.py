@@ -0,0 +1,13 @@
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .metrics import collect
+
+
+class MetricsView(APIView):
+    """Expose in-process metrics (queue depth, cache hit ratios, ...) to staff."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(collect())
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_migrate, pre_delete
 
 
 class TasksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'tasks'
\ No newline at end of file
+    name = 'tasks'
+
+    def ready(self):
+        # PostgreSQL-only search column and indexes, see tasks.search
+        from .search import install
+        post_migrate.connect(install, sender=self)
+
+        # Triggers stamping the delta sync sequence, see tasks.changes
+        from . import changes
+        post_migrate.connect(changes.install, sender=self)
+
+        # Tombstones and events for every deleted task, see tasks.changes
+        from .models import Task, task_deleted, task_deleting
+        pre_delete.connect(task_deleting, sender=Task)
+        post_delete.connect(task_deleted, sender=Task)
+
+        # Register expiry metrics with the project-wide collector
+        from . import expiry  # noqa: F401
\ No newline at end of file
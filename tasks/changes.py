@@ -0,0 +1,148 @@
+"""
+Delta sync: the task changes since a cursor.
+
+Apps coming back from the background used to download the whole task feed
+again. ``/api/tasks/changes/?since=<cursor>`` instead returns what changed
+in the open feed since the app last synced: tasks to add or update, and
+tombstones for tasks that left it (taken, done, expired or deleted).
+
+Every write to a task, however it is made (``save``, queryset updates, bulk
+inserts), and every ``DeletedTask`` tombstone gets a ``change_seq`` from a
+database trigger that ``install`` creates. Changes are ordered by
+``(change_seq, id)``, which ``task_change_idx`` and ``deleted_task_sync_idx``
+index, and both tables are read in one ``UNION ALL`` query, so an app that
+is already up to date costs one query of two empty index probes.
+
+A cursor must never move past a change that has yet to commit. On
+PostgreSQL the trigger stamps the id of the writing transaction, and only
+ids below the ``xmin`` of the reading snapshot are handed out: every
+transaction below it has finished, so nothing can still commit behind the
+cursor, however long a transaction ran or whatever its host's clock said.
+A long-running transaction holds the feed back until it ends, but loses
+nothing. On SQLite, writers hold the database lock until they commit, so
+the trigger stamps a counter in commit order. Other databases are not
+supported.
+"""
+
+import json
+from base64 import urlsafe_b64decode
+from collections import namedtuple
+
+from django.db import connections
+from django.db.models import BigIntegerField, BooleanField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import DeletedTask, Task
+from .pagination import Cursor, cursor_token
+
+Change = namedtuple('Change', ['seq', 'pk', 'deleted'])
+
+# Lowest transaction id that may still be running, as of the query's snapshot
+PG_HORIZON = 'pg_snapshot_xmin(pg_current_snapshot())::text::bigint'
+
+SQLITE_COUNTER = 'task_change_counter'
+
+
+def encode(seq, pk):
+    return cursor_token(Cursor(seq, pk, False))
+
+
+def decode(token):
+    """``(seq, pk)`` of a cursor token; raises ValueError if it is malformed."""
+    try:
+        seq, pk, _ = json.loads(urlsafe_b64decode(token.encode()))
+        if not isinstance(seq, int):
+            raise TypeError
+        return seq, int(pk)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def current_cursor(using='default'):
+    """A cursor for "now", to start syncing from before loading the feed."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'SELECT {PG_HORIZON}')
+        else:
+            cursor.execute(f'SELECT value + 1 FROM {SQLITE_COUNTER}')
+        # Every change below this has committed and is in the feed loaded next
+        (boundary,) = cursor.fetchone()
+    return encode(boundary, 0)
+
+
+def _after(pk_field, seq, pk, vendor):
+    # The inclusive bound keeps the index range scan; the OR breaks ties
+    after = Q(change_seq__gte=seq) & (Q(change_seq__gt=seq) | Q(**{f'{pk_field}__gt': pk}))
+    if vendor == 'postgresql':
+        after &= Q(change_seq__lt=RawSQL(PG_HORIZON, [], output_field=BigIntegerField()))
+    return after
+
+
+def changes_after(seq, pk, using='default'):
+    """Committed changes after ``(seq, pk)`` as ``(seq, pk, deleted)`` rows, in order."""
+    vendor = connections[using].vendor
+    tasks = Task.objects.using(using).filter(
+        _after('id', seq, pk, vendor)
+    ).order_by().values_list('change_seq', 'id', Value(False, output_field=BooleanField()))
+    deleted = DeletedTask.objects.using(using).filter(
+        _after('task_id', seq, pk, vendor)
+    ).order_by().values_list('change_seq', 'task_id', Value(True, output_field=BooleanField()))
+
+    return tasks.union(deleted, all=True).order_by('change_seq', 'id')
+
+
+def changes_since(seq, pk, limit):
+    """
+    Up to ``limit`` changes after ``(seq, pk)``, oldest first, and whether
+    more are waiting.
+    """
+    rows = [Change(*row) for row in changes_after(seq, pk)[:limit + 1]]
+    return rows[:limit], len(rows) > limit
+
+
+def install(using='default', **kwargs):
+    """
+    Create the triggers that stamp ``change_seq``, if they are missing.
+
+    Connected to ``post_migrate``; does nothing on other databases.
+    """
+    connection = connections[using]
+    tables = [connection.ops.quote_name(model._meta.db_table) for model in (Task, DeletedTask)]
+
+    if connection.vendor == 'postgresql':
+        statements = [
+            'CREATE OR REPLACE FUNCTION task_change_seq() RETURNS trigger AS $$ '
+            'BEGIN NEW.change_seq := pg_current_xact_id()::text::bigint; RETURN NEW; END '
+            '$$ LANGUAGE plpgsql',
+        ]
+        for table in tables:
+            statements += [
+                f'DROP TRIGGER IF EXISTS task_change_seq ON {table}',
+                f'CREATE TRIGGER task_change_seq BEFORE INSERT OR UPDATE ON {table} '
+                f'FOR EACH ROW EXECUTE FUNCTION task_change_seq()',
+            ]
+    elif connection.vendor == 'sqlite':
+        statements = [
+            f'CREATE TABLE IF NOT EXISTS {SQLITE_COUNTER} '
+            f'(id INTEGER PRIMARY KEY CHECK (id = 1), value INTEGER NOT NULL)',
+            f'INSERT OR IGNORE INTO {SQLITE_COUNTER} (id, value) VALUES (1, 0)',
+        ]
+        for model, table in zip((Task, DeletedTask), tables):
+            pk = connection.ops.quote_name(model._meta.pk.column)
+            for event in ('INSERT', 'UPDATE'):
+                # Triggers do not fire themselves again unless recursive_triggers is on
+                statements.append(
+                    f'CREATE TRIGGER IF NOT EXISTS {model._meta.db_table}_change_seq_{event.lower()} '
+                    f'AFTER {event} ON {table} BEGIN '
+                    f'UPDATE {SQLITE_COUNTER} SET value = value + 1; '
+                    f'UPDATE {table} SET change_seq = (SELECT value FROM {SQLITE_COUNTER}) '
+                    f'WHERE {pk} = NEW.{pk}; '
+                    f'END'
+                )
+    else:
+        return
+
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
@@ -0,0 +1,102 @@
+"""
+Expiry of open tasks whose time has passed.
+
+Past-due open tasks used to stay ``open`` forever, so every open feed had to
+filter them out and they piled up in the open-status partial indexes. The
+sweeper moves them to ``expired`` in bounded batches; each batch locks its
+rows with ``SKIP LOCKED``, so several sweepers, and a user taking one of the
+tasks at the same moment, never wait on each other.
+
+Run it with ``python manage.py expire_tasks``. Feeds keep their
+``time >= now`` guard, which costs nothing on the ``(time, id)`` partial
+index and hides tasks that expired since the last sweep.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from meowtask import metrics
+
+from . import feed_cache, live
+from .models import Task, TimelineEntry
+
+counters = metrics.Counters('runs', 'expired')
+
+
+def past_due():
+    """Open tasks whose time has passed, oldest first."""
+    return Task.objects.filter(
+        status=Task.TaskStatus.OPEN,
+        time__lt=timezone.now()
+    ).order_by('time', 'id')
+
+
+def expire_batch(batch_size=None):
+    """Expire up to ``batch_size`` past-due tasks. Returns how many were expired."""
+    batch_size = batch_size or settings.TASK_EXPIRY_BATCH_SIZE
+    now = timezone.now()
+
+    with transaction.atomic():
+        tasks = list(
+            past_due()
+            .select_for_update(skip_locked=True)
+            .only(*live.FIELDS)[:batch_size]
+        )
+        if not tasks:
+            return 0
+        ids = [task.pk for task in tasks]
+
+        Task.objects.filter(id__in=ids).update(
+            status=Task.TaskStatus.EXPIRED,
+            updated_at=now,
+            version=F('version') + 1
+        )
+        TimelineEntry.objects.filter(task_id__in=ids).update(
+            status=Task.TaskStatus.EXPIRED,
+            updated_at=now
+        )
+        feed_cache.bump()
+
+        for task in tasks:
+            task.status = Task.TaskStatus.EXPIRED
+            task.version += 1
+        live.publish('expired', *tasks)
+
+    counters.incr('expired', len(ids))
+    return len(ids)
+
+
+def sweep(batch_size=None, max_batches=None):
+    """
+    Expire past-due tasks batch by batch until none are left, or until
+    ``max_batches`` batches. Returns the number of tasks expired.
+    """
+    expired = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = expire_batch(batch_size)
+        expired += count
+        batches += 1
+        if not count:
+            break
+    counters.incr('runs')
+    return expired
+
+
+def lag():
+    """Seconds since the time of the oldest task still waiting to expire, or 0."""
+    oldest = past_due().values_list('time', flat=True).first()
+    if oldest is None:
+        return 0.0
+    return round((timezone.now() - oldest).total_seconds(), 1)
+
+
+def expiry_stats():
+    return {
+        'lag_seconds': lag(),
+        **counters.snapshot(),
+    }
+
+
+metrics.register('task_expiry', expiry_stats)
@@ -0,0 +1,107 @@
+"""
+Read-through cache for the open-task feed.
+
+The task list and the bot's task carousel are read far more often than
+tasks change, yet every caller used to query and serialize the same rows.
+Built feed pages are now cached, keyed by the request that produced them
+and a global feed version.
+
+Writes that change the feed (creating or editing a task, ``Task.take``,
+``Task.complete``, deletion, and changes to the poster and taker fields
+embedded in each task: ``User.save``/``delete``, ``credit_exp``,
+``recompute_levels``) call ``bump``, which increments the version:
+every cached page becomes unreachable at once, without finding or deleting
+any key, and old pages expire on their own. The version is bumped both at
+the write and again once its transaction commits, so a page rebuilt from
+not-yet-committed data in between is dropped too.
+
+Feeds hide tasks whose time has passed, which happens without any write;
+``TASK_FEED_CACHE_TTL`` bounds how long such a task can linger.
+
+The version lives in the ``TASK_FEED_CACHE_ALIAS`` cache. Its default,
+local memory, is per process, so deployments running webhook workers or
+several web processes need a shared cache (Redis, memcached) there.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from meowtask import metrics
+
+VERSION_KEY = 'task_feed:version'
+
+counters = metrics.Counters('hits', 'misses', 'bumps', 'rebuild_us')
+
+
+def _cache():
+    return caches[settings.TASK_FEED_CACHE_ALIAS]
+
+
+def version():
+    """The current feed version."""
+    cache = _cache()
+    current = cache.get(VERSION_KEY)
+    if current is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        current = cache.get(VERSION_KEY, 1)
+    return current
+
+
+def _incr():
+    cache = _cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # Evicted or never read: any new value invalidates the old pages
+        cache.add(VERSION_KEY, 1, timeout=None)
+    counters.incr('bumps')
+
+
+def bump():
+    """Invalidate every cached feed page; call after changing a task or a user it shows."""
+    _incr()
+    transaction.on_commit(_incr)
+
+
+def get_or_build(feed, key, build):
+    """
+    Return the cached page of ``feed`` for ``key``, calling ``build`` on a miss.
+
+    ``key`` is any string identifying the page within the feed (typically
+    the request URL); ``build`` must return something picklable.
+    """
+    if not settings.TASK_FEED_CACHE_TTL:
+        return build()
+
+    cache = _cache()
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    cache_key = f'task_feed:{version()}:{feed}:{digest}'
+
+    page = cache.get(cache_key)
+    if page is not None:
+        counters.incr('hits')
+        return page
+
+    counters.incr('misses')
+    started = time.perf_counter()
+    page = build()
+    counters.incr('rebuild_us', int((time.perf_counter() - started) * 1e6))
+    cache.set(cache_key, page, timeout=settings.TASK_FEED_CACHE_TTL)
+    return page
+
+
+def cache_stats():
+    stats = counters.snapshot()
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    rebuild_us = stats.pop('rebuild_us')
+    stats['rebuild_ms_avg'] = round(rebuild_us / stats['misses'] / 1000, 2) if stats['misses'] else 0.0
+    stats['version'] = version()
+    return stats
+
+
+metrics.register('task_feed_cache', cache_stats)
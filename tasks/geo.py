@@ -0,0 +1,144 @@
+"""
+Geohash helpers for the nearby task search.
+
+Each task with coordinates stores its geohash, a base32 string whose
+prefixes name ever smaller grid cells. All tasks inside a cell share that
+cell's prefix, so they form one contiguous range in a plain B-tree index on
+the geohash column. A radius search becomes:
+
+1. cover the search circle's bounding box with a few cells,
+2. range-scan the index for each cell (``covering_ranges``),
+3. compute the exact distance of each candidate and drop those outside.
+
+No spatial database extension is needed.
+"""
+
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# Stored precision: cells of about 4.8m x 4.8m
+GEOHASH_PRECISION = 9
+
+# Finest precision whose cover of the search area needs at most this many cells
+MAX_COVER_CELLS = 32
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def encode(lat, lng, precision=GEOHASH_PRECISION):
+    """Geohash of the cell of ``precision`` characters containing the point."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits, value, even = 0, 0, True
+
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        interval, coordinate = (lng_range, lng) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        if coordinate >= middle:
+            value = value * 2 + 1
+            interval[0] = middle
+        else:
+            value = value * 2
+            interval[1] = middle
+        even = not even
+
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """``(height, width)`` in degrees of the cells at ``precision``."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def distance(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres (haversine)."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lng, radius):
+    """``(south, west, north, east)`` of a box containing the circle, in degrees."""
+    d_lat = math.degrees(radius / EARTH_RADIUS_M)
+    cos_lat = math.cos(math.radians(lat))
+    d_lng = 180.0 if cos_lat < 1e-9 else min(180.0, d_lat / cos_lat)
+    return (
+        max(-90.0, lat - d_lat),
+        lng - d_lng,
+        min(90.0, lat + d_lat),
+        lng + d_lng,
+    )
+
+
+def covering_cells(lat, lng, radius):
+    """
+    Geohash cells that together cover the circle's bounding box.
+
+    Uses the finest precision that needs at most ``MAX_COVER_CELLS`` cells,
+    so candidates stay close to the circle without too many index ranges.
+    """
+    south, west, north, east = bounding_box(lat, lng, radius)
+
+    cells = None
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        finer = _cells_in_box(south, west, north, east, precision)
+        if finer is None:
+            break
+        cells = finer
+    return cells
+
+
+def _cells_in_box(south, west, north, east, precision):
+    height, width = cell_size(precision)
+    rows = range(math.floor((south + 90) / height), math.floor((north + 90) / height) + 1)
+    columns = range(math.floor((west + 180) / width), math.floor((east + 180) / width) + 1)
+    if len(rows) * len(columns) > MAX_COVER_CELLS:
+        return None
+
+    cells = set()
+    for row in rows:
+        center_lat = min(90.0, (row + 0.5) * height - 90)
+        for column in columns:
+            # Wrap around the antimeridian
+            center_lng = ((column + 0.5) * width) % 360.0 - 180
+            cells.add(encode(center_lat, center_lng, precision))
+    return sorted(cells)
+
+
+def covering_ranges(lat, lng, radius):
+    """
+    ``(start, stop)`` geohash ranges covering the circle, with start inclusive.
+    ``stop`` is None for a range that runs to the end of the index.
+
+    Cells that are next to each other in geohash order are merged into one
+    range, so the database scans fewer index ranges.
+    """
+    ranges = []
+    for cell in covering_cells(lat, lng, radius):
+        start, stop = cell, _successor(cell)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], stop)
+        else:
+            ranges.append((start, stop))
+    return ranges
+
+
+def _successor(cell):
+    """The smallest geohash after every hash starting with ``cell``, if any."""
+    while cell and cell[-1] == BASE32[-1]:
+        cell = cell[:-1]
+    if not cell:
+        return None
+    return cell[:-1] + BASE32[BASE32.index(cell[-1]) + 1]
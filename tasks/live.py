@@ -0,0 +1,228 @@
+"""
+Live task feed over Server-Sent Events.
+
+Clients used to poll the task list every few seconds to catch new and taken
+tasks. Under ASGI they can instead keep ``/api/tasks/live/`` open and
+receive every task change as an event: ``created``, ``updated``, ``taken``,
+``completed``, ``expired`` or ``deleted``, with the task's feed fields.
+
+Task writes call ``publish``. On PostgreSQL it sends a ``NOTIFY`` on
+``TASK_LIVE_CHANNEL``, which the database delivers when the transaction
+commits, so changes made by any process (web, webhook workers, the expiry
+sweeper) reach every ASGI process. Each process holds one ``LISTEN``
+connection, on a thread started by its first subscriber. Other databases
+only deliver changes made in the same process, after commit.
+
+Each process has one ``Hub``. A notification is decoded and encoded as an
+SSE frame once, then offered to the queue of every subscriber whose filter
+matches, so fan-out costs no queries and no per-connection encoding. A
+subscriber whose queue fills up (a client that stopped reading) is dropped
+and has to reconnect.
+
+Django 4.2 does not tell a streaming response that its client went away, so
+streams end after ``TASK_LIVE_MAX_AGE`` and clients reconnect; that bounds
+how long a dead connection holds its subscription.
+"""
+
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from meowtask import metrics
+
+from . import geo
+
+logger = logging.getLogger(__name__)
+
+# Task fields sent with each event: what a feed row shows, without the
+# unbounded description (NOTIFY payloads are limited to 8000 bytes)
+FIELDS = ('id', 'title', 'reward', 'location', 'latitude', 'longitude', 'time', 'status', 'version')
+
+# Status a task had before each transition, so subscribers filtering on it
+# learn that the task left their feed
+PREVIOUS_STATUS = {'taken': 'open', 'completed': 'taken', 'expired': 'open'}
+
+counters = metrics.Counters('published', 'delivered', 'dropped')
+
+
+def event_for(kind, task):
+    return {
+        'event': kind,
+        'previous_status': PREVIOUS_STATUS.get(kind),
+        'task': {field: getattr(task, field) for field in FIELDS},
+    }
+
+
+def publish(kind, *tasks, using=DEFAULT_DB_ALIAS):
+    """Send a ``kind`` event for each of ``tasks`` once the current transaction commits."""
+    if not settings.TASK_LIVE or not tasks:
+        return
+
+    payloads = [json.dumps(event_for(kind, task), cls=DjangoJSONEncoder) for task in tasks]
+    counters.incr('published', len(payloads))
+
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+                [settings.TASK_LIVE_CHANNEL, payloads]
+            )
+    else:
+        transaction.on_commit(lambda: hub.dispatch(*payloads), using=using)
+
+
+class Subscription:
+    """One connected client: its filter and its queue of encoded frames."""
+
+    __slots__ = ('queue', 'statuses', 'lat', 'lng', 'radius')
+
+    def __init__(self, statuses=None, lat=None, lng=None, radius=None):
+        self.queue = asyncio.Queue(maxsize=settings.TASK_LIVE_QUEUE_SIZE)
+        self.statuses = frozenset(statuses or ())
+        self.lat, self.lng, self.radius = lat, lng, radius
+
+    def matches(self, event):
+        task = event['task']
+        if self.statuses and not (
+            task['status'] in self.statuses or event['previous_status'] in self.statuses
+        ):
+            return False
+        if self.radius is not None:
+            if task['latitude'] is None:
+                return False
+            return geo.distance(self.lat, self.lng, task['latitude'], task['longitude']) <= self.radius
+        return True
+
+
+class Hub:
+    """Fans events out to the subscribers of one process, on its event loop."""
+
+    def __init__(self):
+        self.subscribers = set()
+        self.loop = None
+        self._listener = None
+
+    def subscribe(self, **filters):
+        """Register a subscriber; must be called on the event loop serving it."""
+        if not self.subscribers:
+            self.loop = asyncio.get_running_loop()
+        subscription = Subscription(**filters)
+        self.subscribers.add(subscription)
+        self._ensure_listener()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def dispatch(self, *payloads):
+        """Hand JSON event payloads to the loop; safe to call from any thread."""
+        loop = self.loop
+        if loop is None or loop.is_closed() or not self.subscribers:
+            return
+        loop.call_soon_threadsafe(self.fan_out, payloads)
+
+    def fan_out(self, payloads):
+        for payload in payloads:
+            event = json.loads(payload)
+            frame = f"event: {event['event']}\ndata: {payload}\n\n".encode()
+            for subscription in list(self.subscribers):
+                if not subscription.matches(event):
+                    continue
+                try:
+                    subscription.queue.put_nowait(frame)
+                    counters.incr('delivered')
+                except asyncio.QueueFull:
+                    self.drop(subscription)
+
+    def drop(self, subscription):
+        """Disconnect a subscriber that is not keeping up."""
+        self.unsubscribe(subscription)
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(None)
+        counters.incr('dropped')
+
+    def _ensure_listener(self):
+        if self._listener is not None and self._listener.is_alive():
+            return
+        if connections[DEFAULT_DB_ALIAS].vendor != 'postgresql':
+            return
+        self._listener = Listener(self)
+        self._listener.start()
+
+
+class Listener(threading.Thread):
+    """Receives the task notifications of every process over PostgreSQL ``LISTEN``."""
+
+    def __init__(self, hub, using=DEFAULT_DB_ALIAS):
+        super().__init__(name='task-live-listener', daemon=True)
+        self.hub = hub
+        self.using = using
+
+    def run(self):
+        while True:
+            try:
+                self.listen()
+            except Exception:
+                # Changes made while reconnecting are missed; clients catch up
+                # when they next reload the feed
+                logger.exception("Task live listener failed, reconnecting")
+                time.sleep(1)
+            finally:
+                connections[self.using].close()
+
+    def listen(self):
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN {connection.ops.quote_name(settings.TASK_LIVE_CHANNEL)}')
+        raw = connection.connection
+
+        while True:
+            if select.select([raw], [], [], 60) == ([], [], []):
+                continue
+            raw.poll()
+            if raw.notifies:
+                payloads = [notify.payload for notify in raw.notifies]
+                raw.notifies.clear()
+                self.hub.dispatch(*payloads)
+
+
+hub = Hub()
+
+
+async def stream(subscription):
+    """SSE body for ``subscription``: its frames, with heartbeats while idle."""
+    deadline = time.monotonic() + settings.TASK_LIVE_MAX_AGE
+    try:
+        yield b'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            try:
+                frame = await asyncio.wait_for(
+                    subscription.queue.get(), settings.TASK_LIVE_HEARTBEAT
+                )
+            except asyncio.TimeoutError:
+                yield b': keep-alive\n\n'
+                continue
+            if frame is None:
+                return
+            yield frame
+    finally:
+        hub.unsubscribe(subscription)
+
+
+def live_stats():
+    return {
+        'subscribers': len(hub.subscribers),
+        **counters.snapshot(),
+    }
+
+
+metrics.register('task_live', live_stats)
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tasks.models import Task, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuild the my-tasks timeline entries from the tasks, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Tasks rebuilt per transaction."
+        )
+        parser.add_argument(
+            '--start-id', type=int, default=0,
+            help="Resume from this task id (the last id a previous run reported)."
+        )
+        parser.add_argument(
+            '--pause', type=float, default=0.0,
+            help="Seconds to sleep between batches, to leave room for live traffic."
+        )
+
+    def handle(self, *args, **options):
+        last_id = options['start_id']
+        total = 0
+        started = time.perf_counter()
+
+        while True:
+            # Walk the primary key, so each batch is an index range scan
+            tasks = list(
+                Task.objects.filter(pk__gt=last_id)
+                .order_by('pk')
+                .only('id', 'poster', 'taker', 'status', 'updated_at')[:options['batch_size']]
+            )
+            if not tasks:
+                break
+
+            entries = [entry for task in tasks for entry in TimelineEntry.objects.entries_for(task)]
+            with transaction.atomic():
+                TimelineEntry.objects.filter(task__in=tasks).delete()
+                TimelineEntry.objects.bulk_create(entries)
+
+            last_id = tasks[-1].pk
+            total += len(tasks)
+            self.stdout.write(f"Rebuilt {total} tasks ({len(entries)} entries), last id {last_id}")
+
+            if options['pause']:
+                time.sleep(options['pause'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Backfilled {total} tasks in {time.perf_counter() - started:.1f}s"
+        ))
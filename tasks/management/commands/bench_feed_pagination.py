@@ -0,0 +1,97 @@
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from tasks.models import Task
+from tasks.pagination import Cursor, KeysetPagination, cursor_token
+from tasks.views import TaskListCreateView
+from users.models import User
+
+PAGE_SIZE = 10
+
+
+class Command(BaseCommand):
+    help = "Compare task list latency by page depth for page-number and keyset pagination."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tasks', type=int, default=100000,
+            help="Number of tasks to seed."
+        )
+        parser.add_argument(
+            '--pages', type=int, nargs='+', default=[1, 10, 100, 1000, 5000],
+            help="Page numbers to measure."
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help="Requests per page and paginator; the median is reported."
+        )
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        self.user = User.objects.create(line_id=f'bench-poster-{run_id}', display_name='Bench Poster')
+        self.factory = APIRequestFactory()
+
+        now = timezone.now()
+        Task.objects.bulk_create([
+            Task(
+                title=f'Bench task {i}',
+                description='Benchmark task',
+                location='Benchmark',
+                # A few tasks per minute, so the keyset tie-breaker is exercised
+                time=now + timezone.timedelta(days=1, minutes=i // 3),
+                poster=self.user
+            )
+            for i in range(options['tasks'])
+        ], batch_size=5000)
+
+        views = {
+            'page-number': TaskListCreateView.as_view(pagination_class=PageNumberPagination),
+            'keyset': TaskListCreateView.as_view(pagination_class=KeysetPagination),
+        }
+
+        try:
+            self.stdout.write(f"{'page':>8} {'page-number':>14} {'keyset':>14}")
+            for page in options['pages']:
+                if (page - 1) * PAGE_SIZE >= Task.objects.upcoming().count():
+                    continue
+                results = {
+                    name: self.measure(view, self.query_for(name, page), options['repeat'])
+                    for name, view in views.items()
+                }
+                self.stdout.write(
+                    f"{page:>8} {results['page-number']:>12.2f}ms {results['keyset']:>12.2f}ms"
+                )
+        finally:
+            Task.objects.filter(poster=self.user).delete()
+            self.user.delete()
+
+    def query_for(self, paginator, page):
+        """Query string that opens ``page`` of the task list with ``paginator``."""
+        if paginator == 'page-number':
+            return {'page': page}
+        if page == 1:
+            return {}
+
+        # The cursor a client would hold after scrolling to this page; finding
+        # it uses OFFSET once, outside the timed requests.
+        previous = Task.objects.upcoming().order_by('-time', '-id')[(page - 1) * PAGE_SIZE - 1]
+        time_field = Task._meta.get_field('time')
+        cursor = Cursor(time_field.value_to_string(previous), previous.pk, False)
+        return {'cursor': cursor_token(cursor)}
+
+    def measure(self, view, query, repeat):
+        latencies = []
+        for _ in range(repeat):
+            request = self.factory.get('/api/tasks/', query)
+            force_authenticate(request, self.user)
+            started = time.perf_counter()
+            response = view(request)
+            response.render()
+            latencies.append((time.perf_counter() - started) * 1000)
+        return statistics.median(latencies)
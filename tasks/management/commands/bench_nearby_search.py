@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from tasks import geo
+from tasks.management.commands.bench_take_contention import percentile
+from tasks.models import Task
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Seed open tasks with coordinates and time radius searches against them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tasks', type=int, default=1000000,
+            help="Number of open tasks to seed."
+        )
+        parser.add_argument(
+            '--area', type=float, nargs=4, default=[21.9, 120.0, 25.3, 122.0],
+            metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'),
+            help="Bounding box the tasks and search points are spread over (default: Taiwan)."
+        )
+        parser.add_argument(
+            '--radius', type=float, default=2000,
+            help="Search radius in metres."
+        )
+        parser.add_argument(
+            '--limit', type=int, default=10,
+            help="Tasks returned per search."
+        )
+        parser.add_argument(
+            '--queries', type=int, default=200,
+            help="Number of searches to time."
+        )
+        parser.add_argument(
+            '--target-ms', type=float, default=50,
+            help="p95 latency to check against."
+        )
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        poster = User.objects.create(line_id=f'bench-poster-{run_id}', display_name='Bench Poster')
+        south, west, north, east = options['area']
+        rng = random.Random(run_id)
+
+        try:
+            started = time.perf_counter()
+            self.seed(poster, options['tasks'], south, west, north, east, rng)
+            self.stdout.write(
+                f"Seeded {options['tasks']} tasks in {time.perf_counter() - started:.1f}s"
+            )
+
+            latencies, found = [], []
+            for _ in range(options['queries']):
+                lat, lng = rng.uniform(south, north), rng.uniform(west, east)
+                started = time.perf_counter()
+                tasks = Task.objects.with_users().nearest(
+                    lat, lng, options['radius'], options['limit']
+                )
+                latencies.append((time.perf_counter() - started) * 1000)
+                found.append(len(tasks))
+        finally:
+            Task.objects.filter(poster=poster).delete()
+            poster.delete()
+
+        p95 = percentile(latencies, 95)
+        summary = (
+            f"{len(latencies)} searches, radius {options['radius']:.0f}m: "
+            f"p50={percentile(latencies, 50):.2f}ms "
+            f"p95={p95:.2f}ms "
+            f"p99={percentile(latencies, 99):.2f}ms "
+            f"mean results={statistics.mean(found):.1f}"
+        )
+        if p95 <= options['target_ms']:
+            self.stdout.write(self.style.SUCCESS(summary))
+        else:
+            self.stdout.write(self.style.WARNING(f"{summary} (over {options['target_ms']:.0f}ms)"))
+
+    def seed(self, poster, count, south, west, north, east, rng):
+        when = timezone.now() + timezone.timedelta(days=1)
+        batch = []
+        for i in range(count):
+            lat, lng = rng.uniform(south, north), rng.uniform(west, east)
+            # bulk_create skips save(), so the geohash is set here
+            batch.append(Task(
+                title=f'Bench task {i}',
+                description='Benchmark task',
+                location='Benchmark',
+                time=when,
+                poster=poster,
+                latitude=lat,
+                longitude=lng,
+                geohash=geo.encode(lat, lng)
+            ))
+            if len(batch) == 5000:
+                Task.objects.bulk_create(batch)
+                batch = []
+        Task.objects.bulk_create(batch)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
@@ -0,0 +1,95 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from tasks.models import Task
+from users.models import User
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Fire concurrent takes at one task and check that exactly one wins."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--takers', type=int, default=300,
+            help="Number of users trying to take the task."
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=50,
+            help="Number of threads issuing takes at once."
+        )
+        parser.add_argument(
+            '--rounds', type=int, default=5,
+            help="Number of tasks to contend over."
+        )
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        poster = User.objects.create(line_id=f'bench-poster-{run_id}', display_name='Bench Poster')
+        takers = User.objects.bulk_create([
+            User(line_id=f'bench-taker-{run_id}-{i}', display_name=f'Bench Taker {i}')
+            for i in range(options['takers'])
+        ])
+        takers = list(User.objects.filter(line_id__startswith=f'bench-taker-{run_id}-'))
+
+        latencies = []
+        try:
+            for round_number in range(options['rounds']):
+                task = Task.objects.create(
+                    title=f'Contended task {round_number}',
+                    description='Benchmark task',
+                    location='Benchmark',
+                    time=timezone.now() + timezone.timedelta(days=1),
+                    poster=poster
+                )
+                results = self.contend(task, takers, options['concurrency'])
+                winners = [result for result, _ in results if result]
+                latencies.extend(latency for _, latency in results)
+
+                if len(winners) != 1:
+                    raise CommandError(
+                        f"Round {round_number}: expected exactly one winner, got {len(winners)}"
+                    )
+
+                task.refresh_from_db()
+                self.stdout.write(
+                    f"Round {round_number}: 1 winner out of {len(results)} takes "
+                    f"(status={task.status})"
+                )
+        finally:
+            Task.objects.filter(poster=poster).delete()
+            User.objects.filter(line_id__startswith=f'bench-taker-{run_id}-').delete()
+            poster.delete()
+
+        latencies_ms = [latency * 1000 for latency in latencies]
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(latencies_ms)} takes: "
+            f"p50={percentile(latencies_ms, 50):.2f}ms "
+            f"p95={percentile(latencies_ms, 95):.2f}ms "
+            f"p99={percentile(latencies_ms, 99):.2f}ms "
+            f"mean={statistics.mean(latencies_ms):.2f}ms"
+        ))
+
+    def contend(self, task, takers, concurrency):
+        def take(user):
+            # Each thread works on its own instance, like separate requests would
+            instance = Task.objects.get(pk=task.pk)
+            started = time.perf_counter()
+            result = instance.take(user)
+            elapsed = time.perf_counter() - started
+            connections.close_all()
+            return result, elapsed
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(take, takers))
@@ -0,0 +1,94 @@
+import asyncio
+import gc
+import json
+import resource
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from tasks import live
+from tasks.models import Task
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold many idle live-feed subscribers in one process and report the memory "
+        "each costs and how long an event takes to reach all of them. Socket and "
+        "server buffers are not included; add the ASGI server's own per-connection cost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--connections', type=int, default=10000,
+            help="Number of idle subscribers."
+        )
+        parser.add_argument(
+            '--events', type=int, default=10,
+            help="Events fanned out to every subscriber."
+        )
+        parser.add_argument(
+            '--radius', type=float, default=None,
+            help="Give every subscriber a location filter of this many metres."
+        )
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['connections'], options['events'], options['radius']))
+
+    async def run(self, connections, events, radius):
+        filters = {}
+        if radius is not None:
+            filters = {'lat': 25.0330, 'lng': 121.5654, 'radius': radius}
+
+        received = 0
+        all_received = asyncio.Event()
+
+        async def consume(stream):
+            nonlocal received
+            async for frame in stream:
+                if frame.startswith(b'event:'):
+                    received += 1
+                    if received == connections * events:
+                        all_received.set()
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+
+        consumers = [
+            asyncio.create_task(consume(live.stream(live.hub.subscribe(**filters))))
+            for _ in range(connections)
+        ]
+        # Let every consumer reach its idle wait on the queue
+        for _ in range(3):
+            await asyncio.sleep(0)
+
+        gc.collect()
+        per_connection = (tracemalloc.get_traced_memory()[0] - before) / connections
+        tracemalloc.stop()
+
+        task = Task(
+            id=1, title='Bench task', reward=10, location='Taipei 101',
+            latitude=25.0340, longitude=121.5645, time=timezone.now(),
+            status=Task.TaskStatus.OPEN, version=1
+        )
+        payload = json.dumps(live.event_for('created', task), cls=DjangoJSONEncoder)
+
+        started = time.perf_counter()
+        for _ in range(events):
+            live.hub.fan_out([payload])
+        fan_out = time.perf_counter() - started
+        await asyncio.wait_for(all_received.wait(), timeout=60)
+        delivered = time.perf_counter() - started
+
+        for consumer in consumers:
+            consumer.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+
+        self.stdout.write(f"Subscribers:            {connections}")
+        self.stdout.write(f"Memory per subscriber:  {per_connection / 1024:.2f} KiB")
+        self.stdout.write(f"Peak RSS:               {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+        self.stdout.write(f"Fan-out per event:      {fan_out / events * 1000:.1f} ms")
+        self.stdout.write(f"Delivered per event:    {delivered / events * 1000:.1f} ms")
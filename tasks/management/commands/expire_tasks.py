@@ -0,0 +1,45 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from tasks import expiry
+
+
+class Command(BaseCommand):
+    help = "Move open tasks whose time has passed to the expired status."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.TASK_EXPIRY_BATCH_SIZE,
+            help="Tasks expired per transaction."
+        )
+        parser.add_argument(
+            '--max-batches', type=int, default=None,
+            help="Stop a run after this many batches, leaving the rest for the next run."
+        )
+        parser.add_argument(
+            '--interval', type=float, default=settings.TASK_EXPIRY_INTERVAL,
+            help="Seconds between runs."
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Sweep once and exit."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                started = time.perf_counter()
+                expired = expiry.sweep(options['batch_size'], options['max_batches'])
+                self.stdout.write(
+                    f"Expired {expired} tasks in {time.perf_counter() - started:.2f}s, "
+                    f"lag {expiry.lag():.1f}s"
+                )
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+                close_old_connections()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped")
@@ -1,7 +1,153 @@
-from django.db import models
+import enum
+import heapq
+
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import DatabaseError, models, transaction
+from django.db.models import F
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from . import feed_cache, geo, live, search
+
+
+class TakeResult(enum.Enum):
+    """Outcome of ``Task.take``. Only ``TAKEN`` is truthy."""
+    
+    TAKEN = 'taken'
+    UNAVAILABLE = 'unavailable'
+    OWN_TASK = 'own_task'
+    STALE = 'stale'
+    
+    def __bool__(self):
+        return self is TakeResult.TAKEN
+
+
+class TaskQuerySet(models.QuerySet):
+    """Queries behind the task feeds, shaped to match the indexes on ``Task``."""
+    
+    def with_users(self):
+        """Load poster and taker in the same query, as ``TaskSerializer`` needs them."""
+        return self.select_related('poster', 'taker')
+    
+    def with_details(self):
+        """Also load the thanks message and its sender, for ``TaskDetailSerializer``."""
+        return self.with_users().select_related('thanks_message__sender')
+    
+    def upcoming(self):
+        """Tasks whose time has not passed yet."""
+        return self.filter(time__gte=timezone.now())
+    
+    def open_feed(self):
+        """Open upcoming tasks, soonest first."""
+        return self.filter(
+            status=Task.TaskStatus.OPEN,
+            time__gte=timezone.now()
+        ).order_by('time')
+    
+    def nearby(self, lat, lng, radius):
+        """
+        Candidates for open upcoming tasks within ``radius`` metres of a point.
+        
+        Rows come from geohash range scans of ``task_open_geohash_idx`` and
+        are trimmed to the circle's bounding box; the caller still has to
+        check the exact distance (see ``geo.distance``).
+        """
+        in_cells = models.Q()
+        for start, stop in geo.covering_ranges(lat, lng, radius):
+            cell = models.Q(geohash__gte=start)
+            if stop is not None:
+                cell &= models.Q(geohash__lt=stop)
+            in_cells |= cell
+        
+        south, west, north, east = geo.bounding_box(lat, lng, radius)
+        queryset = self.filter(
+            in_cells,
+            status=Task.TaskStatus.OPEN,
+            time__gte=timezone.now(),
+            latitude__range=(south, north)
+        )
+        if -180 <= west and east <= 180:
+            queryset = queryset.filter(longitude__range=(west, east))
+        return queryset
+    
+    def nearest(self, lat, lng, radius, limit):
+        """
+        The ``limit`` open tasks nearest to a point, within ``radius`` metres.
+        
+        Returns a list sorted by distance, each task with ``distance`` set.
+        Only ids and coordinates are read for the candidates; full rows are
+        loaded for the winners alone.
+        """
+        distances = {}
+        for pk, task_lat, task_lng in self.nearby(lat, lng, radius).values_list(
+            'id', 'latitude', 'longitude'
+        ):
+            distance = geo.distance(lat, lng, task_lat, task_lng)
+            if distance <= radius:
+                distances[pk] = distance
+        
+        ids = heapq.nsmallest(limit, distances, key=lambda pk: (distances[pk], pk))
+        tasks = self.filter(pk__in=ids).in_bulk()
+        for pk in ids:
+            tasks[pk].distance = round(distances[pk], 1)
+        return [tasks[pk] for pk in ids]
+    
+    def create_many(self, tasks, batch_size):
+        """
+        Insert unsaved ``tasks`` with ``bulk_create``, ``batch_size`` at a time.
+        
+        Does what ``Task.save`` would for each task (geohash, timeline
+        entries, live feed events) and bumps the feed version once. A batch the database
+        rejects is retried task by task, so a bad row only fails itself.
+        Returns, per task, None if it was inserted or the database error.
+        """
+        errors = []
+        for start in range(0, len(tasks), batch_size):
+            chunk = tasks[start:start + batch_size]
+            for task in chunk:
+                task.update_geohash()
+            try:
+                self._insert_with_timeline(chunk)
+                errors.extend([None] * len(chunk))
+            except DatabaseError:
+                for task in chunk:
+                    try:
+                        self._insert_with_timeline([task])
+                        errors.append(None)
+                    except DatabaseError as e:
+                        errors.append(e)
+        
+        created = [task for task, error in zip(tasks, errors) if error is None]
+        if created:
+            feed_cache.bump()
+            live.publish('created', *created, using=self.db)
+        return errors
+    
+    def _insert_with_timeline(self, tasks):
+        try:
+            with transaction.atomic(using=self.db):
+                self.bulk_create(tasks)
+                TimelineEntry.objects.using(self.db).bulk_create([
+                    entry for task in tasks for entry in TimelineEntry.objects.entries_for(task)
+                ])
+        except DatabaseError:
+            # Rolled back: leave the tasks unsaved for a retry
+            for task in tasks:
+                task.pk = None
+                task._state.adding = True
+            raise
+    
+    def search(self, query, limit):
+        """
+        The ``limit`` open upcoming tasks best matching ``query``, best first.
+        
+        Returns a list, each task with its relevance as ``rank``. Ranking and
+        the indexes behind it depend on the database; see ``tasks.search``.
+        """
+        return search.search(self.open_feed(), query, limit)
+    
+
 
 class Task(models.Model):
     """Model representing a task that can be posted and accepted by users."""
@@ -10,12 +156,25 @@ class Task(models.Model):
         OPEN = 'open', _('Open')
         TAKEN = 'taken', _('Taken')
         DONE = 'done', _('Done')
+        EXPIRED = 'expired', _('Expired')
     
     title = models.CharField(max_length=100)
     description = models.TextField()
     reward = models.PositiveIntegerField(default=10)
     location = models.CharField(max_length=200)
     time = models.DateTimeField()
+    latitude = models.FloatField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        blank=True,
+        null=True,
+        validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+    # Kept in sync with the coordinates by ``save``; see ``tasks.geo``
+    geohash = models.CharField(max_length=geo.GEOHASH_PRECISION, blank=True, editable=False)
     
     poster = models.ForeignKey(
         settings.AUTH_USER_MODEL, 
@@ -38,35 +197,156 @@ class Task(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Incremented by every write to the task or its thanks message; clients
+    # see it as the ETag of the task's endpoints
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # Stamped by a database trigger on every write, for delta sync; see ``tasks.changes``
+    change_seq = models.BigIntegerField(default=0, editable=False)
+    
+    objects = TaskQuerySet.as_manager()
     
     class Meta:
         ordering = ['-time']
+        # Feed indexes end in ``id``, the keyset pagination tie-breaker
+        indexes = [
+            # Task list, optionally filtered by status, newest time first
+            models.Index(fields=['-time', '-id'], name='task_time_idx'),
+            models.Index(fields=['status', 'time', 'id'], name='task_status_time_idx'),
+            # Open feeds (nearby, bot task list): only the open rows, by time
+            models.Index(
+                fields=['time', 'id'],
+                name='task_open_time_idx',
+                condition=models.Q(status='open')
+            ),
+            # Nearby search: geohash range scans over the open rows
+            models.Index(
+                fields=['geohash'],
+                name='task_open_geohash_idx',
+                condition=models.Q(status='open')
+            ),
+            # Delta sync: every task change in order; see ``tasks.changes``
+            models.Index(fields=['change_seq', 'id'], name='task_change_idx'),
+        ]
     
     def __str__(self):
         return self.title
     
-    def take(self, user):
-        """Mark the task as taken by a user."""
-        if self.status != self.TaskStatus.OPEN:
-            return False
+    def save(self, *args, **kwargs):
+        self.update_geohash()
         
-        self.taker = user
-        self.status = self.TaskStatus.TAKEN
-        self.save()
-        return True
+        adding = self._state.adding
+        if not adding:
+            self.version += 1
+        
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            extra = {'version'}
+            if {'latitude', 'longitude'} & set(update_fields):
+                extra.add('geohash')
+            kwargs['update_fields'] = {*update_fields, *extra}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            TimelineEntry.objects.sync(self, prune=True)
+        feed_cache.bump()
+        live.publish('created' if adding else 'updated', self)
+    
+    def update_geohash(self):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
     
-    def complete(self):
-        """Mark the task as completed."""
-        if self.status != self.TaskStatus.TAKEN or not self.taker:
-            return False
+    def take(self, user, expected_version=None):
+        """
+        Mark the task as taken by a user.
+        
+        The status check and the write are a single conditional UPDATE, so
+        when several users take the same task at once exactly one wins and
+        the others get ``TakeResult.UNAVAILABLE``. With ``expected_version``
+        the UPDATE also requires that version, and a task changed since then
+        gets ``TakeResult.STALE``.
+        """
+        if user.pk == self.poster_id:
+            return TakeResult.OWN_TASK
+        
+        now = timezone.now()
+        queryset = Task.objects.filter(pk=self.pk, status=self.TaskStatus.OPEN)
+        if expected_version is not None:
+            queryset = queryset.filter(version=expected_version)
+        
+        with transaction.atomic():
+            updated = queryset.update(
+                taker=user,
+                status=self.TaskStatus.TAKEN,
+                updated_at=now,
+                version=F('version') + 1
+            )
+            if updated:
+                self.taker = user
+                self.status = self.TaskStatus.TAKEN
+                self.updated_at = now
+                TimelineEntry.objects.sync(self)
+        
+        if not updated:
+            self.refresh_from_db(fields=['status', 'taker', 'updated_at', 'version'])
+            if expected_version is not None and self.version != expected_version:
+                return TakeResult.STALE
+            return TakeResult.UNAVAILABLE
+        
+        feed_cache.bump()
+        self.version = (self.version if expected_version is None else expected_version) + 1
+        live.publish('taken', self)
+        return TakeResult.TAKEN
+    
+    def complete(self, expected_version=None):
+        """
+        Mark the task as completed and credit the taker, in one transaction.
+        
+        Returns the taker's ``ExpCredit`` (EXP gained, level before and after),
+        or None if the task was not in a state that can be completed, or was
+        no longer at ``expected_version`` when given.
+        """
+        if not self.taker_id:
+            return None
         
-        self.status = self.TaskStatus.DONE
-        self.save()
+        from users.models import User
         
-        # Add exp and update completed_tasks count for the taker
-        self.taker.complete_task(self)
+        with transaction.atomic():
+            now = timezone.now()
+            queryset = Task.objects.filter(
+                pk=self.pk,
+                status=self.TaskStatus.TAKEN,
+                taker_id=self.taker_id
+            )
+            if expected_version is not None:
+                queryset = queryset.filter(version=expected_version)
+            updated = queryset.update(
+                status=self.TaskStatus.DONE,
+                updated_at=now,
+                version=F('version') + 1
+            )
+            
+            if not updated:
+                self.refresh_from_db(fields=['status', 'taker', 'updated_at', 'version'])
+                return None
+            
+            self.status = self.TaskStatus.DONE
+            self.updated_at = now
+            TimelineEntry.objects.sync(self)
+            credit = User.objects.earn_exp(self.taker_id, self.reward, completed_tasks=1)
+            feed_cache.bump()
         
-        return True
+        self.version = (self.version if expected_version is None else expected_version) + 1
+        live.publish('completed', self)
+        
+        # Keep an already-loaded taker in sync with the database. Buffered
+        # credits are not in it yet, and saving them would count them twice.
+        if Task.taker.is_cached(self) and not settings.USER_EXP_WRITE_BEHIND:
+            self.taker.level = credit.level_after
+            self.taker.exp = credit.exp_after
+            self.taker.completed_tasks += 1
+        
+        return credit
 
 
 class ThanksMessage(models.Model):
@@ -86,4 +366,142 @@ class ThanksMessage(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"Thanks for {self.task.title}"
\ No newline at end of file
+        return f"Thanks for {self.task.title}"
+    
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        # The message is part of the task's detail representation
+        if adding:
+            Task.objects.filter(pk=self.task_id).update(version=F('version') + 1)
+
+
+class TimelineEntryManager(models.Manager):
+    
+    def for_user(self, user, role='all'):
+        """Entries of tasks posted and/or taken by ``user``, most recently updated first."""
+        queryset = self.filter(user=user)
+        if role in (TimelineEntry.Role.POSTER, TimelineEntry.Role.TAKER):
+            queryset = queryset.filter(role=role)
+        return queryset.order_by('-updated_at')
+    
+    def entries_for(self, task):
+        """The entries ``task`` should have, from its current poster and taker."""
+        users = [(task.poster_id, TimelineEntry.Role.POSTER)]
+        if task.taker_id:
+            users.append((task.taker_id, TimelineEntry.Role.TAKER))
+        return [
+            TimelineEntry(
+                user_id=user_id,
+                task_id=task.pk,
+                role=role,
+                status=task.status,
+                updated_at=task.updated_at
+            )
+            for user_id, role in users
+        ]
+    
+    def sync(self, task, prune=False):
+        """
+        Bring ``task``'s entries up to date with one upsert.
+        
+        With ``prune``, also delete entries of users who no longer hold
+        their role, which only direct edits of poster or taker can cause.
+        """
+        self.bulk_create(
+            self.entries_for(task),
+            update_conflicts=True,
+            unique_fields=['user', 'task', 'role'],
+            update_fields=['status', 'updated_at']
+        )
+        if prune:
+            self.filter(task_id=task.pk).exclude(
+                models.Q(role=TimelineEntry.Role.POSTER, user_id=task.poster_id)
+                | models.Q(role=TimelineEntry.Role.TAKER, user_id=task.taker_id)
+            ).delete()
+
+
+class TimelineEntry(models.Model):
+    """
+    One row per user per task they posted or took: the "my tasks" timeline.
+    
+    Written on every task change (fan-out on write) so that reading a user's
+    tasks, in any role, is a single range scan of one index instead of an OR
+    over the poster and taker columns. Status and ``updated_at`` are copies of
+    the task's. ``backfill_task_timeline`` rebuilds the entries of tasks
+    written around ``Task.save`` (``bulk_create``, queryset updates).
+    """
+    
+    class Role(models.TextChoices):
+        POSTER = 'poster', _('Poster')
+        TAKER = 'taker', _('Taker')
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='task_timeline'
+    )
+    task = models.ForeignKey(
+        Task,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    role = models.CharField(max_length=10, choices=Role.choices)
+    status = models.CharField(max_length=10, choices=Task.TaskStatus.choices)
+    updated_at = models.DateTimeField()
+    
+    objects = TimelineEntryManager()
+    
+    class Meta:
+        verbose_name_plural = 'timeline entries'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'task', 'role'], name='timeline_entry_unique'
+            ),
+        ]
+        # Keyset pagination breaks ties on ``id``, like the task feeds
+        indexes = [
+            models.Index(fields=['user', '-updated_at', '-id'], name='timeline_user_updated_idx'),
+            models.Index(
+                fields=['user', 'role', '-updated_at', '-id'], name='timeline_user_role_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} {self.role} {self.task_id}"
+
+
+class DeletedTask(models.Model):
+    """
+    Tombstone of a deleted task, so delta sync clients learn it is gone;
+    see ``tasks.changes``. Written by ``task_deleting``.
+    """
+    
+    task_id = models.BigIntegerField(primary_key=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+    # Stamped by the same trigger as ``Task.change_seq``
+    change_seq = models.BigIntegerField(default=0, editable=False)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['change_seq', 'task_id'], name='deleted_task_sync_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Deleted task {self.task_id}"
+
+
+def task_deleting(sender, instance, using, **kwargs):
+    """
+    ``pre_delete`` receiver for ``Task``: leave a tombstone and publish the
+    deletion in the deleting transaction, however the task is deleted
+    (``Task.delete``, queryset or admin deletes, or cascading from its poster).
+    """
+    # Published first, while the task still has its primary key
+    live.publish('deleted', instance, using=using)
+    DeletedTask.objects.using(using).create(task_id=instance.pk)
+
+
+def task_deleted(sender, instance, using, **kwargs):
+    """``post_delete`` receiver for ``Task``."""
+    feed_cache.bump()
@@ -0,0 +1,155 @@
+"""
+Keyset (cursor) pagination for the task feeds.
+
+``PageNumberPagination`` runs a ``COUNT(*)`` on every page and reaches page N
+with ``OFFSET``, so both get slower the deeper a user scrolls. Keyset
+pagination instead remembers the last row of a page and asks for the rows
+after it, which an index on the ordering column answers directly: page N
+costs the same as page 1.
+
+Rows are ordered by the first field of the queryset's ordering with ``id`` as
+a tie-breaker, so rows sharing a timestamp are neither skipped nor repeated.
+Cursors are opaque to clients.
+"""
+
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import namedtuple
+
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+Cursor = namedtuple('Cursor', ['value', 'pk', 'reverse'])
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate by position in the feed ordering instead of by page number.
+
+    Enable it on a view with ``pagination_class = KeysetPagination``. The
+    ordering comes from the queryset (or ``ordering`` on a subclass); only
+    its first field is used.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    ordering = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+        self.field, self.descending = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request)
+        self.reverse = bool(cursor and cursor.reverse)
+
+        # Walking backwards is walking forwards in the opposite order
+        descending = self.descending != self.reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(prefix + self.field, prefix + 'id')
+
+        if cursor is not None:
+            lookup = 'lt' if descending else 'gt'
+            bound = 'lte' if descending else 'gte'
+            # The inclusive bound lets the database range-scan the index;
+            # the OR only breaks ties between rows sharing a value.
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{bound}': cursor.value}),
+                Q(**{f'{self.field}__{lookup}': cursor.value})
+                | Q(**{f'id__{lookup}': cursor.pk})
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering(self, queryset):
+        """Return ``(field, descending)`` for the ordering to paginate on."""
+        ordering = (
+            self.ordering
+            or queryset.query.order_by
+            or queryset.model._meta.ordering
+        )
+        if not ordering or not isinstance(ordering[0], str):
+            raise ImproperlyConfigured(
+                f"{type(self).__name__} needs a queryset ordered by a model field"
+            )
+        field = ordering[0]
+        return field.lstrip('-'), field.startswith('-')
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.cursor_for(self.page[-1]))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.cursor_for(self.page[0], reverse=True))
+
+    def cursor_for(self, row, reverse=False):
+        field = row._meta.get_field(self.field)
+        return Cursor(field.value_to_string(row), row.pk, reverse)
+
+    def encode_cursor(self, cursor):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor_token(cursor))
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+
+        try:
+            value, pk, reverse = json.loads(urlsafe_b64decode(token.encode()))
+            field = self.model._meta.get_field(self.field)
+            return Cursor(field.to_python(value), int(pk), bool(reverse))
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+def cursor_token(cursor):
+    """The opaque query parameter value for ``cursor``."""
+    return urlsafe_b64encode(json.dumps(list(cursor)).encode()).decode()
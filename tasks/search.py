@@ -0,0 +1,207 @@
+"""
+Full-text task search.
+
+On PostgreSQL each task row has a ``search_vector`` column, a ``tsvector``
+over the title (weight A), description (B) and location (C). It is a
+generated column, so the database keeps it current on every write,
+including ``bulk_create`` and queryset updates. A GIN index serves the
+match, and results are ranked with ``ts_rank``.
+
+The text search parser splits words on spaces and punctuation. Chinese has
+neither, so a whole sentence becomes a single lexeme. Queries containing CJK
+characters, and queries the vector finds nothing for (typos), go through
+pg_trgm instead: substring and trigram word-similarity matches on each
+field, GIN indexed and ranked by similarity. Queries shorter than
+three characters carry no trigram to narrow the index with, so they end up
+checking every open task.
+
+The column, extension and indexes are PostgreSQL-only, so they are not
+declared on ``Task``: ``install`` creates them after ``migrate``. Other
+databases (the SQLite test runs) use ``InvertedIndex``, built in memory from
+the candidate rows on each search.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.db import connections
+
+# Text search configuration: no stemming or stop words, as most tasks are
+# not in English
+SEARCH_CONFIG = 'simple'
+
+# Relative weight of each field, the same as ts_rank's defaults for A, B, C
+FIELD_WEIGHTS = {'title': 1.0, 'description': 0.4, 'location': 0.2}
+
+# Hiragana, katakana, CJK ideographs and hangul
+_CJK = '\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+_CJK_CHAR = re.compile(f'[{_CJK}]')
+_TOKEN = re.compile(f'[{_CJK}]+|[^\\W_{_CJK}]+')
+
+
+def has_cjk(text):
+    return _CJK_CHAR.search(text) is not None
+
+
+def tokenize(text, unigrams=False):
+    """
+    Lowercased search terms in ``text``.
+
+    Runs of letters and digits are words. CJK runs have no word boundaries,
+    so they become overlapping character pairs; with ``unigrams`` their
+    single characters are terms too, so one-character queries match.
+    """
+    terms = []
+    for token in _TOKEN.findall(text.lower()):
+        if has_cjk(token) and len(token) > 1:
+            terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+            if unigrams:
+                terms.extend(token)
+        else:
+            terms.append(token)
+    return terms
+
+
+class InvertedIndex:
+    """
+    In-memory inverted index over task fields, for databases without
+    full-text search.
+
+    Documents match when they contain every query term, and are scored by
+    TF-IDF with ``FIELD_WEIGHTS``.
+    """
+
+    def __init__(self):
+        # term -> {doc_id: weighted term frequency}
+        self.postings = defaultdict(dict)
+        self.size = 0
+
+    def add(self, doc_id, **fields):
+        self.size += 1
+        for field, text in fields.items():
+            weight = FIELD_WEIGHTS[field]
+            for term, count in Counter(tokenize(text or '', unigrams=True)).items():
+                postings = self.postings[term]
+                postings[doc_id] = postings.get(doc_id, 0) + weight * count
+
+    def search(self, query):
+        """``(doc_id, score)`` pairs matching ``query``, best first."""
+        terms = set(tokenize(query))
+        if not terms or any(term not in self.postings for term in terms):
+            return []
+
+        # Intersect from the rarest term up
+        terms = sorted(terms, key=lambda term: len(self.postings[term]))
+        matches = set(self.postings[terms[0]])
+        for term in terms[1:]:
+            matches.intersection_update(self.postings[term])
+
+        scores = dict.fromkeys(matches, 0.0)
+        for term in terms:
+            postings = self.postings[term]
+            idf = math.log(1 + self.size / len(postings))
+            for doc_id in matches:
+                scores[doc_id] += postings[doc_id] * idf
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+
+def search(queryset, query, limit):
+    """
+    The ``limit`` tasks in ``queryset`` best matching ``query``, best first,
+    each with ``rank`` set.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        return _postgres_search(queryset, query, limit)
+
+    index = InvertedIndex()
+    for pk, title, description, location in queryset.values_list(
+        'id', 'title', 'description', 'location'
+    ):
+        index.add(pk, title=title, description=description, location=location)
+
+    ranked = index.search(query)[:limit]
+    tasks = queryset.filter(pk__in=[pk for pk, _ in ranked]).in_bulk()
+    for pk, score in ranked:
+        tasks[pk].rank = round(score, 4)
+    return [tasks[pk] for pk, _ in ranked]
+
+
+def _postgres_search(queryset, query, limit):
+    if not has_cjk(query):
+        tasks = list(fulltext_matches(queryset, query)[:limit])
+        if tasks:
+            return tasks
+    return list(trigram_matches(queryset, query)[:limit])
+
+
+def fulltext_matches(queryset, query):
+    """Tasks whose search vector matches ``query``, ranked by ``ts_rank``."""
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+    from django.db.models.expressions import RawSQL
+
+    table = connections[queryset.db].ops.quote_name(queryset.model._meta.db_table)
+    vector = RawSQL(f'{table}.search_vector', [], output_field=SearchVectorField())
+    tsquery = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    return (
+        queryset.alias(search_vector=vector)
+        .filter(search_vector=tsquery)
+        .annotate(rank=SearchRank(vector, tsquery))
+        .order_by('-rank', '-id')
+    )
+
+
+def trigram_matches(queryset, query):
+    """
+    Tasks containing ``query`` or a word similar to it, ranked by similarity
+    scaled by ``FIELD_WEIGHTS``.
+    """
+    from django.contrib.postgres.search import TrigramWordSimilarity
+    from django.db.models import Q
+    from django.db.models.functions import Greatest
+
+    matches = Q()
+    for field in FIELD_WEIGHTS:
+        matches |= Q(**{f'{field}__contains': query})
+        matches |= Q(**{f'{field}__trigram_word_similar': query})
+    return (
+        queryset.filter(matches)
+        .annotate(rank=Greatest(*(
+            TrigramWordSimilarity(query, field) * weight
+            for field, weight in FIELD_WEIGHTS.items()
+        )))
+        .order_by('-rank', '-id')
+    )
+
+
+def install(using='default', **kwargs):
+    """
+    Create the PostgreSQL search column and indexes if they are missing.
+
+    Connected to ``post_migrate``; does nothing on other databases.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+
+    from .models import Task
+
+    table = connection.ops.quote_name(Task._meta.db_table)
+    document = ' || '.join(
+        f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({field}, '')), '{weight}')"
+        for field, weight in (('title', 'A'), ('description', 'B'), ('location', 'C'))
+    )
+    statements = [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector '
+        f'GENERATED ALWAYS AS ({document}) STORED',
+        f"CREATE INDEX IF NOT EXISTS task_open_search_idx ON {table} "
+        f"USING gin (search_vector) WHERE status = 'open'",
+    ] + [
+        f"CREATE INDEX IF NOT EXISTS task_open_{field}_trgm_idx ON {table} "
+        f"USING gin ({field} gin_trgm_ops) WHERE status = 'open'"
+        for field in FIELD_WEIGHTS
+    ]
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
@@ -13,9 +13,16 @@ class TaskSerializer(serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = ['id', 'title', 'description', 'reward', 'location', 
-                 'time', 'status', 'poster', 'taker', 'poster_id',
-                 'created_at', 'updated_at']
-        read_only_fields = ['id', 'status', 'created_at', 'updated_at']
+                 'latitude', 'longitude', 'time', 'status', 'poster', 'taker',
+                 'poster_id', 'created_at', 'updated_at', 'version']
+        read_only_fields = ['id', 'status', 'created_at', 'updated_at', 'version']
+    
+    def validate(self, attrs):
+        latitude = attrs.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = attrs.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError("Latitude and longitude must be set together")
+        return attrs
     
     def create(self, validated_data):
         # Remove poster_id from validated_data if present
@@ -52,7 +59,7 @@ class ThanksMessageSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Task not found or not completed")
         
         # Ensure the user is either the poster or taker of the task
-        if user != task.poster and user != task.taker:
+        if user.pk not in (task.poster_id, task.taker_id):
             raise serializers.ValidationError("You can only send thanks for tasks you're involved in")
         
         # Create the thanks message
@@ -70,4 +77,22 @@ class TaskDetailSerializer(TaskSerializer):
     thanks_message = ThanksMessageSerializer(read_only=True)
     
     class Meta(TaskSerializer.Meta):
-        fields = TaskSerializer.Meta.fields + ['thanks_message']
\ No newline at end of file
+        fields = TaskSerializer.Meta.fields + ['thanks_message']
+
+
+class NearbyTaskSerializer(TaskSerializer):
+    """Task with its distance in metres from the searched point."""
+    
+    distance = serializers.FloatField(read_only=True)
+    
+    class Meta(TaskSerializer.Meta):
+        fields = TaskSerializer.Meta.fields + ['distance']
+
+
+class SearchTaskSerializer(TaskSerializer):
+    """Task with its relevance to the search query, higher is better."""
+    
+    rank = serializers.FloatField(read_only=True)
+    
+    class Meta(TaskSerializer.Meta):
+        fields = TaskSerializer.Meta.fields + ['rank']
@@ -1,7 +1,30 @@
-from django.test import TestCase
+import asyncio
+import json
+import math
+import re
+import select
+import time
+import unittest
+from io import StringIO
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
 from django.utils import timezone
+from rest_framework.test import APIClient
+from linebot_core.models import Notification
+from meowtask import metrics
+from meowtask.testing import QueryBudgetMixin, create_task
 from users.models import User
-from .models import Task, ThanksMessage
+from . import changes, expiry, feed_cache, geo, live, search
+from .models import DeletedTask, TakeResult, Task, ThanksMessage, TimelineEntry
 
 
 class TaskModelTests(TestCase):
@@ -48,8 +71,30 @@ class TaskModelTests(TestCase):
         success = self.task.take(another_user)
         
         self.assertFalse(success)
+        self.assertEqual(success, TakeResult.UNAVAILABLE)
         self.assertEqual(self.task.taker, self.taker)
     
+    def test_take_own_task(self):
+        """Test that a poster cannot take their own task."""
+        result = self.task.take(self.poster)
+        
+        self.assertEqual(result, TakeResult.OWN_TASK)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, Task.TaskStatus.OPEN)
+    
+    def test_take_with_stale_instance(self):
+        """Test that a stale in-memory status cannot overwrite another take."""
+        stale = Task.objects.get(pk=self.task.pk)
+        self.task.take(self.taker)
+        
+        another_user = User.objects.create(
+            line_id='another_line_id',
+            display_name='Another User'
+        )
+        
+        self.assertFalse(stale.take(another_user))
+        self.assertEqual(stale.taker, self.taker)
+    
     def test_complete_task(self):
         """Test completing a taken task."""
         self.task.status = Task.TaskStatus.TAKEN
@@ -67,4 +112,1272 @@ class TaskModelTests(TestCase):
         # Refresh taker from database
         self.taker.refresh_from_db()
         self.assertEqual(self.taker.exp, initial_exp + self.task.reward)
-        self.assertEqual(self.taker.completed_tasks, initial_completed + 1)
\ No newline at end of file
+        self.assertEqual(self.taker.completed_tasks, initial_completed + 1)
+    
+    def test_complete_task_reports_level_up(self):
+        """Test that completion returns the taker's level before and after."""
+        self.task.reward = 350
+        self.task.status = Task.TaskStatus.TAKEN
+        self.task.taker = self.taker
+        self.task.save()
+        
+        credit = self.task.complete()
+        
+        self.assertTrue(credit.leveled_up)
+        self.assertEqual(credit.level_before, 1)
+        self.assertEqual(credit.level_after, 3)
+        self.assertEqual(credit.exp_after, 50)
+        self.assertEqual(self.task.taker.level, 3)
+    
+    def test_complete_task_twice(self):
+        """Test that a task cannot be completed, and credited, twice."""
+        self.task.status = Task.TaskStatus.TAKEN
+        self.task.taker = self.taker
+        self.task.save()
+        stale = Task.objects.get(pk=self.task.pk)
+        
+        self.assertTrue(self.task.complete())
+        self.assertIsNone(stale.complete())
+        
+        self.taker.refresh_from_db()
+        self.assertEqual(self.taker.completed_tasks, 1)
+
+
+class TaskTakeContentionTests(TransactionTestCase):
+    
+    @unittest.skipUnless(connection.vendor == 'postgresql', "SQLite locks the whole table between threads")
+    def test_concurrent_takes_have_one_winner(self):
+        """Test that exactly one of many concurrent takes succeeds."""
+        poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        takers = [
+            User.objects.create(line_id=f'taker_{i}', display_name=f'Taker {i}')
+            for i in range(10)
+        ]
+        task = Task.objects.create(
+            title='Popular Task',
+            description='Everyone wants it',
+            location='Test Location',
+            time=timezone.now() + timezone.timedelta(days=1),
+            poster=poster
+        )
+        
+        def take(user):
+            try:
+                return Task.objects.get(pk=task.pk).take(user)
+            finally:
+                connections.close_all()
+        
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            results = list(executor.map(take, takers))
+        
+        self.assertEqual(sum(1 for result in results if result), 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.TaskStatus.TAKEN)
+        self.assertIn(task.taker, takers)
+
+    
+    @unittest.skipUnless(connection.vendor == 'postgresql', "SQLite locks the whole table between threads")
+    def test_parallel_completions_credit_every_task(self):
+        """Test that one taker finishing tasks in parallel loses no EXP."""
+        poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        taker = User.objects.create(line_id='taker_line_id', display_name='Taker')
+        tasks = [
+            Task.objects.create(
+                title=f'Task {i}',
+                description='Parallel',
+                reward=60,
+                location='Test Location',
+                time=timezone.now() + timezone.timedelta(days=1),
+                poster=poster,
+                taker=taker,
+                status=Task.TaskStatus.TAKEN
+            )
+            for i in range(8)
+        ]
+        
+        def complete(task):
+            try:
+                return Task.objects.get(pk=task.pk).complete()
+            finally:
+                connections.close_all()
+        
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            credits = list(executor.map(complete, tasks))
+        
+        self.assertTrue(all(credits))
+        taker.refresh_from_db()
+        self.assertEqual(taker.completed_tasks, 8)
+        # 480 EXP from level 1: 100 + 200 to reach level 3, 180 left over
+        self.assertEqual((taker.level, taker.exp), (3, 180))
+
+
+class TaskApiTests(TestCase):
+    
+    def setUp(self):
+        self.poster = User.objects.create(
+            line_id='poster_line_id',
+            display_name='Poster User'
+        )
+        self.taker = User.objects.create(
+            line_id='taker_line_id',
+            display_name='Taker User'
+        )
+        self.task = Task.objects.create(
+            title='Test Task',
+            description='Test Description',
+            reward=20,
+            location='Test Location',
+            time=timezone.now() + timezone.timedelta(days=1),
+            poster=self.poster
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.taker)
+    
+    def test_take_and_complete_notify_poster(self):
+        """Test that REST transitions queue notifications for the poster."""
+        response = self.client.post(reverse('tasks:task-take', args=[self.task.id]))
+        self.assertEqual(response.status_code, 200)
+        
+        response = self.client.post(reverse('tasks:task-complete', args=[self.task.id]))
+        self.assertEqual(response.status_code, 200)
+        
+        self.assertEqual(response.data['completion']['exp_gained'], 20)
+        
+        notifications = Notification.objects.filter(recipient='poster_line_id')
+        self.assertEqual(notifications.count(), 2)
+
+
+class TaskQueryPlanTests(TestCase):
+    """Check that the feed queries are served by indexes on a large table."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([
+            User(line_id=f'plan_user_{i}', display_name=f'Plan User {i}')
+            for i in range(50)
+        ])
+        now = timezone.now()
+        tasks = []
+        for i in range(20000):
+            # Mostly finished history, with a thin slice of open upcoming tasks
+            is_open = i % 50 == 0
+            tasks.append(Task(
+                title=f'Task {i}',
+                description='Seeded task',
+                location='Somewhere',
+                time=now + timezone.timedelta(hours=i % 100) if is_open
+                else now - timezone.timedelta(hours=i),
+                status=Task.TaskStatus.OPEN if is_open else Task.TaskStatus.DONE,
+                poster=cls.users[i % 50],
+                taker=None if is_open else cls.users[(i + 1) % 50]
+            ))
+        Task.objects.bulk_create(tasks, batch_size=1000)
+        call_command('backfill_task_timeline', batch_size=5000, stdout=StringIO())
+        
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    
+    def assertNoFullScan(self, queryset):
+        plan = queryset.explain()
+        table = queryset.model._meta.db_table
+        if connection.vendor == 'postgresql':
+            full_scan = f'Seq Scan on {table}' in plan
+        else:
+            full_scan = re.search(rf'\bSCAN {table}\b(?! USING)', plan) is not None
+        self.assertFalse(full_scan, f"Full table scan in plan:\n{plan}")
+    
+    def test_open_feed_uses_index(self):
+        """Test the nearby/bot feed: open upcoming tasks by time."""
+        self.assertNoFullScan(Task.objects.open_feed()[:10])
+    
+    def test_expiry_sweep_uses_index(self):
+        """Test the sweeper's batch query: past-due rows of the open partial index."""
+        self.assertNoFullScan(expiry.past_due()[:500])
+    
+    def test_changes_use_index(self):
+        """Test delta sync from a recent cursor: a range of the (change_seq, id) index."""
+        self.assertNoFullScan(changes.changes_after(1000, 0)[:101])
+    
+    def test_task_list_uses_index(self):
+        """Test the task list, with and without a status filter."""
+        self.assertNoFullScan(Task.objects.upcoming()[:10])
+        self.assertNoFullScan(Task.objects.upcoming().filter(status=Task.TaskStatus.OPEN)[:10])
+    
+    def test_nearby_uses_index(self):
+        """Test the coordinate search: geohash ranges over the open rows."""
+        self.assertNoFullScan(Task.objects.nearby(25.0330, 121.5654, 2000))
+    
+    @unittest.skipUnless(connection.vendor == 'postgresql', "Search indexes are PostgreSQL-only")
+    def test_search_uses_index(self):
+        """Test text search: the search vector for words, trigrams for CJK text."""
+        self.assertNoFullScan(search.fulltext_matches(Task.objects.open_feed(), 'task'))
+        self.assertNoFullScan(search.trigram_matches(Task.objects.open_feed(), '遛狗'))
+    
+    def test_user_history_uses_index(self):
+        """Test my-tasks for every role."""
+        user = self.users[0]
+        for role in ('poster', 'taker', 'all'):
+            with self.subTest(role=role):
+                self.assertNoFullScan(TimelineEntry.objects.for_user(user, role)[:10])
+
+
+class TaskQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Pin every task endpoint to a query count that does not grow with rows."""
+    
+    def setUp(self):
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.taker = User.objects.create(line_id='taker_line_id', display_name='Taker')
+        self.client = APIClient()
+        self.client.force_authenticate(self.taker)
+        self.add_tasks(1)
+    
+    def add_tasks(self, count):
+        for i in range(count):
+            open_task = Task.objects.create(
+                title='Open Task',
+                description='Open',
+                location='Test Location',
+                time=timezone.now() + timezone.timedelta(days=1),
+                poster=self.poster
+            )
+            done_task = Task.objects.create(
+                title='Done Task',
+                description='Done',
+                location='Test Location',
+                time=timezone.now() + timezone.timedelta(days=1),
+                poster=self.poster,
+                taker=self.taker,
+                status=Task.TaskStatus.DONE
+            )
+            ThanksMessage.objects.create(task=done_task, sender=self.poster, message='Thanks!')
+        return open_task, done_task
+    
+    def get(self, name, *args):
+        response = self.client.get(reverse(name, args=args))
+        self.assertEqual(response.status_code, 200)
+    
+    def test_task_list(self):
+        """Test that the task list costs a single select."""
+        self.assertConstantQueries(
+            1, lambda: self.get('tasks:task-list-create'), lambda: self.add_tasks(10)
+        )
+    
+    def test_user_tasks(self):
+        """Test that my-tasks costs a single select."""
+        self.assertConstantQueries(
+            1, lambda: self.get('tasks:user-tasks'), lambda: self.add_tasks(10)
+        )
+    
+    def test_nearby_tasks(self):
+        """Test that the nearby feed costs a single select."""
+        self.assertConstantQueries(
+            1, lambda: self.get('tasks:nearby-tasks'), lambda: self.add_tasks(10)
+        )
+    
+    def test_task_detail_with_thanks(self):
+        """Test that a task, its users and its thanks message load in one query."""
+        _, done_task = self.add_tasks(1)
+        
+        with self.assertQueryBudget(1):
+            self.get('tasks:task-detail', done_task.id)
+    
+    def test_take_and_complete(self):
+        """Test that transitions do not lazily load related rows."""
+        open_task, _ = self.add_tasks(1)
+        
+        # Load, then in a savepoint the conditional UPDATE and the timeline
+        # upsert, then the notification INSERT
+        with self.assertQueryBudget(6):
+            response = self.client.post(reverse('tasks:task-take', args=[open_task.id]))
+        self.assertEqual(response.status_code, 200)
+        
+        # Load, then in one transaction: task UPDATE, timeline upsert, EXP
+        # UPDATE + read back, and two writes each to the rank tree and the
+        # EXP rollups (each in a savepoint), then the notification INSERT
+        with self.assertQueryBudget(14):
+            response = self.client.post(reverse('tasks:task-complete', args=[open_task.id]))
+        self.assertEqual(response.status_code, 200)
+
+
+class KeysetPaginationTests(QueryBudgetMixin, TestCase):
+    """Test cursor pagination of the task feeds."""
+    
+    def setUp(self):
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.client = APIClient()
+        self.client.force_authenticate(self.poster)
+        
+        # Groups of tasks share a time, so the id tie-breaker matters
+        base = timezone.now() + timezone.timedelta(days=1)
+        self.tasks = Task.objects.bulk_create([
+            Task(
+                title=f'Task {i}',
+                description='Paged',
+                location='Test Location',
+                time=base + timezone.timedelta(minutes=i // 4),
+                poster=self.poster
+            )
+            for i in range(23)
+        ])
+    
+    def walk(self, url, key='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([task['id'] for task in response.data['results']])
+            url = response.data[key]
+        return pages
+    
+    def test_walks_every_task_once_in_order(self):
+        """Test that following next links visits every task once, in feed order."""
+        pages = self.walk(reverse('tasks:task-list-create') + '?page_size=5')
+        
+        expected = [
+            task.id for task in sorted(self.tasks, key=lambda t: (t.time, t.id), reverse=True)
+        ]
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+        self.assertEqual(sum(pages, []), expected)
+    
+    def test_ascending_feed_and_previous_links(self):
+        """Test the soonest-first nearby feed forwards, then back via previous links."""
+        url = reverse('tasks:nearby-tasks') + '?page_size=4'
+        forward = self.walk(url)
+        self.assertEqual(
+            sum(forward, []),
+            [task.id for task in sorted(self.tasks, key=lambda t: (t.time, t.id))]
+        )
+        
+        last_page = self.client.get(url)
+        while last_page.data['next']:
+            last_page = self.client.get(last_page.data['next'])
+        self.assertIsNone(last_page.data['next'])
+        
+        backward = self.walk(last_page.data['previous'], key='previous')
+        self.assertEqual(backward, forward[-2::-1])
+    
+    def test_deep_page_costs_the_same(self):
+        """Test that a page deep in the feed runs the same single query as the first."""
+        url = reverse('tasks:task-list-create') + '?page_size=2'
+        deep_url = url
+        for _ in range(9):
+            deep_url = self.client.get(deep_url).data['next']
+        
+        with self.assertQueryBudget(1):
+            self.client.get(url)
+        with self.assertQueryBudget(1):
+            deep = self.client.get(deep_url)
+        
+        self.assertEqual(len(deep.data['results']), 2)
+        self.assertNotIn('count', deep.data)
+    
+    def test_invalid_cursor(self):
+        """Test that a tampered cursor is rejected with 404."""
+        response = self.client.get(reverse('tasks:task-list-create') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class NearbySearchTests(TestCase):
+    """Test the coordinate-based nearby search."""
+    
+    # Taipei 101
+    LAT, LNG = 25.0340, 121.5645
+    METRES_PER_DEGREE = geo.EARTH_RADIUS_M * math.pi / 180
+    
+    def offset(self, north, east):
+        """Coordinates ``north`` and ``east`` metres away from the search point."""
+        return (
+            self.LAT + north / self.METRES_PER_DEGREE,
+            self.LNG + east / (self.METRES_PER_DEGREE * math.cos(math.radians(self.LAT)))
+        )
+    
+    def setUp(self):
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.client = APIClient()
+        self.client.force_authenticate(self.poster)
+        self.url = reverse('tasks:nearby-tasks')
+    
+    def create_task(self, title, north, east, **kwargs):
+        """Create a task ``north`` and ``east`` metres away from the search point."""
+        latitude, longitude = self.offset(north, east)
+        return create_task(self.poster, title, latitude=latitude, longitude=longitude, **kwargs)
+    
+    def test_geohash(self):
+        """Test encoding against a known geohash and that saving keeps it in sync."""
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        
+        task = self.create_task('Moved', 0, 0)
+        self.assertEqual(task.geohash, geo.encode(task.latitude, task.longitude))
+        
+        task.latitude, task.longitude = 48.8584, 2.2945
+        task.save(update_fields=['latitude', 'longitude'])
+        task.refresh_from_db()
+        self.assertEqual(task.geohash, geo.encode(48.8584, 2.2945))
+    
+    def test_covering_ranges_contain_nearby_points(self):
+        """Test that every point inside the radius falls in a covering range."""
+        ranges = geo.covering_ranges(self.LAT, self.LNG, 1000)
+        for north in range(-950, 1000, 190):
+            for east in range(-950, 1000, 190):
+                lat, lng = self.offset(north, east)
+                if geo.distance(self.LAT, self.LNG, lat, lng) > 1000:
+                    continue
+                geohash = geo.encode(lat, lng)
+                self.assertTrue(
+                    any(start <= geohash and (stop is None or geohash < stop)
+                        for start, stop in ranges),
+                    f"{geohash} not covered"
+                )
+    
+    def test_nearest_first_within_radius(self):
+        """Test that open tasks in the radius come back nearest first with distances."""
+        far = self.create_task('Far', 1500, 0)
+        near = self.create_task('Near', 0, 200)
+        middle = self.create_task('Middle', -600, -600)
+        self.create_task('Outside', 0, 2600)
+        self.create_task('Taken', 0, 100, status=Task.TaskStatus.TAKEN)
+        
+        response = self.client.get(self.url, {'lat': self.LAT, 'lng': self.LNG, 'radius': 2000})
+        self.assertEqual(response.status_code, 200)
+        
+        results = response.data['results']
+        self.assertEqual([task['id'] for task in results], [near.id, middle.id, far.id])
+        self.assertAlmostEqual(results[0]['distance'], 200, delta=5)
+        self.assertAlmostEqual(results[2]['distance'], 1500, delta=5)
+        
+        response = self.client.get(self.url, {'lat': self.LAT, 'lng': self.LNG, 'limit': 1})
+        self.assertEqual([task['id'] for task in response.data['results']], [near.id])
+    
+    def test_invalid_parameters(self):
+        """Test that missing or out-of-range coordinates are rejected."""
+        for params in (
+            {'lat': self.LAT},
+            {'lat': 'north', 'lng': self.LNG},
+            {'lat': 91, 'lng': self.LNG},
+            {'lat': self.LAT, 'lng': self.LNG, 'radius': 10 ** 9},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+    
+    def test_keyword_fallback(self):
+        """Test that the location keyword search still works without coordinates."""
+        task = self.create_task('Keyword', 0, 0)
+        
+        response = self.client.get(self.url, {'location': 'taipei'})
+        self.assertEqual([result['id'] for result in response.data['results']], [task.id])
+
+
+class TaskSearchTests(TestCase):
+    """Test the text search endpoint."""
+    
+    def setUp(self):
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.client = APIClient()
+        self.client.force_authenticate(self.poster)
+        self.url = reverse('tasks:task-search')
+    
+    def search(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [task['id'] for task in response.data['results']]
+    
+    def test_tokenize(self):
+        """Test that words are lowercased and CJK runs split into character pairs."""
+        self.assertEqual(search.tokenize('Walk the DOG'), ['walk', 'the', 'dog'])
+        self.assertEqual(search.tokenize('幫忙遛狗 x2'), ['幫忙', '忙遛', '遛狗', 'x2'])
+    
+    def test_ranks_title_matches_first(self):
+        """Test that matches are ranked, title above description, and all terms are required."""
+        in_description = create_task(self.poster, 'Errand', 'Walk my dog around the park')
+        in_title = create_task(self.poster, 'Walk the dog', 'Thirty minutes')
+        create_task(self.poster, 'Walk to the store', 'Buy milk')
+        
+        self.assertEqual(self.search('walk dog'), [in_title.id, in_description.id])
+        self.assertEqual(self.search('DOG', limit=1), [in_title.id])
+    
+    def test_chinese_text(self):
+        """Test that Traditional Chinese tasks are found by substrings of any length."""
+        walk = create_task(self.poster, '幫忙遛狗', '下午三點，大約三十分鐘')
+        coffee = create_task(self.poster, '買咖啡', '順便幫我遛狗', location='信義區')
+        create_task(self.poster, '搬家', '需要兩個人')
+        
+        self.assertEqual(self.search('遛狗'), [walk.id, coffee.id])
+        self.assertEqual(self.search('咖啡'), [coffee.id])
+        self.assertEqual(self.search('狗'), [walk.id, coffee.id])
+        self.assertEqual(self.search('信義'), [coffee.id])
+    
+    def test_only_open_upcoming_tasks(self):
+        """Test that taken and past tasks are not returned."""
+        task = create_task(self.poster, 'Water plants')
+        create_task(self.poster, 'Water plants', status=Task.TaskStatus.TAKEN)
+        create_task(self.poster, 'Water plants', time=timezone.now() - timezone.timedelta(days=1))
+        
+        self.assertEqual(self.search('plants'), [task.id])
+    
+    def test_invalid_parameters(self):
+        """Test that a missing or overlong query and a bad limit are rejected."""
+        for params in ({}, {'q': '  '}, {'q': 'x' * 101}, {'q': 'dog', 'limit': 0}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+
+
+class FeedCacheTests(QueryBudgetMixin, TestCase):
+    """Test the versioned cache in front of the task list."""
+    
+    def setUp(self):
+        caches[settings.TASK_FEED_CACHE_ALIAS].clear()
+        feed_cache.counters.reset()
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.taker = User.objects.create(line_id='taker_line_id', display_name='Taker')
+        self.client = APIClient()
+        self.client.force_authenticate(self.taker)
+        self.url = reverse('tasks:task-list-create')
+        self.task = create_task(self.poster, 'Cached')
+    
+    def list_statuses(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return {task['title']: task['status'] for task in response.data['results']}
+    
+    def test_repeated_reads_skip_the_database(self):
+        """Test that a page is built once, and separately per filter."""
+        self.assertEqual(self.list_statuses(), {'Cached': 'open'})
+        with self.assertQueryBudget(0):
+            self.assertEqual(self.list_statuses(), {'Cached': 'open'})
+        
+        self.assertEqual(self.list_statuses(status='done'), {})
+        
+        stats = metrics.collect()['task_feed_cache']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+        self.assertEqual(stats['hit_ratio'], 0.333)
+        self.assertGreater(stats['rebuild_ms_avg'], 0)
+    
+    def test_writes_invalidate(self):
+        """Test that creating, taking and completing a task are seen on the next read."""
+        self.list_statuses()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            create_task(self.poster, 'New')
+        self.assertEqual(self.list_statuses(), {'Cached': 'open', 'New': 'open'})
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.task.take(self.taker)
+        self.assertEqual(self.list_statuses()['Cached'], 'taken')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.task.complete()
+        self.assertEqual(self.list_statuses()['Cached'], 'done')
+    
+    def test_user_changes_invalidate(self):
+        """Test that renaming or crediting a user shown in the feed is seen on the next read."""
+        url_etag = self.client.get(self.url)['ETag']
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.poster.display_name = 'Renamed'
+            self.poster.save(update_fields=['display_name'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=url_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['poster']['display_name'], 'Renamed')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.credit_exp(self.poster.pk, 500)
+        response = self.client.get(self.url)
+        self.assertGreater(response.data['results'][0]['poster']['level'], 1)
+        
+        version = feed_cache.version()
+        self.poster.last_login = timezone.now()
+        self.poster.save(update_fields=['last_login'])
+        self.assertEqual(feed_cache.version(), version)
+    
+    def test_rebuild_before_commit_is_dropped(self):
+        """Test that a page rebuilt between a write and its commit is not served after."""
+        self.list_statuses()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.task.take(self.taker)
+            # What a concurrent reader would cache before the commit
+            version = feed_cache.version()
+        
+        self.assertGreater(feed_cache.version(), version)
+
+
+class TaskETagTests(QueryBudgetMixin, TestCase):
+    """Test conditional requests against task versions."""
+    
+    def setUp(self):
+        caches[settings.TASK_FEED_CACHE_ALIAS].clear()
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.taker = User.objects.create(line_id='taker_line_id', display_name='Taker')
+        self.client = APIClient()
+        self.client.force_authenticate(self.taker)
+        self.task = Task.objects.create(
+            title='Versioned',
+            description='ETags',
+            location='Taipei',
+            time=timezone.now() + timezone.timedelta(days=1),
+            poster=self.poster
+        )
+        self.detail_url = reverse('tasks:task-detail', args=[self.task.id])
+    
+    def test_versions_increase_with_every_write(self):
+        """Test that edits, transitions and thanks each bump the version."""
+        self.assertEqual(self.task.version, 1)
+        
+        self.task.reward = 30
+        self.task.save(update_fields=['reward'])
+        self.task.take(self.taker)
+        self.task.complete()
+        self.assertEqual(self.task.version, 4)
+        
+        ThanksMessage.objects.create(task=self.task, sender=self.poster, message='Thanks!')
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.version, 5)
+    
+    def test_detail_not_modified(self):
+        """Test that a matching If-None-Match gets a 304 from one small query."""
+        etag = self.client.get(self.detail_url)['ETag']
+        
+        with self.assertQueryBudget(1):
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        
+        self.task.take(self.taker)
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_detail_etag_follows_nested_users(self):
+        """Test that renaming the poster or levelling up the taker changes the task's ETag."""
+        self.task.take(self.taker)
+        etag = self.client.get(self.detail_url)['ETag']
+        
+        self.poster.display_name = 'Renamed'
+        self.poster.save(update_fields=['display_name'])
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['poster']['display_name'], 'Renamed')
+        etag = response['ETag']
+        
+        User.objects.credit_exp(self.taker.pk, 500)
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+    
+    def test_if_match_ignores_nested_users(self):
+        """Test that a poster's rename does not make a take with the task's ETag stale."""
+        url = reverse('tasks:task-take', args=[self.task.id])
+        etag = self.client.get(self.detail_url)['ETag']
+        
+        self.poster.display_name = 'Renamed'
+        self.poster.save(update_fields=['display_name'])
+        response = self.client.post(url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+    
+    def test_list_not_modified(self):
+        """Test that an unchanged feed page gets a 304 and a changed one does not."""
+        url = reverse('tasks:task-list-create')
+        etag = self.client.get(url)['ETag']
+        
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=f'W/{etag}')
+        self.assertEqual(response.status_code, 304)
+        
+        self.task.take(self.taker)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['status'], 'taken')
+    
+    def test_list_etag_follows_nested_users(self):
+        """Test that a feed page showing a renamed poster gets a new ETag."""
+        url = reverse('tasks:task-list-create')
+        etag = self.client.get(url)['ETag']
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.poster.display_name = 'Renamed'
+            self.poster.save(update_fields=['display_name'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_take_if_match(self):
+        """Test that take fails with 412 on a stale ETag and succeeds on the current one."""
+        url = reverse('tasks:task-take', args=[self.task.id])
+        etag = self.client.get(self.detail_url)['ETag']
+        
+        self.task.description = 'Edited'
+        self.task.save()
+        response = self.client.post(url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, Task.TaskStatus.OPEN)
+        
+        etag = self.client.get(self.detail_url)['ETag']
+        response = self.client.post(url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], self.client.get(self.detail_url)['ETag'])
+    
+    def test_take_lost_update(self):
+        """Test that a write landing between the check and the take is not overwritten."""
+        expected = self.task.version
+        Task.objects.filter(pk=self.task.pk).update(version=expected + 1)
+        
+        self.assertIs(self.task.take(self.taker, expected_version=expected), TakeResult.STALE)
+        self.task.refresh_from_db()
+        self.assertIsNone(self.task.taker)
+    
+    def test_complete_if_match(self):
+        """Test that complete honours If-Match."""
+        self.task.take(self.taker)
+        url = reverse('tasks:task-complete', args=[self.task.id])
+        
+        response = self.client.post(url, HTTP_IF_MATCH='"0-0"')
+        self.assertEqual(response.status_code, 412)
+        
+        etag = self.client.get(self.detail_url)['ETag']
+        response = self.client.post(url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'done')
+
+
+class TimelineTests(TestCase):
+    """Test the per-user task timeline behind my-tasks."""
+    
+    def setUp(self):
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.taker = User.objects.create(line_id='taker_line_id', display_name='Taker')
+        self.client = APIClient()
+        self.client.force_authenticate(self.taker)
+        self.url = reverse('tasks:user-tasks')
+    
+    def entries(self, task):
+        return set(task.timeline_entries.values_list('user__line_id', 'role', 'status'))
+    
+    def my_tasks(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [task['title'] for task in response.data['results']]
+    
+    def test_transitions_update_entries(self):
+        """Test that posting, taking and completing fan out to both users' timelines."""
+        task = create_task(self.poster, 'Fan out')
+        self.assertEqual(self.entries(task), {('poster_line_id', 'poster', 'open')})
+        
+        task.take(self.taker)
+        self.assertEqual(self.entries(task), {
+            ('poster_line_id', 'poster', 'taken'), ('taker_line_id', 'taker', 'taken')
+        })
+        
+        task.complete()
+        self.assertEqual(self.entries(task), {
+            ('poster_line_id', 'poster', 'done'), ('taker_line_id', 'taker', 'done')
+        })
+        entry = task.timeline_entries.get(role=TimelineEntry.Role.TAKER)
+        self.assertEqual(entry.updated_at, task.updated_at)
+    
+    def test_my_tasks(self):
+        """Test that my-tasks lists both roles, most recently updated first, with filters."""
+        taken = create_task(self.poster, 'Taken by me')
+        posted = create_task(self.taker, 'Posted by me')
+        create_task(self.poster, 'Not mine')
+        taken.take(self.taker)
+        
+        self.assertEqual(self.my_tasks(), ['Taken by me', 'Posted by me'])
+        self.assertEqual(self.my_tasks(role='poster'), ['Posted by me'])
+        self.assertEqual(self.my_tasks(role='taker'), ['Taken by me'])
+        self.assertEqual(self.my_tasks(status='open'), ['Posted by me'])
+        
+        posted.description = 'Edited'
+        posted.save()
+        self.assertEqual(self.my_tasks(page_size=1), ['Posted by me'])
+    
+    def test_backfill(self):
+        """Test that the backfill rebuilds entries for tasks written around save()."""
+        first = create_task(self.poster, 'Saved')
+        Task.objects.filter(pk=first.pk).update(taker=self.taker, status=Task.TaskStatus.TAKEN)
+        bulk = Task.objects.bulk_create([
+            Task(
+                title=f'Bulk {i}',
+                description='Timeline',
+                location='Taipei',
+                time=timezone.now(),
+                poster=self.taker
+            )
+            for i in range(5)
+        ])
+        TimelineEntry.objects.create(
+            user=self.poster, task=bulk[0], role=TimelineEntry.Role.POSTER,
+            status=Task.TaskStatus.OPEN, updated_at=timezone.now()
+        )
+        
+        out = StringIO()
+        call_command('backfill_task_timeline', batch_size=2, stdout=out)
+        self.assertIn('Backfilled 6 tasks', out.getvalue())
+        
+        self.assertEqual(self.entries(first), {
+            ('poster_line_id', 'poster', 'taken'), ('taker_line_id', 'taker', 'taken')
+        })
+        self.assertEqual(self.entries(bulk[0]), {('taker_line_id', 'poster', 'open')})
+        self.assertEqual(TimelineEntry.objects.count(), 7)
+
+
+class TaskBatchCreateTests(QueryBudgetMixin, TestCase):
+    """Test creating tasks in bulk."""
+    
+    def setUp(self):
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.client = APIClient()
+        self.client.force_authenticate(self.poster)
+        self.url = reverse('tasks:task-batch-create')
+        self.time = (timezone.now() + timezone.timedelta(days=1)).isoformat()
+    
+    def item(self, title, **fields):
+        return {
+            'title': title,
+            'description': 'From the shop',
+            'location': 'Taipei',
+            'time': self.time,
+            **fields
+        }
+    
+    def test_json_array(self):
+        """Test that a valid batch is inserted with a handful of queries, whatever its size."""
+        items = [self.item(f'Shop task {i}', latitude=25.03, longitude=121.56) for i in range(50)]
+        
+        with self.assertQueryBudget(4):
+            response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 50)
+        
+        ids = [result['id'] for result in response.data['results']]
+        tasks = Task.objects.in_bulk(ids)
+        self.assertEqual([tasks[pk].title for pk in ids], [item['title'] for item in items])
+        self.assertEqual(tasks[ids[0]].geohash, geo.encode(25.03, 121.56))
+        self.assertEqual(TimelineEntry.objects.filter(user=self.poster).count(), 50)
+    
+    def test_partial_failure(self):
+        """Test that invalid items are reported by position and the rest are created."""
+        items = [
+            self.item('Good'),
+            self.item('', reward='lots'),
+            'not an object',
+            self.item('Also good'),
+        ]
+        response = self.client.post(self.url, items, format='json')
+        self.assertEqual(response.status_code, 207)
+        
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'error', 'error', 'created'])
+        self.assertEqual(set(results[1]['errors']), {'title', 'reward'})
+        self.assertEqual(
+            set(Task.objects.values_list('title', flat=True)), {'Good', 'Also good'}
+        )
+    
+    def test_ndjson(self):
+        """Test NDJSON input, with a malformed line reported in place."""
+        body = '\n'.join([
+            json.dumps(self.item('First')),
+            '{"title": ',
+            '',
+            json.dumps(self.item('Second')),
+        ])
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['created', 'error', 'created'])
+    
+    def test_database_error_isolated_to_its_row(self):
+        """Test that a chunk rejected by the database is retried row by row."""
+        tasks = [
+            Task(title=title, description='Bulk', location='Taipei',
+                 time=timezone.now(), poster=self.poster)
+            for title in ('One', None, 'Three')
+        ]
+        errors = Task.objects.create_many(tasks, batch_size=10)
+        
+        self.assertIsNone(errors[0])
+        self.assertIsNotNone(errors[1])
+        self.assertIsNone(errors[2])
+        self.assertIsNone(tasks[1].pk)
+        self.assertEqual(Task.objects.count(), 2)
+    
+    def test_rejected_batches(self):
+        """Test that non-list bodies, oversized and fully invalid batches get a 400."""
+        response = self.client.post(self.url, self.item('Single'), format='json')
+        self.assertEqual(response.status_code, 400)
+        
+        with self.settings(TASK_BATCH_MAX_SIZE=2):
+            response = self.client.post(self.url, [self.item('x')] * 3, format='json')
+        self.assertEqual(response.status_code, 400)
+        
+        response = self.client.post(self.url, [{}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['failed'], 1)
+
+
+class TaskExpiryTests(TestCase):
+    """Test the sweeper that expires past-due open tasks."""
+    
+    def setUp(self):
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.taker = User.objects.create(line_id='taker_line_id', display_name='Taker')
+        expiry.counters.reset()
+    
+    def test_sweep_expires_past_due_open_tasks(self):
+        """Test that only open past-due tasks expire, with their timeline entries."""
+        past = [create_task(self.poster, f'Past {i}', hours=-i - 1) for i in range(5)]
+        upcoming = create_task(self.poster, 'Upcoming', hours=1)
+        taken = create_task(self.poster, 'Taken', hours=-1, taker=self.taker, status=Task.TaskStatus.TAKEN)
+        self.assertGreater(expiry.lag(), 3600)
+        
+        version = feed_cache.version()
+        self.assertEqual(expiry.sweep(batch_size=2), 5)
+        self.assertGreater(feed_cache.version(), version)
+        
+        statuses = dict(Task.objects.values_list('title', 'status'))
+        self.assertEqual({statuses[task.title] for task in past}, {'expired'})
+        self.assertEqual(statuses[upcoming.title], 'open')
+        self.assertEqual(statuses[taken.title], 'taken')
+        
+        past[0].refresh_from_db()
+        self.assertEqual(past[0].version, 2)
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(task__in=past).values_list('status', flat=True)),
+            {'expired'}
+        )
+        self.assertEqual(expiry.lag(), 0)
+        self.assertEqual(expiry.expiry_stats()['expired'], 5)
+    
+    def test_bounded_run_reports_lag(self):
+        """Test that a run stops after max batches and the command reports the rest as lag."""
+        for i in range(5):
+            create_task(self.poster, f'Past {i}', hours=-i - 1)
+        
+        self.assertEqual(expiry.sweep(batch_size=2, max_batches=1), 2)
+        self.assertEqual(Task.objects.filter(status=Task.TaskStatus.OPEN).count(), 3)
+        
+        out = StringIO()
+        call_command('expire_tasks', once=True, stdout=out)
+        self.assertIn('Expired 3 tasks', out.getvalue())
+        self.assertIn('lag 0.0s', out.getvalue())
+    
+    def test_expired_tasks_cannot_be_taken(self):
+        """Test that an expired task is unavailable."""
+        task = create_task(self.poster, 'Late', hours=-1)
+        expiry.sweep()
+        
+        task.refresh_from_db()
+        self.assertIs(task.take(self.taker), TakeResult.UNAVAILABLE)
+
+
+@override_settings(TASK_LIVE=True)
+class LiveFeedTests(TestCase):
+    """Test the live task feed and its broadcast hub."""
+    
+    def setUp(self):
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.taker = User.objects.create(line_id='taker_line_id', display_name='Taker')
+        self.addCleanup(live.hub.subscribers.clear)
+        # Events are handed to the hub directly; a LISTEN thread would keep a
+        # connection to the test database open after the run
+        listener = patch.object(live.Hub, '_ensure_listener')
+        listener.start()
+        self.addCleanup(listener.stop)
+    
+    def payload(self, kind, **fields):
+        task = Task(id=1, title='Event', reward=10, location='Taipei', latitude=None,
+                    longitude=None, time=timezone.now(), status='open', version=1)
+        for name, value in fields.items():
+            setattr(task, name, value)
+        return json.dumps(live.event_for(kind, task), cls=DjangoJSONEncoder)
+    
+    def events(self, subscription):
+        frames = []
+        while not subscription.queue.empty():
+            frames.append(subscription.queue.get_nowait())
+        return [re.match(rb'event: (\w+)', frame).group(1).decode() for frame in frames]
+    
+    async def test_hub_filters_by_status_and_location(self):
+        """Test that subscribers only get events matching their filters."""
+        everything = live.hub.subscribe()
+        open_feed = live.hub.subscribe(statuses=['open'])
+        nearby = live.hub.subscribe(lat=25.0330, lng=121.5654, radius=1000)
+        
+        live.hub.fan_out([
+            self.payload('created', latitude=25.0340, longitude=121.5645),
+            self.payload('created', latitude=25.1000, longitude=121.5654),
+            self.payload('taken', status='taken'),
+            self.payload('completed', status='done'),
+        ])
+        
+        self.assertEqual(self.events(everything), ['created', 'created', 'taken', 'completed'])
+        # A task leaving the open set is still news to an open-feed subscriber
+        self.assertEqual(self.events(open_feed), ['created', 'created', 'taken'])
+        self.assertEqual(self.events(nearby), ['created'])
+    
+    @unittest.skipIf(connection.vendor == 'postgresql', "NOTIFY needs a commit, see LiveNotifyTests")
+    async def test_task_writes_publish_after_commit(self):
+        """Test that creating, taking and completing a task each publish an event."""
+        subscription = live.hub.subscribe()
+        
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                task = create_task(self.poster, 'Live task')
+                self.assertTrue(subscription.queue.empty())
+            with self.captureOnCommitCallbacks(execute=True):
+                task.take(self.taker)
+            with self.captureOnCommitCallbacks(execute=True):
+                task.complete()
+            return task
+        
+        task = await sync_to_async(write)()
+        frames = [await asyncio.wait_for(subscription.queue.get(), 1) for _ in range(3)]
+        
+        events = [json.loads(frame.split(b'data: ', 1)[1]) for frame in frames]
+        self.assertEqual([event['event'] for event in events], ['created', 'taken', 'completed'])
+        self.assertEqual([event['task']['version'] for event in events], [1, 2, 3])
+        self.assertEqual(events[-1]['task']['id'], task.pk)
+        self.assertEqual(events[-1]['previous_status'], 'taken')
+    
+    @override_settings(TASK_LIVE_QUEUE_SIZE=2)
+    async def test_slow_subscriber_is_dropped(self):
+        """Test that a subscriber that stops reading is disconnected."""
+        subscription = live.hub.subscribe()
+        stream = live.stream(subscription)
+        self.assertEqual(await stream.__anext__(), b'retry: 3000\n\n')
+        
+        live.hub.fan_out([self.payload('created') for _ in range(3)])
+        
+        self.assertNotIn(subscription, live.hub.subscribers)
+        with self.assertRaises(StopAsyncIteration):
+            await stream.__anext__()
+        self.assertEqual(live.live_stats()['dropped'], 1)
+    
+    async def test_stream_view(self):
+        """Test that the view streams matching events to an authenticated client."""
+        url = reverse('tasks:task-live')
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 401)
+        
+        await sync_to_async(self.async_client.force_login)(self.taker)
+        response = await self.async_client.get(url, {'lat': 25, 'lng': 121, 'radius': 10 ** 9})
+        self.assertEqual(response.status_code, 400)
+        
+        response = await self.async_client.get(url, {'status': 'open'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        
+        stream = response.streaming_content
+        self.assertEqual(await stream.__anext__(), b'retry: 3000\n\n')
+        await sync_to_async(live.hub.dispatch)(self.payload('created'))
+        self.assertTrue((await stream.__anext__()).startswith(b'event: created\n'))
+        await stream.aclose()
+    
+    @override_settings(TASK_LIVE_MAX_AGE=0)
+    async def test_stream_ends_after_max_age(self):
+        """Test that streams end on their own, so dead connections are released."""
+        stream = live.stream(live.hub.subscribe())
+        self.assertEqual(await stream.__anext__(), b'retry: 3000\n\n')
+        with self.assertRaises(StopAsyncIteration):
+            await stream.__anext__()
+        self.assertFalse(live.hub.subscribers)
+    
+    @override_settings(TASK_LIVE=False)
+    def test_disabled(self):
+        """Test that nothing is published or streamed unless the feed is enabled."""
+        self.client.force_login(self.taker)
+        self.assertEqual(self.client.get(reverse('tasks:task-live')).status_code, 404)
+        
+        live.counters.reset()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_task(self.poster, 'Quiet task')
+        self.assertEqual(live.counters.get('published'), 0)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "NOTIFY is PostgreSQL-only")
+@override_settings(TASK_LIVE=True)
+class LiveNotifyTests(TransactionTestCase):
+    """Test that task events reach other processes over PostgreSQL NOTIFY, once committed."""
+    
+    def setUp(self):
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.taker = User.objects.create(line_id='taker_line_id', display_name='Taker')
+        # What another process's Listener sees
+        self.listener = connections.create_connection('default')
+        self.addCleanup(self.listener.close)
+        with self.listener.cursor() as cursor:
+            cursor.execute(f'LISTEN {self.listener.ops.quote_name(settings.TASK_LIVE_CHANNEL)}')
+    
+    def notifications(self, count, timeout=1):
+        raw = self.listener.connection
+        events = []
+        deadline = time.monotonic() + timeout
+        while len(events) < count and time.monotonic() < deadline:
+            select.select([raw], [], [], 0.05)
+            raw.poll()
+            events += [json.loads(notify.payload) for notify in raw.notifies]
+            raw.notifies.clear()
+        return events
+    
+    def test_task_writes_notify_on_commit(self):
+        """Test that creating, taking and completing a task each notify, after commit."""
+        with transaction.atomic():
+            task = create_task(self.poster, 'Live task')
+            self.assertEqual(self.notifications(1, timeout=0.2), [])
+        task.take(self.taker)
+        task.complete()
+        
+        events = self.notifications(3)
+        self.assertEqual([event['event'] for event in events], ['created', 'taken', 'completed'])
+        self.assertEqual([event['task']['version'] for event in events], [1, 2, 3])
+        self.assertEqual(events[-1]['task']['id'], task.pk)
+        self.assertEqual(events[-1]['previous_status'], 'taken')
+
+
+class TaskChangesTests(QueryBudgetMixin, TransactionTestCase):
+    """
+    Test delta sync of the open feed.
+    
+    Writes have to commit: on PostgreSQL a change is only handed out once
+    its transaction has finished, which never happens inside a ``TestCase``.
+    """
+    
+    def setUp(self):
+        self.poster = User.objects.create(line_id='poster_line_id', display_name='Poster')
+        self.taker = User.objects.create(line_id='taker_line_id', display_name='Taker')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.taker)
+        self.url = reverse('tasks:task-changes')
+    
+    def sync(self, cursor, **params):
+        response = self.client.get(self.url, {'since': cursor, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+    
+    def test_changes_since_cursor(self):
+        """Test that new tasks come as upserts and departed ones as tombstones."""
+        cursor = self.client.get(self.url).data['cursor']
+        taken = create_task(self.poster, 'Taken')
+        deleted = create_task(self.poster, 'Deleted')
+        past_due = create_task(self.poster, 'Past due')
+        kept = create_task(self.poster, 'Kept')
+        
+        data = self.sync(cursor)
+        self.assertEqual(
+            [change['task']['id'] for change in data['changes']],
+            [taken.pk, deleted.pk, past_due.pk, kept.pk]
+        )
+        self.assertEqual({change['op'] for change in data['changes']}, {'upsert'})
+        self.assertFalse(data['has_more'])
+        cursor = data['cursor']
+        
+        taken.take(self.taker)
+        deleted_pk = deleted.pk
+        deleted.delete()
+        Task.objects.filter(pk=past_due.pk).update(time=timezone.now() - timezone.timedelta(hours=1))
+        
+        data = self.sync(cursor)
+        self.assertEqual(data['changes'], [
+            {'op': 'remove', 'id': taken.pk, 'status': 'taken'},
+            {'op': 'remove', 'id': deleted_pk, 'status': 'deleted'},
+            {'op': 'remove', 'id': past_due.pk, 'status': 'expired'},
+        ])
+        self.assertTrue(DeletedTask.objects.filter(task_id=deleted_pk).exists())
+    
+    def test_cascading_deletes_leave_tombstones(self):
+        """Test that tasks deleted with their poster, or by a queryset, are synced as removed."""
+        cursor = self.client.get(self.url).data['cursor']
+        bulk = create_task(self.poster, 'Bulk deleted')
+        other = User.objects.create(line_id='other_line_id', display_name='Other')
+        cascaded = create_task(other, 'Cascaded')
+        cursor = self.sync(cursor)['cursor']
+        
+        Task.objects.filter(pk=bulk.pk).delete()
+        other.delete()
+        
+        data = self.sync(cursor)
+        self.assertEqual(data['changes'], [
+            {'op': 'remove', 'id': bulk.pk, 'status': 'deleted'},
+            {'op': 'remove', 'id': cascaded.pk, 'status': 'deleted'},
+        ])
+    
+    def test_up_to_date_client_costs_one_query(self):
+        """Test that a client with nothing to sync gets its cursor back from one query."""
+        create_task(self.poster, 'Seen')
+        cursor = self.sync(self.client.get(self.url).data['cursor'])['cursor']
+        
+        with self.assertQueryBudget(1):
+            data = self.sync(cursor)
+        self.assertEqual(data, {'changes': [], 'cursor': cursor, 'has_more': False})
+    
+    def test_batches_cover_every_change_once(self):
+        """Test that following the cursor returns each change exactly once."""
+        cursor = self.client.get(self.url).data['cursor']
+        tasks = [create_task(self.poster, f'Task {i}') for i in range(5)]
+        
+        seen = []
+        while True:
+            data = self.sync(cursor, limit=2)
+            self.assertLessEqual(len(data['changes']), 2)
+            seen += [change['task']['id'] for change in data['changes']]
+            cursor = data['cursor']
+            if not data['has_more']:
+                break
+        self.assertEqual(seen, [task.pk for task in tasks])
+    
+    def test_changes_follow_write_order_not_clocks(self):
+        """Test that a write stamped with a skewed clock still comes after the cursor."""
+        cursor = self.client.get(self.url).data['cursor']
+        skewed = create_task(self.poster, 'Skewed')
+        Task.objects.filter(pk=skewed.pk).update(updated_at=timezone.now() - timezone.timedelta(hours=1))
+        
+        data = self.sync(cursor)
+        self.assertEqual([change['task']['id'] for change in data['changes']], [skewed.pk])
+    
+    def test_every_write_is_stamped(self):
+        """Test that each write, through the model or not, moves the sequence past the last one."""
+        task = create_task(self.poster, 'Stamped')
+        created = Task.objects.values_list('change_seq', flat=True).get(pk=task.pk)
+        Task.objects.filter(pk=task.pk).update(title='Renamed')
+        renamed = Task.objects.values_list('change_seq', flat=True).get(pk=task.pk)
+        self.assertGreater(renamed, created)
+        
+        task_pk = task.pk
+        task.delete()
+        tombstone = DeletedTask.objects.values_list('change_seq', flat=True).get(task_id=task_pk)
+        self.assertGreater(tombstone, renamed)
+    
+    @unittest.skipUnless(connection.vendor == 'postgresql', "Only PostgreSQL runs transactions side by side")
+    def test_open_transaction_holds_back_later_changes(self):
+        """Test that a change committed after a still-open one waits for it, and both arrive in order."""
+        cursor = self.client.get(self.url).data['cursor']
+        slow = create_task(self.poster, 'Slow')
+        
+        other = connections.create_connection('default')
+        self.addCleanup(other.close)
+        other.set_autocommit(False)
+        with other.cursor() as other_cursor:
+            other_cursor.execute(
+                f'UPDATE {other.ops.quote_name(Task._meta.db_table)} SET title = %s WHERE id = %s',
+                ['Slower', slow.pk]
+            )
+        fast = create_task(self.poster, 'Fast')
+        
+        data = self.sync(cursor)
+        self.assertEqual([change['task']['id'] for change in data['changes']], [slow.pk])
+        cursor = data['cursor']
+        
+        other.commit()
+        data = self.sync(cursor)
+        self.assertEqual([change['task']['id'] for change in data['changes']], [slow.pk, fast.pk])
+        self.assertEqual(data['changes'][0]['task']['title'], 'Slower')
+    
+    def test_invalid_cursor(self):
+        """Test that a malformed cursor, or a timestamp one from before sequences, is rejected."""
+        response = self.client.get(self.url, {'since': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'since': changes.encode(timezone.now().isoformat(), 1)})
+        self.assertEqual(response.status_code, 400)
@@ -5,10 +5,14 @@ app_name = 'tasks'
 
 urlpatterns = [
     path('', views.TaskListCreateView.as_view(), name='task-list-create'),
+    path('batch/', views.TaskBatchCreateView.as_view(), name='task-batch-create'),
     path('<int:pk>/', views.TaskDetailView.as_view(), name='task-detail'),
     path('<int:pk>/take/', views.TaskTakeView.as_view(), name='task-take'),
     path('<int:pk>/complete/', views.TaskCompleteView.as_view(), name='task-complete'),
     path('thanks/', views.ThanksMessageCreateView.as_view(), name='thanks-create'),
     path('my-tasks/', views.UserTasksView.as_view(), name='user-tasks'),
     path('nearby/', views.NearbyTasksView.as_view(), name='nearby-tasks'),
+    path('search/', views.TaskSearchView.as_view(), name='task-search'),
+    path('changes/', views.TaskChangesView.as_view(), name='task-changes'),
+    path('live/', views.task_live_stream, name='task-live'),
 ]
\ No newline at end of file
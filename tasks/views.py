@@ -1,27 +1,145 @@
-from rest_framework import generics, permissions, status
+import hashlib
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from rest_framework import exceptions, generics, permissions, status
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.http import parse_etags, quote_etag
+
+from linebot_core.notifications import notify_task_completed, notify_task_taken
+from users.serializers import UserSerializer
+
+from . import changes, feed_cache, live
+from .models import TakeResult, Task, ThanksMessage, TimelineEntry
+from .pagination import KeysetPagination
+from .parsers import NDJSONParser
+from .serializers import (
+    NearbyTaskSerializer, SearchTaskSerializer, TaskSerializer, TaskDetailSerializer,
+    ThanksMessageSerializer
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_number(params, name, low, high, default=None):
+    """Read a numeric query parameter, raising ValueError if it is missing or out of range."""
+    value = params.get(name)
+    if value is None:
+        if default is None:
+            raise ValueError(f"{name} is required")
+        return default
+    
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+    if not low <= number <= high:
+        raise ValueError(f"{name} must be between {low} and {high}")
+    return number
+
+
+def task_etag(data):
+    """
+    ETag of a serialized task: its version, and the state of the poster and
+    taker nested in it, which change without touching the task.
+    """
+    users = [
+        None if user is None else [user[field] for field in UserSerializer.Meta.fields]
+        for user in (data['poster'], data['taker'])
+    ]
+    digest = hashlib.sha1(json.dumps(users).encode()).hexdigest()[:16]
+    return quote_etag(f"{data['id']}-{data['version']}-{digest}")
+
+
+def stored_task_etag(pk):
+    """ETag of the task with ``pk`` as stored, from one query; None if there is none."""
+    fields = UserSerializer.Meta.fields
+    row = Task.objects.filter(pk=pk).values_list(
+        'version', *[f'poster__{field}' for field in fields], *[f'taker__{field}' for field in fields]
+    ).first()
+    if row is None:
+        return None
+    poster = dict(zip(fields, row[1:len(fields) + 1]))
+    taker = dict(zip(fields, row[len(fields) + 1:]))
+    return task_etag({
+        'id': int(pk), 'version': row[0], 'poster': poster,
+        'taker': taker if taker['id'] is not None else None,
+    })
+
+
+def page_etag(data):
+    """ETag of a feed page: the state of its tasks and where it sits in the feed."""
+    state = [[task['id'], task['version'], task['poster'], task['taker']] for task in data['results']]
+    state += [data.get('next'), data.get('previous')]
+    return quote_etag(hashlib.sha1(json.dumps(state).encode()).hexdigest())
 
-from .models import Task, ThanksMessage
-from .serializers import TaskSerializer, TaskDetailSerializer, ThanksMessageSerializer
+
+def if_none_match(request, etag):
+    """Whether the client's ``If-None-Match`` header already has ``etag`` (weak comparison)."""
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    etags = [tag[2:] if tag.startswith('W/') else tag for tag in parse_etags(header)]
+    return '*' in etags or etag in etags
+
+
+def if_match_version(request, task):
+    """
+    The version an ``If-Match`` header pins a write on ``task`` to, or None
+    when there is no condition. Raises ValueError if the client's ETag is
+    not for the task's current version; the poster's and taker's part of it
+    is not compared, as writes to the task do not depend on them.
+    """
+    header = request.headers.get('If-Match')
+    if not header or header.strip() == '*':
+        return None
+    pinned = quote_etag(f'{task.pk}-{task.version}-')[:-1]
+    if not any(tag.startswith(pinned) for tag in parse_etags(header)):
+        raise ValueError("Task has changed since it was read")
+    return task.version
+
+
+def not_modified(etag):
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
 
 
 class TaskListCreateView(generics.ListCreateAPIView):
     """List all tasks or create a new task."""
     serializer_class = TaskSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticated]
     
+    def list(self, request, *args, **kwargs):
+        """
+        Serve feed pages from the feed cache, see ``tasks.feed_cache``.
+        
+        A client whose ``If-None-Match`` holds the page's ETag gets a 304.
+        """
+        def build():
+            return super(TaskListCreateView, self).list(request, *args, **kwargs).data
+        
+        data = feed_cache.get_or_build('list', request.build_absolute_uri(), build)
+        etag = page_etag(data)
+        if if_none_match(request, etag):
+            return not_modified(etag)
+        return Response(data, headers={'ETag': etag})
+    
     def get_queryset(self):
         """Filter tasks by status if provided."""
-        queryset = Task.objects.all()
+        # Only show tasks that haven't passed their time
+        queryset = Task.objects.with_users().upcoming()
         status = self.request.query_params.get('status')
         
         if status:
             queryset = queryset.filter(status=status)
         
-        # Only show tasks that haven't passed their time
-        return queryset.filter(time__gte=timezone.now())
+        return queryset
     
     def get_serializer_context(self):
         """Add request to serializer context."""
@@ -29,11 +147,100 @@ class TaskListCreateView(generics.ListCreateAPIView):
         return context
 
 
+class TaskBatchCreateView(APIView):
+    """
+    Create many tasks in one request.
+    
+    Accepts a JSON array, or NDJSON (``application/x-ndjson``) with one
+    task per line. Every item is validated, the valid ones are inserted in
+    chunks of ``TASK_BATCH_CHUNK_SIZE``, and the response reports each item
+    by its position: ``created`` with its id, or ``error`` with the reasons.
+    Items that failed can be sent again on their own.
+    """
+    parser_classes = [JSONParser, NDJSONParser]
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def post(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {"error": "Expected a list of tasks"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > settings.TASK_BATCH_MAX_SIZE:
+            return Response(
+                {"error": f"At most {settings.TASK_BATCH_MAX_SIZE} tasks per batch"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = [None] * len(items)
+        tasks, positions = [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = {
+                    'index': index,
+                    'status': 'error',
+                    'errors': {'non_field_errors': ["Expected a JSON object"]}
+                }
+                continue
+            
+            serializer = TaskSerializer(data=item, context={'request': request})
+            if not serializer.is_valid():
+                results[index] = {'index': index, 'status': 'error', 'errors': serializer.errors}
+                continue
+            
+            data = serializer.validated_data
+            data.pop('poster_id', None)
+            tasks.append(Task(poster=request.user, **data))
+            positions.append(index)
+        
+        errors = Task.objects.create_many(tasks, settings.TASK_BATCH_CHUNK_SIZE)
+        for index, task, error in zip(positions, tasks, errors):
+            if error is None:
+                results[index] = {'index': index, 'status': 'created', 'id': task.pk}
+            else:
+                logger.warning(f"Batch task {index} could not be saved: {error}")
+                results[index] = {
+                    'index': index,
+                    'status': 'error',
+                    'errors': {'non_field_errors': ["Task could not be saved"]}
+                }
+        
+        created = sum(result['status'] == 'created' for result in results)
+        if created == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({
+            'created': created,
+            'failed': len(results) - created,
+            'results': results
+        }, status=response_status)
+
+
 class TaskDetailView(generics.RetrieveAPIView):
-    """Retrieve a specific task."""
-    queryset = Task.objects.all()
+    """
+    Retrieve a specific task.
+    
+    Responses carry the task's ETag. A client sending it back in
+    ``If-None-Match`` gets a 304 after one query for the version and the
+    nested users' fields.
+    """
+    queryset = Task.objects.with_details()
     serializer_class = TaskDetailSerializer
     permission_classes = [permissions.IsAuthenticated]
+    
+    def retrieve(self, request, *args, **kwargs):
+        if request.headers.get('If-None-Match'):
+            etag = stored_task_etag(kwargs['pk'])
+            if etag is not None and if_none_match(request, etag):
+                return not_modified(etag)
+        
+        response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = task_etag(response.data)
+        return response
 
 
 class TaskTakeView(APIView):
@@ -42,36 +249,40 @@ class TaskTakeView(APIView):
     
     def post(self, request, pk):
         try:
-            task = Task.objects.get(pk=pk)
+            task = Task.objects.with_details().get(pk=pk)
         except Task.DoesNotExist:
             return Response(
                 {"error": "Task not found"}, 
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # Check if task can be taken
-        if task.status != Task.TaskStatus.OPEN:
-            return Response(
-                {"error": "Task is not available"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        try:
+            expected_version = if_match_version(request, task)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_412_PRECONDITION_FAILED)
+        
+        # Take the task; the model resolves races between concurrent takers
+        result = task.take(request.user, expected_version)
         
-        # Check if user is the poster
-        if request.user == task.poster:
+        if result is TakeResult.OWN_TASK:
             return Response(
                 {"error": "You cannot take your own task"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Take the task
-        success = task.take(request.user)
+        if result is TakeResult.STALE:
+            return Response(
+                {"error": "Task has changed since it was read"},
+                status=status.HTTP_412_PRECONDITION_FAILED
+            )
         
-        if success:
+        if result:
+            notify_task_taken(task, request.user)
             serializer = TaskDetailSerializer(task)
-            return Response(serializer.data)
+            return Response(serializer.data, headers={'ETag': task_etag(serializer.data)})
         else:
             return Response(
-                {"error": "Failed to take task"}, 
+                {"error": "Task is not available"}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
 
@@ -82,7 +293,7 @@ class TaskCompleteView(APIView):
     
     def post(self, request, pk):
         try:
-            task = Task.objects.get(pk=pk)
+            task = Task.objects.with_details().get(pk=pk)
         except Task.DoesNotExist:
             return Response(
                 {"error": "Task not found"}, 
@@ -90,18 +301,30 @@ class TaskCompleteView(APIView):
             )
         
         # Check if user is the taker
-        if request.user != task.taker:
+        if request.user.pk != task.taker_id:
             return Response(
                 {"error": "Only the task taker can mark it as completed"}, 
                 status=status.HTTP_403_FORBIDDEN
             )
         
+        try:
+            expected_version = if_match_version(request, task)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_412_PRECONDITION_FAILED)
+        
         # Complete the task
-        success = task.complete()
+        credit = task.complete(expected_version)
         
-        if success:
-            serializer = TaskDetailSerializer(task)
-            return Response(serializer.data)
+        if credit:
+            notify_task_completed(task, request.user)
+            data = TaskDetailSerializer(task).data
+            data['completion'] = credit._asdict()
+            return Response(data, headers={'ETag': task_etag(data)})
+        elif expected_version is not None and task.version != expected_version:
+            return Response(
+                {"error": "Task has changed since it was read"},
+                status=status.HTTP_412_PRECONDITION_FAILED
+            )
         else:
             return Response(
                 {"error": "Failed to complete task"}, 
@@ -121,55 +344,216 @@ class ThanksMessageCreateView(generics.CreateAPIView):
 
 
 class UserTasksView(generics.ListAPIView):
-    """List tasks posted or taken by the current user."""
+    """
+    List tasks posted or taken by the current user.
+    
+    Pages come from the user's ``TimelineEntry`` rows, a range scan of one
+    index, and are then serialized as their tasks.
+    """
     serializer_class = TaskSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticated]
     
+    def list(self, request, *args, **kwargs):
+        entries = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer([entry.task for entry in entries], many=True)
+        return self.get_paginated_response(serializer.data)
+    
     def get_queryset(self):
-        """Filter tasks by user role and status."""
+        """Filter the user's timeline by role and status."""
         user = self.request.user
         role = self.request.query_params.get('role', 'all')
         status_param = self.request.query_params.get('status')
         
-        if role == 'poster':
-            queryset = Task.objects.filter(poster=user)
-        elif role == 'taker':
-            queryset = Task.objects.filter(taker=user)
-        else:
-            # Both posted and taken tasks
-            queryset = Task.objects.filter(poster=user) | Task.objects.filter(taker=user)
+        queryset = TimelineEntry.objects.for_user(user, role).select_related(
+            'task__poster', 'task__taker'
+        )
         
         if status_param:
             queryset = queryset.filter(status=status_param)
         
-        return queryset.order_by('-updated_at')
+        return queryset
 
 
 class NearbyTasksView(generics.ListAPIView):
     """
-    List tasks near the user's location.
+    List open tasks near the user's location.
     
-    Note: This is a simplified implementation. In a real application,
-    you would use geographic coordinates and proper distance calculations.
+    With ``lat`` and ``lng`` (plus optional ``radius`` in metres and
+    ``limit``), returns the open tasks within the radius, nearest first,
+    each with its ``distance``. Without coordinates, falls back to matching
+    the ``location`` keyword.
     """
     serializer_class = TaskSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticated]
     
+    def list(self, request, *args, **kwargs):
+        params = request.query_params
+        if 'lat' not in params and 'lng' not in params:
+            return super().list(request, *args, **kwargs)
+        
+        try:
+            lat = get_number(params, 'lat', -90, 90)
+            lng = get_number(params, 'lng', -180, 180)
+            radius = get_number(
+                params, 'radius', 1, settings.TASK_NEARBY_MAX_RADIUS, settings.TASK_NEARBY_RADIUS
+            )
+            limit = int(get_number(
+                params, 'limit', 1, KeysetPagination.max_page_size, self.paginator.page_size
+            ))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        tasks = Task.objects.with_users().nearest(lat, lng, radius, limit)
+        serializer = NearbyTaskSerializer(tasks, many=True)
+        return Response({'results': serializer.data})
+    
     def get_queryset(self):
         """
         Filter tasks by location keyword.
-        
-        In a real implementation, this would use geographic coordinates.
         """
         location = self.request.query_params.get('location', '')
         
-        # Filter by open status and location (simplified)
-        queryset = Task.objects.filter(
-            status=Task.TaskStatus.OPEN,
-            time__gte=timezone.now()
-        )
+        queryset = Task.objects.with_users().open_feed()
         
         if location:
             queryset = queryset.filter(location__icontains=location)
         
-        return queryset.order_by('time')
\ No newline at end of file
+        return queryset
+
+
+class TaskSearchView(APIView):
+    """
+    Search open tasks by text.
+    
+    ``q`` is matched against title, description and location, in any
+    language; the best ``limit`` matches come back best first, each with its
+    ``rank``.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(query) > settings.TASK_SEARCH_MAX_QUERY_LENGTH:
+            return Response(
+                {"error": f"q must be at most {settings.TASK_SEARCH_MAX_QUERY_LENGTH} characters"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            limit = int(get_number(
+                request.query_params, 'limit', 1, KeysetPagination.max_page_size,
+                KeysetPagination.page_size
+            ))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        tasks = Task.objects.with_users().search(query, limit)
+        serializer = SearchTaskSerializer(tasks, many=True)
+        return Response({'results': serializer.data})
+
+
+class TaskChangesView(APIView):
+    """
+    What changed in the open feed since a cursor, for delta sync; see
+    ``tasks.changes``.
+    
+    Each change is an ``upsert`` carrying the task, or a ``remove`` carrying
+    the id and status of a task that left the feed. Call again with the
+    returned ``cursor`` while ``has_more``. Without ``since`` there are no
+    changes, only a cursor for now: fetch it before loading the feed.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        since = request.query_params.get('since')
+        if not since:
+            return Response({'changes': [], 'cursor': changes.current_cursor(), 'has_more': False})
+        
+        try:
+            seq, pk = changes.decode(since)
+            limit = int(get_number(
+                request.query_params, 'limit', 1, settings.TASK_CHANGES_MAX_BATCH,
+                settings.TASK_CHANGES_BATCH
+            ))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        rows, has_more = changes.changes_since(seq, pk, limit)
+        if not rows:
+            return Response({'changes': [], 'cursor': since, 'has_more': False})
+        
+        tasks = Task.objects.with_users().in_bulk([row.pk for row in rows if not row.deleted])
+        now = timezone.now()
+        results = []
+        for row in rows:
+            task = tasks.get(row.pk)
+            if task is None:
+                results.append({'op': 'remove', 'id': row.pk, 'status': 'deleted'})
+            elif task.status == Task.TaskStatus.OPEN and task.time >= now:
+                results.append({'op': 'upsert', 'task': TaskSerializer(task).data})
+            else:
+                # An open task past its time is one the sweeper has yet to expire
+                gone = Task.TaskStatus.EXPIRED if task.status == Task.TaskStatus.OPEN else task.status
+                results.append({'op': 'remove', 'id': task.pk, 'status': gone})
+        
+        last = rows[-1]
+        return Response({
+            'changes': results,
+            'cursor': changes.encode(last.seq, last.pk),
+            'has_more': has_more
+        })
+
+
+def _is_authenticated(request):
+    """Authenticate a plain Django request the way the API views do."""
+    try:
+        return APIView().initialize_request(request).user.is_authenticated
+    except exceptions.APIException:
+        return False
+
+
+async def task_live_stream(request):
+    """
+    Stream task changes as Server-Sent Events; see ``tasks.live``.
+    
+    ``status`` (comma separated) keeps events of tasks that have, or just
+    left, one of those statuses; ``lat``, ``lng`` and ``radius`` keep those
+    of tasks within the radius.
+    """
+    if not settings.TASK_LIVE:
+        return JsonResponse({"error": "Live feed is disabled"}, status=status.HTTP_404_NOT_FOUND)
+    if not await sync_to_async(_is_authenticated)(request):
+        return JsonResponse(
+            {"error": "Authentication credentials were not provided"},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    
+    params = request.GET
+    filters = {}
+    statuses = [value for value in params.get('status', '').split(',') if value]
+    if set(statuses) - set(Task.TaskStatus.values):
+        return JsonResponse({"error": "Unknown status"}, status=status.HTTP_400_BAD_REQUEST)
+    filters['statuses'] = statuses
+    
+    if 'lat' in params or 'lng' in params:
+        try:
+            filters['lat'] = get_number(params, 'lat', -90, 90)
+            filters['lng'] = get_number(params, 'lng', -180, 180)
+            filters['radius'] = get_number(
+                params, 'radius', 1, settings.TASK_NEARBY_MAX_RADIUS, settings.TASK_NEARBY_RADIUS
+            )
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    response = StreamingHttpResponse(
+        live.stream(live.hub.subscribe(**filters)),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Keep reverse proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
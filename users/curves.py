@@ -0,0 +1,93 @@
+"""
+Levelling curves over whole arrays of users, for ``recompute_levels``.
+
+Changing the curve in ``users.leveling`` keeps every user's total EXP but
+moves their level and in-level EXP. ``recompute_levels`` rebases users a
+chunk at a time: it turns ``(level, exp)`` into total EXP under the old curve
+and back into ``(level, exp)`` under the new one, with NumPy over the whole
+chunk instead of a Python loop per user.
+
+A curve is its cumulative EXP, ``total_exp(level)``, the EXP needed to
+reach ``level`` from level 1, with a closed-form inverse ``levels(total)``.
+Curves are named ``kind:parameter`` on the command line:
+
+- ``arithmetic:A``: level ``L`` to ``L + 1`` costs ``A * L``, the live
+  curve with ``A = leveling.EXP_PER_LEVEL``.
+- ``flat:A``: every level costs ``A``.
+
+New kinds only need the two methods and an entry in ``CURVES``.
+"""
+
+import numpy as np
+
+from . import leveling
+
+
+class ArithmeticCurve:
+    """Each level costs ``per_level`` more than the one before."""
+
+    def __init__(self, per_level):
+        self.per_level = per_level
+
+    def total_exp(self, levels):
+        return self.per_level * levels * (levels - 1) // 2
+
+    def levels(self, totals):
+        # level * (level - 1) <= 2 * total / per_level; the float root can be
+        # one off for large totals, so step to the exact level
+        levels = ((1 + np.sqrt(1 + 8 * totals / self.per_level)) // 2).astype(np.int64)
+        levels -= self.total_exp(levels) > totals
+        levels += self.total_exp(levels + 1) <= totals
+        return levels
+
+    def __str__(self):
+        return f'arithmetic:{self.per_level}'
+
+
+class FlatCurve:
+    """Every level costs ``per_level``."""
+
+    def __init__(self, per_level):
+        self.per_level = per_level
+
+    def total_exp(self, levels):
+        return self.per_level * (levels - 1)
+
+    def levels(self, totals):
+        return totals // self.per_level + 1
+
+    def __str__(self):
+        return f'flat:{self.per_level}'
+
+
+CURVES = {
+    'arithmetic': ArithmeticCurve,
+    'flat': FlatCurve,
+}
+
+
+def live():
+    """The curve ``users.leveling`` credits EXP with."""
+    return ArithmeticCurve(leveling.EXP_PER_LEVEL)
+
+
+def parse(spec):
+    """The curve named by ``kind:parameter``; raises ValueError if it is unknown."""
+    kind, _, parameter = spec.partition(':')
+    try:
+        per_level = int(parameter)
+    except ValueError:
+        raise ValueError(f"Invalid curve {spec!r}: expected kind:exp_per_level")
+    if kind not in CURVES or per_level < 1:
+        raise ValueError(f"Invalid curve {spec!r}: kinds are {', '.join(CURVES)}")
+    return CURVES[kind](per_level)
+
+
+def rebase(levels, exps, old, new):
+    """
+    ``(levels, exps)`` under the ``new`` curve for users at ``(levels, exps)``
+    under the ``old`` one, keeping each user's total EXP.
+    """
+    totals = old.total_exp(levels) + exps
+    new_levels = new.levels(totals)
+    return new_levels, totals - new.total_exp(new_levels)
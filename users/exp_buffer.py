@@ -0,0 +1,140 @@
+"""
+Write-behind EXP credits for busy users.
+
+Each completed task credits its taker straight away: an UPDATE of the user
+row plus the rank tree and rollup rows, all locked until the task's
+transaction commits. Power users finishing several tasks a minute keep
+those rows locked and their completions queue behind each other.
+
+With ``USER_EXP_WRITE_BEHIND`` on, ``UserManager.earn_exp`` instead appends
+the credit to ``PendingExp``, an INSERT that locks nothing shared, and
+``run_exp_flusher`` merges each user's pending credits into a single
+``credit_exp`` every ``USER_EXP_FLUSH_INTERVAL`` seconds.
+
+The buffer is a table rather than process memory, so a crash loses nothing.
+A flush claims rows with ``SKIP LOCKED``, credits their sums and deletes
+them in one transaction: if a flusher dies before committing, the rows are
+still there for the next one, and once it commits they are gone, so every
+credit is applied exactly once.
+
+Until flushed, credits are not in ``level`` and ``exp``. ``overlaid`` gives
+a copy of a user with their pending credits applied, which the profile
+endpoint and the bot show so users see their own EXP at once; leaderboards
+catch up at the next flush, and rollups count the EXP in the bucket it was
+flushed in.
+"""
+
+import copy
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Sum
+from django.utils import timezone
+
+from meowtask import metrics
+
+from . import leveling
+
+counters = metrics.Counters('buffered', 'flushed', 'users_credited')
+
+
+def pending(user_ids):
+    """``{user_id: (exp, completed_tasks)}`` not yet flushed, for users that have any."""
+    from .models import PendingExp
+
+    rows = (
+        PendingExp.objects.filter(user_id__in=user_ids)
+        .values('user_id')
+        .annotate(exp=Sum('amount'), tasks=Sum('completed_tasks'))
+        .values_list('user_id', 'exp', 'tasks')
+        .order_by()
+    )
+    return {user_id: (exp, tasks) for user_id, exp, tasks in rows}
+
+
+def buffer(user_id, amount, completed_tasks=0):
+    """
+    Queue a credit for the next flush. Returns the ``ExpCredit`` the user
+    will get, counting credits still pending, or None if there is no such user.
+    """
+    from .models import ExpCredit, PendingExp, User
+
+    current = User.objects.filter(pk=user_id).values_list('level', 'exp').first()
+    if current is None:
+        return None
+
+    pending_exp = pending([user_id]).get(user_id, (0, 0))[0]
+    level_before, exp_before = leveling.apply_exp(*current, pending_exp)
+    level_after, exp_after = leveling.apply_exp(level_before, exp_before, amount)
+
+    PendingExp.objects.create(user_id=user_id, amount=amount, completed_tasks=completed_tasks)
+    counters.incr('buffered')
+    return ExpCredit(
+        exp_gained=amount,
+        level_before=level_before,
+        level_after=level_after,
+        exp_after=exp_after
+    )
+
+
+def overlaid(user):
+    """``user``, or a copy of it with its pending credits applied."""
+    if not settings.USER_EXP_WRITE_BEHIND:
+        return user
+
+    exp, tasks = pending([user.pk]).get(user.pk, (0, 0))
+    if not exp and not tasks:
+        return user
+
+    # A copy, so saving the user never writes credits the flusher will add again
+    user = copy.copy(user)
+    user.level, user.exp = leveling.apply_exp(user.level, user.exp, exp)
+    user.completed_tasks += tasks
+    return user
+
+
+def flush(batch_size=None):
+    """
+    Apply one batch of pending credits, one ``credit_exp`` per user.
+    Returns the number of credits applied.
+    """
+    from .models import PendingExp, User
+
+    batch_size = batch_size or settings.USER_EXP_FLUSH_BATCH
+    with transaction.atomic():
+        rows = list(
+            PendingExp.objects.select_for_update(skip_locked=True)
+            .order_by('id')
+            .values_list('id', 'user_id', 'amount', 'completed_tasks')[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        totals = defaultdict(lambda: [0, 0])
+        for _, user_id, amount, tasks in rows:
+            totals[user_id][0] += amount
+            totals[user_id][1] += tasks
+
+        # Always lock users in the same order, so concurrent flushers cannot deadlock
+        for user_id in sorted(totals):
+            User.objects.credit_exp(user_id, *totals[user_id])
+        PendingExp.objects.filter(id__in=[row[0] for row in rows]).delete()
+
+    counters.incr('flushed', len(rows))
+    counters.incr('users_credited', len(totals))
+    return len(rows)
+
+
+def buffer_stats():
+    from .models import PendingExp
+
+    oldest = PendingExp.objects.aggregate(oldest=Min('created_at'))['oldest']
+    return {
+        'pending': PendingExp.objects.count(),
+        'lag_seconds': round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0.0,
+        **counters.snapshot(),
+    }
+
+
+metrics.register('user_exp_buffer', buffer_stats)
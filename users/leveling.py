@@ -0,0 +1,64 @@
+"""
+Levelling curve for MeowTask users.
+
+Going from level ``L`` to ``L + 1`` costs ``EXP_PER_LEVEL * L`` EXP, so the
+total EXP needed to reach level ``L`` from level 1 is
+``EXP_PER_LEVEL * L * (L - 1) / 2``. Inverting that gives the level for any
+amount of total EXP in closed form, however many level-ups it spans.
+
+The same formula is available as a database expression, so EXP can be
+credited with one atomic UPDATE instead of a read-modify-write.
+"""
+
+from math import isqrt
+
+from django.db.models import F, IntegerField
+from django.db.models.functions import Cast, Floor, Sqrt
+
+EXP_PER_LEVEL = 100
+
+
+def exp_to_next_level(level):
+    """EXP needed to go from ``level`` to ``level + 1``."""
+    return EXP_PER_LEVEL * level
+
+
+def total_exp_for_level(level):
+    """Total EXP needed to reach ``level`` from level 1."""
+    return EXP_PER_LEVEL * level * (level - 1) // 2
+
+
+def level_for_total_exp(total_exp):
+    """The level reached with ``total_exp`` EXP earned since level 1."""
+    # level * (level - 1) <= total_exp / (EXP_PER_LEVEL / 2)
+    return (1 + isqrt(1 + 4 * (2 * total_exp // EXP_PER_LEVEL))) // 2
+
+
+def apply_exp(level, exp, amount):
+    """Return ``(level, exp)`` after adding ``amount`` EXP."""
+    total = total_exp_for_level(level) + exp + amount
+    new_level = max(level, level_for_total_exp(total))
+    return new_level, total - total_exp_for_level(new_level)
+
+
+def total_exp_expression(amount, level='level', exp='exp'):
+    """Database expression for a user's total EXP after adding ``amount``."""
+    return EXP_PER_LEVEL * F(level) * (F(level) - 1) / 2 + F(exp) + amount
+
+
+def level_expression(amount, level='level', exp='exp'):
+    """Database expression for a user's level after adding ``amount`` EXP."""
+    total = total_exp_expression(amount, level, exp)
+    return Cast(
+        Floor((1 + Sqrt(1 + 4 * (2 * total / EXP_PER_LEVEL))) / 2),
+        IntegerField()
+    )
+
+
+def exp_expression(amount, level='level', exp='exp'):
+    """Database expression for a user's in-level EXP after adding ``amount``."""
+    new_level = level_expression(amount, level, exp)
+    return (
+        total_exp_expression(amount, level, exp)
+        - EXP_PER_LEVEL * new_level * (new_level - 1) / 2
+    )
@@ -0,0 +1,71 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from users import leveling, ranking
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Compare leaderboard rank lookups by rank tree and by counting, on a seeded users table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=5000000,
+            help="Number of users to seed."
+        )
+        parser.add_argument(
+            '--samples', type=int, default=200,
+            help="Rank lookups per method; the median is reported."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help="Users inserted per INSERT."
+        )
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        rng = random.Random(0)
+        prefix = f'bench-{run_id}-'
+
+        def seeded_user(i):
+            # Most users have little EXP, a few have a lot
+            total = int(rng.expovariate(1 / 2000))
+            level = leveling.level_for_total_exp(total)
+            return User(
+                line_id=f'{prefix}{i}',
+                display_name=f'Bench User {i}',
+                level=level,
+                exp=total - leveling.total_exp_for_level(level)
+            )
+
+        started = time.perf_counter()
+        for start in range(0, options['users'], options['batch_size']):
+            stop = min(start + options['batch_size'], options['users'])
+            User.objects.bulk_create([seeded_user(i) for i in range(start, stop)])
+        self.stdout.write(f"Seeded {options['users']} users in {time.perf_counter() - started:.1f}s")
+
+        try:
+            started = time.perf_counter()
+            ranking.rebuild()
+            self.stdout.write(f"Rebuilt the rank tree in {time.perf_counter() - started:.1f}s")
+
+            samples = [seeded_user(-1) for _ in range(options['samples'])]
+            methods = {
+                'top 10': lambda user: list(User.objects.order_by('-level', '-exp', 'id')[:10]),
+                'rank (tree)': ranking.rank,
+                'rank (count)': ranking.count_rank,
+            }
+            for name, method in methods.items():
+                timings = []
+                for user in samples:
+                    started = time.perf_counter()
+                    method(user)
+                    timings.append(time.perf_counter() - started)
+                self.stdout.write(f"{name:>14}: {statistics.median(timings) * 1000:8.2f} ms")
+        finally:
+            User.objects.filter(line_id__startswith=prefix).delete()
+            ranking.rebuild()
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import rollups
+
+
+class Command(BaseCommand):
+    help = "Delete weekly and monthly EXP rollups past their retention. Run it daily."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help="Rows deleted per DELETE."
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = rollups.compact(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} rollups in {time.perf_counter() - started:.1f}s"
+        ))
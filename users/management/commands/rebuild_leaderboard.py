@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users import ranking
+
+
+class Command(BaseCommand):
+    help = "Rebuild the leaderboard rank tree from the users table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=10000,
+            help="Tree nodes written per INSERT."
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        users = ranking.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Ranked {users} users in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,124 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from tasks import feed_cache
+from users import curves, ranking
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebase every user's level and EXP from one levelling curve to another, "
+        "keeping their total EXP, then rebuild the leaderboard rank tree. Run it "
+        "right after deploying a new curve, before EXP credits resume."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from', dest='old', required=True,
+            help="Curve users' levels were computed with, e.g. arithmetic:100."
+        )
+        parser.add_argument(
+            '--to', dest='new', default=None,
+            help="Curve to move users to; defaults to the live curve."
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help="Users read and written per transaction."
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report what would change without writing anything."
+        )
+        parser.add_argument(
+            '--show', type=int, default=20,
+            help="Changed users listed in a dry run."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            old = curves.parse(options['old'])
+            new = curves.parse(options['new']) if options['new'] else curves.live()
+        except ValueError as exc:
+            raise CommandError(exc)
+        if str(new) != str(curves.live()):
+            self.stderr.write(self.style.WARNING(
+                f"{new} is not the live curve ({curves.live()}); EXP credits will not match it"
+            ))
+
+        dry_run = options['dry_run']
+        self.stdout.write(f"Rebasing users from {old} to {new}{' (dry run)' if dry_run else ''}")
+
+        scanned = changed = promoted = demoted = 0
+        shown = []
+        started = time.perf_counter()
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                rows = self.chunk(last_id, options['chunk_size'], lock=not dry_run)
+                if not rows:
+                    break
+                ids, levels, exps = np.array(rows, dtype=np.int64).T
+                new_levels, new_exps = curves.rebase(levels, exps, old, new)
+                moved = (new_levels != levels) | (new_exps != exps)
+                if not dry_run and moved.any():
+                    self.write(ids[moved], new_levels[moved], new_exps[moved])
+
+            last_id = int(ids[-1])
+            scanned += len(ids)
+            changed += int(moved.sum())
+            promoted += int((new_levels > levels).sum())
+            demoted += int((new_levels < levels).sum())
+            for index in np.flatnonzero(moved)[:options['show'] - len(shown)]:
+                shown.append((ids[index], levels[index], exps[index], new_levels[index], new_exps[index]))
+
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  {scanned} users, {changed} changed, {scanned / elapsed:,.0f} rows/s")
+
+        if dry_run:
+            for user_id, level, exp, new_level, new_exp in shown:
+                self.stdout.write(f"  user {user_id}: level {level} exp {exp} -> level {new_level} exp {new_exp}")
+
+        elapsed = time.perf_counter() - started
+        summary = (
+            f"{'Would change' if dry_run else 'Changed'} {changed} of {scanned} users "
+            f"({promoted} levelled up, {demoted} down) "
+            f"in {elapsed:.1f}s, {scanned / elapsed if elapsed else 0:,.0f} rows/s"
+        )
+        if dry_run:
+            self.stdout.write(summary)
+            return
+
+        self.stdout.write(self.style.SUCCESS(summary))
+        if changed:
+            # Feed pages show users' levels
+            feed_cache.bump()
+            started = time.perf_counter()
+            ranking.rebuild()
+            self.stdout.write(f"Rebuilt the rank tree in {time.perf_counter() - started:.1f}s")
+
+    def chunk(self, last_id, size, lock):
+        users = User.objects.filter(pk__gt=last_id).order_by('pk')
+        if lock:
+            # Credits to these users wait for the chunk instead of being overwritten
+            users = users.select_for_update()
+        return list(users.values_list('id', 'level', 'exp')[:size])
+
+    def write(self, ids, levels, exps):
+        table = User._meta.db_table
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'UPDATE {table} AS u SET level = v.level, exp = v.exp '
+                    f'FROM unnest(%s::bigint[], %s::integer[], %s::integer[]) AS v(id, level, exp) '
+                    f'WHERE u.id = v.id',
+                    [ids.tolist(), levels.tolist(), exps.tolist()]
+                )
+            else:
+                cursor.executemany(
+                    f'UPDATE {table} SET level = %s, exp = %s WHERE id = %s',
+                    list(zip(levels.tolist(), exps.tolist(), ids.tolist()))
+                )
@@ -0,0 +1,75 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from users import exp_buffer
+
+
+class Command(BaseCommand):
+    help = "Merge buffered EXP credits into the users table (USER_EXP_WRITE_BEHIND)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=settings.USER_EXP_FLUSH_INTERVAL,
+            help="Seconds between flushes."
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.USER_EXP_FLUSH_BATCH,
+            help="Credits merged per transaction."
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Flush everything currently buffered and exit."
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help="Print EXP buffer stats, then exit."
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for name, value in exp_buffer.buffer_stats().items():
+                self.stdout.write(f"{name}: {value}")
+            return
+
+        if options['once']:
+            flushed = self.drain(options['batch_size'])
+            self.stdout.write(f"Flushed {flushed} EXP credits")
+            return
+
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self.work,
+            args=(stop, options),
+            name='exp-flusher',
+            daemon=True
+        )
+        thread.start()
+        self.stdout.write(f"Flushing buffered EXP every {options['interval']}s")
+
+        try:
+            while thread.is_alive():
+                thread.join(timeout=1.0)
+        except KeyboardInterrupt:
+            self.stdout.write("Shutting down, finishing the current flush...")
+            stop.set()
+            thread.join()
+
+    def drain(self, batch_size):
+        flushed = 0
+        while True:
+            count = exp_buffer.flush(batch_size)
+            if not count:
+                return flushed
+            flushed += count
+
+    def work(self, stop, options):
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                self.drain(options['batch_size'])
+                stop.wait(options['interval'])
+        finally:
+            connections.close_all()
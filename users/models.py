@@ -1,6 +1,22 @@
-from django.db import models
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import models, router, transaction
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 
+from tasks import feed_cache
+
+from . import exp_buffer, leveling, ranking, rollups, user_cache
+
+
+class ExpCredit(namedtuple('ExpCredit', ['exp_gained', 'level_before', 'level_after', 'exp_after'])):
+    """Result of crediting EXP to a user."""
+    
+    @property
+    def leveled_up(self):
+        return self.level_after > self.level_before
+
 
 class UserManager(BaseUserManager):
     """Custom user manager for LINE-based User model."""
@@ -26,6 +42,53 @@ class UserManager(BaseUserManager):
             raise ValueError('Superuser must have is_superuser=True.')
         
         return self.create_user(line_id, display_name, password, **extra_fields)
+    
+    def credit_exp(self, user_id, amount, completed_tasks=0):
+        """
+        Add EXP (and optionally completed tasks) to a user with one UPDATE.
+        
+        Level-ups are computed in the database from the row's current values,
+        so concurrent credits to the same user never overwrite each other.
+        The row stays locked by the UPDATE while the new values are read back.
+        The leaderboard rank tree and this week's and month's EXP rollups are
+        updated in the same transaction, and the user's cached copy and the
+        cached task feeds showing their level are dropped.
+        """
+        with transaction.atomic(using=self.db):
+            updated = self.filter(pk=user_id).update(
+                level=leveling.level_expression(amount),
+                exp=leveling.exp_expression(amount),
+                completed_tasks=F('completed_tasks') + completed_tasks
+            )
+            if not updated:
+                return None
+            
+            level_after, exp_after, line_id = self.filter(pk=user_id).values_list(
+                'level', 'exp', 'line_id'
+            ).get()
+            total_after = ranking.score(level_after, exp_after)
+            ranking.move(total_after - amount, total_after, self.db)
+            rollups.record(user_id, amount, self.db)
+            user_cache.invalidate(line_id, self.db)
+            feed_cache.bump()
+        
+        total_before = total_after - amount
+        return ExpCredit(
+            exp_gained=amount,
+            level_before=leveling.level_for_total_exp(total_before),
+            level_after=level_after,
+            exp_after=exp_after
+        )
+    
+    def earn_exp(self, user_id, amount, completed_tasks=0):
+        """
+        Credit EXP a user has earned: straight away with ``credit_exp``, or
+        through the write-behind buffer when ``USER_EXP_WRITE_BEHIND`` is on
+        (see ``users.exp_buffer``). Returns the ``ExpCredit`` either way.
+        """
+        if settings.USER_EXP_WRITE_BEHIND:
+            return exp_buffer.buffer(user_id, amount, completed_tasks)
+        return self.credit_exp(user_id, amount, completed_tasks)
 
 
 class User(AbstractUser):
@@ -50,26 +113,123 @@ class User(AbstractUser):
     
     objects = UserManager()
     
+    # Shown with every task in the cached task feeds, see ``tasks.feed_cache``
+    FEED_FIELDS = frozenset({'line_id', 'display_name', 'picture_url', 'level', 'exp', 'completed_tasks'})
+    
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Leaderboard top and rank tree rebuilds, see users.ranking
+            models.Index(fields=['-level', '-exp', 'id'], name='user_leaderboard_idx'),
+        ]
+    
     def __str__(self):
         return self.display_name
     
-    def add_exp(self, amount):
-        """Add experience points and level up if necessary."""
-        self.exp += amount
-        
-        # Simple level-up logic: 100 * current level = exp needed to level up
-        exp_needed = self.level * 100
-        
-        if self.exp >= exp_needed:
-            self.level += 1
-            self.exp -= exp_needed
-            return True  # Indicates level up occurred
+    def save(self, *args, **kwargs):
+        """
+        Save the user, keeping the leaderboard rank tree in step with its EXP
+        and dropping the user's cached copy, and the cached task feeds when
+        fields they show change.
+        """
+        using = kwargs.get('using') or router.db_for_write(User, instance=self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not {'level', 'exp'} & set(update_fields):
+            super().save(*args, **kwargs)
+            user_cache.invalidate(self.line_id, using)
+            if self.FEED_FIELDS & set(update_fields):
+                feed_cache.bump()
+            return
         
-        return False
+        with transaction.atomic(using=using):
+            before = None if self._state.adding else self._stored_score(using)
+            super().save(*args, **kwargs)
+            
+            after = ranking.score(self.level, self.exp)
+            if before is None:
+                ranking.apply({after: 1}, using)
+            else:
+                ranking.move(before, after, using)
+            user_cache.invalidate(self.line_id, using)
+            feed_cache.bump()
+    
+    def delete(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(User, instance=self)
+        with transaction.atomic(using=using):
+            before = self._stored_score(using)
+            if before is not None:
+                ranking.apply({before: -1}, using)
+            user_cache.invalidate(self.line_id, using)
+            feed_cache.bump()
+            return super().delete(*args, **kwargs)
+    
+    def _stored_score(self, using):
+        """The score the rank tree holds for this user, locking the row until commit."""
+        stored = User.objects.using(using).select_for_update().filter(
+            pk=self.pk
+        ).values_list('level', 'exp').first()
+        return None if stored is None else ranking.score(*stored)
+    
+    def add_exp(self, amount):
+        """Add experience points and level up as many times as necessary."""
+        level_before = self.level
+        self.level, self.exp = leveling.apply_exp(self.level, self.exp, amount)
+        return self.level > level_before  # Indicates level up occurred
     
     def complete_task(self, task):
         """Mark a task as completed and gain experience."""
-        self.completed_tasks += 1
-        did_level_up = self.add_exp(task.reward)
-        self.save()
-        return did_level_up
\ No newline at end of file
+        credit = User.objects.earn_exp(self.pk, task.reward, completed_tasks=1)
+        self.refresh_from_db(fields=['level', 'exp', 'completed_tasks'])
+        return credit
+
+
+class RankNode(models.Model):
+    """
+    One node of the leaderboard's Fenwick tree over total EXP: the number of
+    users whose score falls in the node's range. See ``users.ranking``.
+    """
+    
+    node = models.BigIntegerField(primary_key=True)
+    count = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"Rank node {self.node}: {self.count}"
+
+
+class ExpRollup(models.Model):
+    """EXP a user earned in one week or month; see ``users.rollups``."""
+    
+    class Period(models.TextChoices):
+        WEEK = rollups.WEEK, 'Week'
+        MONTH = rollups.MONTH, 'Month'
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='exp_rollups')
+    period = models.CharField(max_length=10, choices=Period.choices)
+    # First day of the week (Monday) or month
+    bucket = models.DateField()
+    exp = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'period', 'bucket'], name='exp_rollup_unique'
+            ),
+        ]
+        indexes = [
+            # Windowed leaderboards: one bucket, most EXP first
+            models.Index(fields=['period', 'bucket', '-exp', 'user'], name='exp_rollup_board_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} {self.period} {self.bucket}: {self.exp}"
+
+
+class PendingExp(models.Model):
+    """An EXP credit waiting for the next flush; see ``users.exp_buffer``."""
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pending_exp')
+    amount = models.PositiveIntegerField()
+    completed_tasks = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.user_id}: +{self.amount}"
@@ -0,0 +1,158 @@
+"""
+Leaderboard ranks in O(log n).
+
+Users are ranked by total EXP (``leveling.total_exp_for_level(level) +
+exp``), which orders them exactly like ``(level, exp)``. The leaderboard
+used to count the users above the caller with two ``COUNT(*)`` queries,
+which read more of the table the more users there are.
+
+``RankNode`` rows hold a Fenwick (binary indexed) tree over total EXP,
+highest first: each node counts the users whose score falls in one range,
+and the number of users above any score is the sum of at most ``BITS``
+nodes, read by primary key in one query. Moving a user from one score to
+another adds -1 and +1 along two paths up the tree; above the node where
+the paths meet the changes cancel, so a credit writes a few rows near the
+user's score, in the same transaction as the EXP change.
+
+``UserManager.credit_exp`` and ``User.save``/``delete`` keep the tree
+current. Users written around them (``bulk_create``, queryset updates) and
+changes to the levelling curve need ``python manage.py rebuild_leaderboard``,
+which rebuilds it from ``user_leaderboard_idx``. Until the tree has been
+built, ranks fall back to counting.
+"""
+
+from collections import Counter
+
+from django.db import connections, transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+
+from . import leveling
+
+BITS = 31
+SIZE = 1 << BITS
+
+# Present once the tree has been built; never part of a path
+BUILT = 0
+
+
+def score(level, exp):
+    """A user's total EXP, the leaderboard's sort key."""
+    return leveling.total_exp_for_level(level) + exp
+
+
+def _index(score):
+    # 1-based tree index, highest score first
+    return SIZE - min(score, SIZE - 1)
+
+
+def _update_path(index):
+    while index <= SIZE:
+        yield index
+        index += index & -index
+
+
+def _prefix_path(index):
+    while index > 0:
+        yield index
+        index -= index & -index
+
+
+def apply(changes, using='default'):
+    """Apply ``{score: change in the number of users with it}`` to the tree."""
+    from .models import RankNode
+
+    deltas = Counter()
+    for user_score, change in changes.items():
+        for node in _update_path(_index(user_score)):
+            deltas[node] += change
+    deltas = {node: delta for node, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    nodes = RankNode.objects.using(using)
+    nodes.bulk_create([RankNode(node=node) for node in deltas], ignore_conflicts=True)
+    nodes.filter(node__in=deltas).update(count=F('count') + Case(
+        *(When(node=node, then=Value(delta)) for node, delta in deltas.items()),
+        output_field=IntegerField()
+    ))
+
+
+def move(before, after, using='default'):
+    """Record that a user's score changed from ``before`` to ``after``."""
+    if before != after:
+        apply({before: -1, after: 1}, using)
+
+
+def rank(user):
+    """
+    ``user``'s position on the leaderboard: 1 plus the number of users with
+    more EXP, so users with equal EXP share a rank.
+    """
+    from .models import RankNode
+
+    path = list(_prefix_path(_index(score(user.level, user.exp)) - 1))
+    counts = dict(
+        RankNode.objects.filter(node__in=[BUILT, *path]).values_list('node', 'count')
+    )
+    if BUILT not in counts:
+        return count_rank(user)
+    return 1 + sum(counts.get(node, 0) for node in path)
+
+
+def count_rank(user):
+    """``rank`` by counting the users above, in time linear in their number."""
+    from .models import User
+
+    return User.objects.filter(
+        level__gt=user.level
+    ).count() + User.objects.filter(
+        level=user.level,
+        exp__gt=user.exp
+    ).count() + 1
+
+
+def rebuild(using='default', batch_size=10000):
+    """Rebuild the tree from the users table. Returns the number of users ranked."""
+    from .models import RankNode, User
+
+    connection = connections[using]
+    with transaction.atomic(using=using):
+        if connection.vendor == 'postgresql':
+            # Credits committing after the histogram is read wait here, then
+            # apply their change to the new tree
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {RankNode._meta.db_table} IN EXCLUSIVE MODE')
+
+        histogram = (
+            User.objects.using(using)
+            .values('level', 'exp')
+            .annotate(users=Count('id'))
+            .values_list('level', 'exp', 'users')
+            .order_by()
+        )
+        counts = Counter()
+        total = 0
+        for level, exp, users in histogram.iterator():
+            total += users
+            for node in _update_path(_index(score(level, exp))):
+                counts[node] += users
+
+        RankNode.objects.using(using).all().delete()
+        RankNode.objects.using(using).bulk_create(
+            [RankNode(node=BUILT, count=1)]
+            + [RankNode(node=node, count=count) for node, count in counts.items()],
+            batch_size=batch_size
+        )
+    return total
+
+
+def install(using='default', **kwargs):
+    """
+    Build the tree if it has never been built.
+
+    Connected to ``post_migrate``, so new databases start with a tree.
+    """
+    from .models import RankNode
+
+    if not RankNode.objects.using(using).filter(node=BUILT).exists():
+        rebuild(using)
@@ -0,0 +1,97 @@
+"""
+Weekly and monthly EXP rollups for time-windowed leaderboards.
+
+Ranking the top helpers of a week from the done tasks would aggregate every
+task completed in it on each request. ``ExpRollup`` instead keeps one row per
+user per period bucket (the week or month the EXP was earned in), and every
+EXP credit adds to the user's rows for the current buckets, in the same
+transaction. A windowed leaderboard then reads one bucket's rows in
+``exp_rollup_board_idx`` order.
+
+Rows for past buckets are only needed for as long as anyone looks back at
+them. ``python manage.py compact_exp_rollups`` deletes those older than
+``LEADERBOARD_ROLLUP_WEEKS`` weeks and ``LEADERBOARD_ROLLUP_MONTHS`` months,
+so the table stays bounded by the number of active users per bucket.
+"""
+
+import datetime
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+WEEK = 'week'
+MONTH = 'month'
+PERIODS = (WEEK, MONTH)
+
+
+def bucket_for(period, day):
+    """First day of the ``period`` containing ``day``; weeks start on Monday."""
+    if period == WEEK:
+        return day - datetime.timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def current_bucket(period):
+    return bucket_for(period, timezone.localdate())
+
+
+def record(user_id, amount, using='default'):
+    """Add ``amount`` EXP earned now to the user's current buckets."""
+    from .models import ExpRollup
+
+    buckets = {period: current_bucket(period) for period in PERIODS}
+    rollups = ExpRollup.objects.using(using)
+    rollups.bulk_create([
+        ExpRollup(user_id=user_id, period=period, bucket=bucket)
+        for period, bucket in buckets.items()
+    ], ignore_conflicts=True)
+
+    current = Q()
+    for period, bucket in buckets.items():
+        current |= Q(period=period, bucket=bucket)
+    rollups.filter(current, user_id=user_id).update(exp=F('exp') + amount)
+
+
+def board(period):
+    """Rollups of the current ``period`` bucket, most EXP first."""
+    from .models import ExpRollup
+
+    return ExpRollup.objects.filter(
+        period=period,
+        bucket=current_bucket(period)
+    ).order_by('-exp', 'user_id')
+
+
+def earned(period, user):
+    """EXP ``user`` has earned in the current ``period`` bucket."""
+    return board(period).filter(user=user).values_list('exp', flat=True).first() or 0
+
+
+def rank(period, exp):
+    """Position of a user with ``exp`` in the current ``period`` bucket, ties sharing it."""
+    return board(period).filter(exp__gt=exp).count() + 1
+
+
+def oldest_kept(period, today=None):
+    """First bucket of ``period`` that compaction keeps."""
+    bucket = bucket_for(period, today or timezone.localdate())
+    if period == WEEK:
+        return bucket - datetime.timedelta(weeks=settings.LEADERBOARD_ROLLUP_WEEKS - 1)
+    months = bucket.year * 12 + bucket.month - 1 - (settings.LEADERBOARD_ROLLUP_MONTHS - 1)
+    return datetime.date(months // 12, months % 12 + 1, 1)
+
+
+def compact(batch_size=10000, today=None):
+    """Delete the rollups of buckets past retention, a batch at a time. Returns how many."""
+    from .models import ExpRollup
+
+    deleted = 0
+    for period in PERIODS:
+        expired = ExpRollup.objects.filter(period=period, bucket__lt=oldest_kept(period, today))
+        while True:
+            ids = list(expired.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            deleted += ExpRollup.objects.filter(id__in=ids).delete()[0]
+    return deleted
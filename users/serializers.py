@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from . import exp_buffer
 from .models import User
 
 
@@ -23,6 +24,10 @@ class UserProfileSerializer(serializers.ModelSerializer):
         fields = ['id', 'display_name', 'picture_url', 'level', 'exp', 
                  'completed_tasks', 'next_level_exp', 'exp_percentage']
     
+    def to_representation(self, instance):
+        # Show the user their own EXP credits the flusher has not merged yet
+        return super().to_representation(exp_buffer.overlaid(instance))
+    
     def get_next_level_exp(self, obj):
         """Get experience needed for next level."""
         return obj.level * 100
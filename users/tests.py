@@ -1,5 +1,18 @@
-from django.test import TestCase
-from .models import User
+import datetime
+import random
+from io import StringIO
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+from meowtask.testing import QueryBudgetMixin
+import numpy as np
+from . import curves, exp_buffer, leveling, ranking, rollups, user_cache
+from .models import ExpRollup, PendingExp, RankNode, User
 
 
 class UserModelTests(TestCase):
@@ -37,8 +50,421 @@ class UserModelTests(TestCase):
         self.user.level = 1
         self.user.exp = 0
         
-        level_up = self.user.add_exp(250)  # Enough for 2 level ups and 50 exp
+        level_up = self.user.add_exp(350)  # Enough for 2 level ups (100 + 200) and 50 exp
         
         self.assertEqual(self.user.exp, 50)
         self.assertEqual(self.user.level, 3)
-        self.assertTrue(level_up)
\ No newline at end of file
+        self.assertTrue(level_up)
+    
+    def test_add_exp_matches_step_by_step_levelling(self):
+        """Test the closed-form level-up against levelling one step at a time."""
+        for level, exp, amount in [(1, 0, 0), (1, 99, 1), (3, 250, 1000), (7, 0, 12345), (40, 3999, 1)]:
+            expected_level, expected_exp = level, exp + amount
+            while expected_exp >= leveling.exp_to_next_level(expected_level):
+                expected_exp -= leveling.exp_to_next_level(expected_level)
+                expected_level += 1
+            
+            self.assertEqual(
+                leveling.apply_exp(level, exp, amount),
+                (expected_level, expected_exp)
+            )
+    
+    def test_credit_exp_in_database(self):
+        """Test that the UPDATE expression levels up like add_exp does."""
+        for level, exp, amount in [(1, 0, 50), (1, 80, 30), (1, 0, 250), (12, 1150, 5000)]:
+            User.objects.filter(pk=self.user.pk).update(level=level, exp=exp, completed_tasks=0)
+            
+            credit = User.objects.credit_exp(self.user.pk, amount, completed_tasks=1)
+            
+            self.user.refresh_from_db()
+            expected = leveling.apply_exp(level, exp, amount)
+            self.assertEqual((self.user.level, self.user.exp), expected)
+            self.assertEqual(self.user.completed_tasks, 1)
+            self.assertEqual(credit.level_before, level)
+            self.assertEqual(credit.level_after, expected[0])
+            self.assertEqual(credit.exp_gained, amount)
+
+
+class UserQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Pin the user endpoints to a query count that does not grow with users."""
+    
+    def setUp(self):
+        self.user = User.objects.create(line_id='test_line_id', display_name='Test User')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def add_users(self):
+        start = User.objects.count()
+        User.objects.bulk_create([
+            User(line_id=f'user_{i}', display_name=f'User {i}', level=i % 7 + 1, exp=i)
+            for i in range(start, start + 30)
+        ])
+    
+    def get(self, name, *args):
+        response = self.client.get(reverse(name, args=args))
+        self.assertEqual(response.status_code, 200)
+    
+    def test_leaderboard(self):
+        """Test that the leaderboard costs a constant number of queries."""
+        self.assertConstantQueries(2, lambda: self.get('users:leaderboard'), self.add_users)
+    
+    def test_profiles(self):
+        """Test the own profile and the lookup by LINE ID."""
+        self.assertConstantQueries(0, lambda: self.get('users:profile'), self.add_users)
+        # The first lookup by LINE ID fills the user cache, later ones read it
+        with self.assertQueryBudget(1):
+            self.get('users:user-detail', 'test_line_id')
+        self.assertConstantQueries(
+            0, lambda: self.get('users:user-detail', 'test_line_id'), self.add_users
+        )
+
+
+class RankingTests(TestCase):
+    """Check the rank tree against counting the users above."""
+    
+    def setUp(self):
+        self.users = [
+            User.objects.create(line_id=f'rank_user_{i}', display_name=f'Rank User {i}')
+            for i in range(20)
+        ]
+    
+    def counted_rank(self, user):
+        return User.objects.filter(
+            level__gt=user.level
+        ).count() + User.objects.filter(
+            level=user.level,
+            exp__gt=user.exp
+        ).count() + 1
+    
+    def assertRanksMatchCounts(self):
+        for user in User.objects.all():
+            self.assertEqual(ranking.rank(user), self.counted_rank(user), user.line_id)
+    
+    def test_credits_keep_ranks_current(self):
+        """Test that every way of changing EXP keeps ranks equal to counting."""
+        rng = random.Random(7)
+        for _ in range(100):
+            User.objects.credit_exp(rng.choice(self.users).pk, rng.choice([10, 50, 120, 500]))
+        self.assertRanksMatchCounts()
+        
+        user = User.objects.get(pk=self.users[0].pk)
+        user.add_exp(1000)
+        user.save()
+        self.users[1].delete()
+        self.assertRanksMatchCounts()
+    
+    def test_equal_exp_shares_rank(self):
+        """Test that users with the same EXP share a rank and the next rank skips."""
+        for user in self.users[:3]:
+            User.objects.credit_exp(user.pk, 300)
+        User.objects.credit_exp(self.users[3].pk, 200)
+        
+        users = [User.objects.get(pk=user.pk) for user in self.users[:5]]
+        with self.assertNumQueries(5):
+            ranks = [ranking.rank(user) for user in users]
+        self.assertEqual(ranks, [1, 1, 1, 4, 5])
+    
+    def test_rebuild_matches_incremental_tree(self):
+        """Test that a rebuild gives the same tree, and picks up bulk-created users."""
+        rng = random.Random(11)
+        for _ in range(50):
+            User.objects.credit_exp(rng.choice(self.users).pk, rng.randrange(1, 400))
+        incremental = dict(RankNode.objects.exclude(count=0).values_list('node', 'count'))
+        
+        self.assertEqual(ranking.rebuild(), 20)
+        self.assertEqual(dict(RankNode.objects.values_list('node', 'count')), incremental)
+        
+        User.objects.bulk_create([
+            User(line_id=f'bulk_{i}', display_name=f'Bulk {i}', level=5, exp=i) for i in range(5)
+        ])
+        ranking.rebuild()
+        self.assertRanksMatchCounts()
+    
+    def test_counts_until_built(self):
+        """Test that ranks fall back to counting when the tree was never built."""
+        User.objects.credit_exp(self.users[0].pk, 150)
+        RankNode.objects.all().delete()
+        
+        with self.assertNumQueries(3):
+            self.assertEqual(ranking.rank(self.users[1]), 2)
+
+
+class WindowLeaderboardTests(QueryBudgetMixin, TestCase):
+    """Check the weekly and monthly boards built from EXP rollups."""
+    
+    def setUp(self):
+        self.users = [
+            User.objects.create(line_id=f'window_user_{i}', display_name=f'Window User {i}')
+            for i in range(4)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[3])
+    
+    def board(self, window):
+        response = self.client.get(reverse('users:leaderboard'), {'window': window})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+    
+    def test_credits_roll_up_into_current_buckets(self):
+        """Test that each credit adds to this week's and this month's rows."""
+        User.objects.credit_exp(self.users[0].pk, 30)
+        User.objects.credit_exp(self.users[0].pk, 20)
+        
+        rows = ExpRollup.objects.filter(user=self.users[0])
+        self.assertEqual(
+            {(row.period, row.bucket, row.exp) for row in rows},
+            {('week', rollups.current_bucket('week'), 50), ('month', rollups.current_bucket('month'), 50)}
+        )
+    
+    def test_window_board(self):
+        """Test the ranking of EXP earned this week, including the caller's rank."""
+        # Last week's EXP is not part of this week's board
+        ExpRollup.objects.create(
+            user=self.users[2], period='week',
+            bucket=rollups.current_bucket('week') - datetime.timedelta(weeks=1), exp=1000
+        )
+        for user, amount in zip(self.users, [50, 120, 0, 50]):
+            if amount:
+                User.objects.credit_exp(user.pk, amount)
+        
+        with self.assertQueryBudget(3):
+            data = self.board('week')
+        self.assertEqual(
+            [(row['line_id'], row['exp_earned']) for row in data['leaderboard']],
+            [('window_user_1', 120), ('window_user_0', 50), ('window_user_3', 50)]
+        )
+        self.assertEqual(data['user_rank'], 2)
+        self.assertEqual(data['user_exp_earned'], 50)
+        self.assertEqual(data['since'], rollups.current_bucket('week'))
+        
+        self.client.force_authenticate(User.objects.get(pk=self.users[3].pk))
+        self.assertEqual(self.board('all')['user_rank'], 2)
+    
+    def test_unknown_window(self):
+        """Test that only the supported windows are accepted."""
+        response = self.client.get(reverse('users:leaderboard'), {'window': 'year'})
+        self.assertEqual(response.status_code, 400)
+    
+    @override_settings(LEADERBOARD_ROLLUP_WEEKS=2, LEADERBOARD_ROLLUP_MONTHS=2)
+    def test_compaction_keeps_recent_buckets(self):
+        """Test that compaction deletes only buckets past retention."""
+        today = datetime.date(2024, 3, 14)
+        user = self.users[0]
+        for period, bucket in [
+            ('week', datetime.date(2024, 3, 11)),
+            ('week', datetime.date(2024, 3, 4)),
+            ('week', datetime.date(2024, 2, 26)),
+            ('month', datetime.date(2024, 3, 1)),
+            ('month', datetime.date(2024, 2, 1)),
+            ('month', datetime.date(2024, 1, 1)),
+            ('month', datetime.date(2023, 12, 1)),
+        ]:
+            ExpRollup.objects.create(user=user, period=period, bucket=bucket, exp=10)
+        
+        self.assertEqual(rollups.compact(batch_size=1, today=today), 3)
+        self.assertEqual(
+            sorted(ExpRollup.objects.values_list('period', 'bucket')),
+            [
+                ('month', datetime.date(2024, 2, 1)),
+                ('month', datetime.date(2024, 3, 1)),
+                ('week', datetime.date(2024, 3, 4)),
+                ('week', datetime.date(2024, 3, 11)),
+            ]
+        )
+        
+        out = StringIO()
+        call_command('compact_exp_rollups', stdout=out)
+        self.assertIn('Deleted', out.getvalue())
+
+
+@override_settings(USER_EXP_WRITE_BEHIND=True)
+class ExpWriteBehindTests(TestCase):
+    
+    def setUp(self):
+        self.user = User.objects.create(line_id='busy_user', display_name='Busy User')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+    
+    def test_credits_are_buffered(self):
+        """Test that buffered credits leave the user row alone but project level-ups."""
+        first = User.objects.earn_exp(self.user.pk, 60, completed_tasks=1)
+        second = User.objects.earn_exp(self.user.pk, 60, completed_tasks=1)
+        
+        self.assertFalse(first.leveled_up)
+        self.assertEqual((second.level_before, second.level_after, second.exp_after), (1, 2, 20))
+        self.assertEqual(
+            User.objects.filter(pk=self.user.pk).values_list('level', 'exp', 'completed_tasks').get(),
+            (1, 0, 0)
+        )
+        self.assertEqual(PendingExp.objects.count(), 2)
+    
+    def test_profile_overlays_pending_credits(self):
+        """Test that users see their own buffered EXP before it is flushed."""
+        self.user.complete_task(type('Task', (), {'reward': 150})())
+        
+        data = self.client.get(reverse('users:profile')).data
+        self.assertEqual((data['level'], data['exp'], data['completed_tasks']), (2, 50, 1))
+        # The overlay is a copy; saving the user cannot write the credit twice
+        self.assertEqual((self.user.level, self.user.exp), (1, 0))
+    
+    def test_flush_merges_credits_per_user(self):
+        """Test that a flush applies each user's credits once, in one credit."""
+        other = User.objects.create(line_id='other_user', display_name='Other User')
+        for _ in range(3):
+            User.objects.earn_exp(self.user.pk, 40, completed_tasks=1)
+        User.objects.earn_exp(other.pk, 10)
+        
+        self.assertEqual(exp_buffer.flush(), 4)
+        self.assertEqual(exp_buffer.flush(), 0)
+        
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.level, self.user.exp, self.user.completed_tasks), (2, 20, 3))
+        self.assertEqual(ranking.rank(self.user), 1)
+        self.assertEqual(rollups.earned('week', self.user), 120)
+        self.assertFalse(PendingExp.objects.exists())
+        self.assertEqual(self.client.get(reverse('users:profile')).data['exp'], 20)
+    
+    def test_failed_flush_keeps_credits(self):
+        """Test that a flush that fails part-way applies nothing and can be retried."""
+        User.objects.earn_exp(self.user.pk, 40)
+        credit_exp = User.objects.credit_exp
+        
+        def crash(*args, **kwargs):
+            credit_exp(*args, **kwargs)
+            raise RuntimeError("flusher died")
+        
+        with patch.object(User.objects, 'credit_exp', crash), self.assertRaises(RuntimeError):
+            exp_buffer.flush()
+        
+        self.assertEqual(User.objects.get(pk=self.user.pk).exp, 0)
+        self.assertEqual(PendingExp.objects.count(), 1)
+        
+        out = StringIO()
+        call_command('run_exp_flusher', '--once', stdout=out)
+        self.assertIn('Flushed 1', out.getvalue())
+        self.assertEqual(User.objects.get(pk=self.user.pk).exp, 40)
+
+
+class RecomputeLevelsTests(TestCase):
+    
+    def test_live_curve_matches_leveling(self):
+        """Test that the array curve agrees with the scalar levelling functions."""
+        totals = np.array([0, 1, 99, 100, 299, 300, 10 ** 6, 10 ** 12 + 7], dtype=np.int64)
+        curve = curves.live()
+        levels = curve.levels(totals)
+        self.assertEqual(levels.tolist(), [leveling.level_for_total_exp(int(t)) for t in totals])
+        self.assertEqual(
+            curve.total_exp(levels).tolist(),
+            [leveling.total_exp_for_level(int(level)) for level in levels]
+        )
+    
+    def test_rebase_keeps_total_exp(self):
+        """Test that rebasing between curves keeps every user's total EXP."""
+        old, new = curves.parse('flat:100'), curves.parse('arithmetic:50')
+        levels = np.arange(1, 200, dtype=np.int64)
+        exps = levels % 100
+        new_levels, new_exps = curves.rebase(levels, exps, old, new)
+        
+        np.testing.assert_array_equal(new.total_exp(new_levels) + new_exps, old.total_exp(levels) + exps)
+        self.assertTrue(((new_exps >= 0) & (new_exps < new.per_level * new_levels)).all())
+        
+        with self.assertRaises(ValueError):
+            curves.parse('cubic:10')
+    
+    def test_command(self):
+        """Test a dry run and a real run from a flat curve to the live one."""
+        users = [
+            User.objects.create(line_id=f'curve_user_{i}', display_name=f'Curve User {i}', level=level, exp=exp)
+            for i, (level, exp) in enumerate([(1, 50), (2, 0), (3, 60), (5, 10)])
+        ]
+        
+        out = StringIO()
+        call_command('recompute_levels', '--from', 'flat:100', '--dry-run', '--chunk-size', '3', stdout=out)
+        self.assertIn('Would change 2 of 4 users (0 levelled up, 2 down)', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        self.assertEqual(User.objects.get(pk=users[3].pk).level, 5)
+        
+        call_command('recompute_levels', '--from', 'flat:100', '--chunk-size', '3', stdout=StringIO())
+        self.assertEqual(
+            list(User.objects.filter(pk__in=[u.pk for u in users]).order_by('pk').values_list('level', 'exp')),
+            [(1, 50), (2, 0), (2, 160), (3, 110)]
+        )
+        user = User.objects.get(pk=users[3].pk)
+        self.assertEqual(ranking.rank(user), ranking.count_rank(user))
+
+
+class UserCacheTests(QueryBudgetMixin, TestCase):
+    
+    def setUp(self):
+        caches[settings.USER_CACHE_ALIAS].clear()
+        self.user = User.objects.create(line_id='cached_user', display_name='Cached User')
+        user_cache.counters.reset()
+    
+    def test_lookups_read_through_the_cache(self):
+        """Test that only the first lookup by LINE ID reads the database."""
+        with self.assertQueryBudget(1):
+            user_cache.get_by_line_id('cached_user')
+        with self.assertQueryBudget(0):
+            user = user_cache.get_by_line_id('cached_user')
+        
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user_cache.cache_stats()['hit_ratio'], 0.5)
+        with self.assertRaises(User.DoesNotExist):
+            user_cache.get_by_line_id('missing_user')
+    
+    def test_writes_invalidate(self):
+        """Test that saves, EXP credits and deletes are seen by the next lookup."""
+        user_cache.get_by_line_id('cached_user')
+        self.user.display_name = 'Renamed User'
+        self.user.save(update_fields=['display_name'])
+        self.assertEqual(user_cache.get_by_line_id('cached_user').display_name, 'Renamed User')
+        
+        User.objects.credit_exp(self.user.pk, 150, completed_tasks=1)
+        user = user_cache.get_by_line_id('cached_user')
+        self.assertEqual((user.level, user.exp, user.completed_tasks), (2, 50, 1))
+        
+        self.user.delete()
+        with self.assertRaises(User.DoesNotExist):
+            user_cache.get_by_line_id('cached_user')
+    
+    def test_auth_fields_are_not_cached(self):
+        """Test that no auth fields are cached, and saving a cached copy cannot overwrite them."""
+        user_cache.get_by_line_id('cached_user')
+        cached = caches[settings.USER_CACHE_ALIAS].get(user_cache._key('cached_user'))
+        self.assertEqual(set(cached), set(user_cache.CACHED_FIELDS))
+        
+        with self.assertQueryBudget(0):
+            user = user_cache.get_by_line_id('cached_user')
+        self.assertLessEqual({'password', 'is_staff', 'is_superuser'}, user.get_deferred_fields())
+        
+        User.objects.filter(pk=self.user.pk).update(is_staff=True, password='changed')
+        user.display_name = 'Renamed User'
+        user.save()
+        
+        stored = User.objects.get(pk=self.user.pk)
+        self.assertEqual((stored.display_name, stored.is_staff, stored.password), ('Renamed User', True, 'changed'))
+    
+    def test_copy_cached_before_commit_is_dropped(self):
+        """Test that a lookup made while the write was uncommitted is not served after it."""
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.credit_exp(self.user.pk, 50)
+            # A reader caching the user before the credit commits
+            user_cache.get_by_line_id('cached_user')
+        
+        with self.assertQueryBudget(1):
+            self.assertEqual(user_cache.get_by_line_id('cached_user').exp, 50)
+    
+    @override_settings(USER_CACHE_TTL=0)
+    def test_identity_map(self):
+        """Test that one identity map loads a user once until the user changes."""
+        with user_cache.identity_map() as identities:
+            with self.assertQueryBudget(1):
+                first = user_cache.get_by_line_id('cached_user')
+                self.assertIs(user_cache.get_by_line_id('cached_user'), first)
+            
+            User.objects.credit_exp(self.user.pk, 30)
+            self.assertEqual(len(identities), 0)
+            self.assertEqual(user_cache.get_by_line_id('cached_user').exp, 30)
+        
+        self.assertEqual(user_cache.counters.get('identity_hits'), 1)
+        self.assertEqual(user_cache.counters.get('misses'), 2)
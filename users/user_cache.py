@@ -0,0 +1,152 @@
+"""
+Cached user lookups by LINE ID.
+
+Every bot event and every ``/api/users/profile/<line_id>/`` request looked
+the same few users up in the database. ``get_by_line_id`` reads through two
+layers instead:
+
+- an identity map, active inside ``identity_map()``. The webhook workers
+  open one per claimed batch, so a batch loads each user at most once
+  however many of their events it holds;
+- the ``USER_CACHE_ALIAS`` cache, keyed by LINE ID, for
+  ``USER_CACHE_TTL`` seconds (0 disables it).
+
+``User.save``/``delete`` and ``UserManager.credit_exp`` call
+``invalidate``, which drops the user from both layers at the write and
+from the cache again once its transaction commits, so a copy cached from
+not-yet-committed data in between is dropped too. Queryset updates that
+go around the model (``recompute_levels``, admin bulk actions) are picked
+up within ``USER_CACHE_TTL``.
+
+Only ``CACHED_FIELDS`` are loaded and cached, never the password hash or
+the permission flags, as ``USER_CACHE_ALIAS`` is often a shared Redis or
+memcached. Other fields are deferred: read from the database if accessed,
+and left out of a ``save``, so a cached copy cannot overwrite them.
+
+Cached users may be slightly stale. Save them with ``update_fields``, and
+credit EXP with ``credit_exp``/``earn_exp``, never by saving a cached
+``level``/``exp``.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router, transaction
+
+from meowtask import metrics
+
+counters = metrics.Counters('identity_hits', 'hits', 'misses', 'invalidations')
+
+_identities = ContextVar('user_identities', default=None)
+
+# What the bot and ``UserSerializer`` read
+CACHED_FIELDS = ('id', 'line_id', 'display_name', 'picture_url', 'level', 'exp', 'completed_tasks')
+
+
+def _cache():
+    return caches[settings.USER_CACHE_ALIAS]
+
+
+def _key(line_id):
+    return f'user:fields:{line_id}'
+
+
+def _from_cache(fields):
+    """A ``User`` with only ``fields`` loaded, the rest deferred."""
+    from .models import User
+
+    names = [field.attname for field in User._meta.concrete_fields if field.attname in fields]
+    return User.from_db(router.db_for_read(User), names, [fields[name] for name in names])
+
+
+class IdentityMap:
+    """Users loaded so far in one batch of work, by LINE ID."""
+
+    def __init__(self):
+        self._users = {}
+
+    def get(self, line_id):
+        return self._users.get(line_id)
+
+    def add(self, user):
+        self._users[user.line_id] = user
+
+    def discard(self, line_id):
+        self._users.pop(line_id, None)
+
+    def __len__(self):
+        return len(self._users)
+
+
+@contextmanager
+def identity_map(identities=None):
+    """
+    Share one identity map between lookups in the block, a new one unless
+    ``identities`` is given.
+    """
+    identities = identities if identities is not None else IdentityMap()
+    token = _identities.set(identities)
+    try:
+        yield identities
+    finally:
+        _identities.reset(token)
+
+
+def get_by_line_id(line_id):
+    """The user with ``line_id``; raises ``User.DoesNotExist`` if there is none."""
+    from .models import User
+
+    identities = _identities.get()
+    if identities is not None:
+        user = identities.get(line_id)
+        if user is not None:
+            counters.incr('identity_hits')
+            return user
+
+    fields = None
+    if settings.USER_CACHE_TTL:
+        fields = _cache().get(_key(line_id))
+    if fields is not None:
+        counters.incr('hits')
+        user = _from_cache(fields)
+    else:
+        counters.incr('misses')
+        user = User.objects.only(*CACHED_FIELDS).get(line_id=line_id)
+        if settings.USER_CACHE_TTL:
+            fields = {name: getattr(user, name) for name in CACHED_FIELDS}
+            _cache().set(_key(line_id), fields, timeout=settings.USER_CACHE_TTL)
+
+    if identities is not None:
+        identities.add(user)
+    return user
+
+
+def remember(user):
+    """Add a user loaded or created some other way to the current identity map."""
+    identities = _identities.get()
+    if identities is not None:
+        identities.add(user)
+
+
+def invalidate(line_id, using='default'):
+    """Forget the cached user with ``line_id``; call after changing the user."""
+    identities = _identities.get()
+    if identities is not None:
+        identities.discard(line_id)
+
+    key = _key(line_id)
+    _cache().delete(key)
+    transaction.on_commit(lambda: _cache().delete(key), using=using)
+    counters.incr('invalidations')
+
+
+def cache_stats():
+    stats = counters.snapshot()
+    lookups = stats['identity_hits'] + stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round((lookups - stats['misses']) / lookups, 3) if lookups else 0.0
+    return stats
+
+
+metrics.register('user_cache', cache_stats)
@@ -1,6 +1,8 @@
+from django.http import Http404
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from . import ranking, rollups, user_cache
 from .models import User
 from .serializers import UserSerializer, UserProfileSerializer
 
@@ -15,32 +17,62 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
 
 
 class UserDetailView(generics.RetrieveAPIView):
-    """Retrieve a user by LINE ID."""
+    """Retrieve a user by LINE ID, read through the user cache."""
     queryset = User.objects.all()
     serializer_class = UserSerializer
     lookup_field = 'line_id'
     permission_classes = [permissions.IsAuthenticated]
+    
+    def get_object(self):
+        try:
+            user = user_cache.get_by_line_id(self.kwargs['line_id'])
+        except User.DoesNotExist:
+            raise Http404
+        self.check_object_permissions(self.request, user)
+        return user
 
 
 class LeaderboardView(APIView):
-    """Get top users by level and experience."""
+    """
+    Get top users by experience.
+    
+    ``?window=all`` (the default) ranks by level and EXP. ``week`` and
+    ``month`` rank by EXP earned in the current week or month, read from
+    the EXP rollups; see ``users.rollups``.
+    """
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        # Get top 10 users sorted by level (descending) and exp (descending)
-        top_users = User.objects.all().order_by('-level', '-exp')[:10]
-        serializer = UserSerializer(top_users, many=True)
+        window = request.query_params.get('window', 'all')
+        if window in rollups.PERIODS:
+            return self.window_board(request, window)
+        if window != 'all':
+            return Response(
+                {"error": "window must be one of week, month, all"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Get requesting user's rank
-        user = request.user
-        user_rank = User.objects.filter(
-            level__gt=user.level
-        ).count() + User.objects.filter(
-            level=user.level, 
-            exp__gt=user.exp
-        ).count() + 1  # +1 because ranks start at 1
+        # Top 10 by level and exp, read in order from user_leaderboard_idx
+        top_users = User.objects.order_by('-level', '-exp', 'id')[:10]
+        serializer = UserSerializer(top_users, many=True)
         
         return Response({
             'leaderboard': serializer.data,
-            'user_rank': user_rank
-        })
\ No newline at end of file
+            'user_rank': ranking.rank(request.user)
+        })
+    
+    def window_board(self, request, window):
+        top = rollups.board(window).select_related('user')[:10]
+        leaderboard = [
+            {**UserSerializer(rollup.user).data, 'exp_earned': rollup.exp}
+            for rollup in top
+        ]
+        
+        exp_earned = rollups.earned(window, request.user)
+        return Response({
+            'window': window,
+            'since': rollups.current_bucket(window),
+            'leaderboard': leaderboard,
+            'user_rank': rollups.rank(window, exp_earned),
+            'user_exp_earned': exp_earned
+        })